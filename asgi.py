@@ -0,0 +1,5 @@
+from jwtAuthenticator import create_app
+from jwtAuthenticator.asgi import AsyncAuthApp
+
+# serve with any ASGI server, e.g. uvicorn asgi:app
+app = AsyncAuthApp(create_app())
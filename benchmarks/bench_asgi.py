@@ -0,0 +1,122 @@
+'''
+Requests per second of one worker process, the WSGI app as uWSGI runs it
+(a fixed number of threads, uwsgi.ini uses 4) against the ASGI app (one
+event loop, every request in flight at once)
+
+    python -m benchmarks.bench_asgi --requests 2000 --concurrency 200
+
+Both are called in process, without a server or sockets in front, so the
+numbers compare the serving models rather than the HTTP stacks. uWSGI
+multiplies the WSGI column by its process count, an ASGI server by its
+worker count.
+'''
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import make_app, print_table
+
+PASSWORD = 'Password123@'
+
+
+def scope_for(method, path, body, cookie=None):
+    headers = [(b'content-type', b'application/json')]
+    if cookie:
+        headers.append((b'cookie', cookie.encode('latin-1')))
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': headers,
+             'client': ('127.0.0.1', 5000), 'server': ('localhost', 80)}
+    return scope, body
+
+
+def wsgi_rate(app, requests, threads):
+    from jwtAuthenticator.asgi import AsyncAuthApp
+
+    def call(request):
+        scope, body = request
+        environ = AsyncAuthApp.environ(scope, body)
+        statuses = []
+        result = app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        b''.join(result)
+        if hasattr(result, 'close'):
+            result.close()
+        return statuses[0]
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        start = time.perf_counter()
+        statuses = list(executor.map(call, requests))
+        elapsed = time.perf_counter() - start
+    return elapsed, [int(status.split(' ', 1)[0]) for status in statuses]
+
+
+def asgi_rate(app, requests, concurrency):
+    from jwtAuthenticator.asgi import AsyncAuthApp
+    asgi = AsyncAuthApp(app)
+
+    async def call(request, gate):
+        scope, body = request
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        async with gate:
+            await asgi(scope, receive, send)
+        return sent[0]['status']
+
+    async def run():
+        gate = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(call(request, gate) for request in requests))
+
+    start = time.perf_counter()
+    statuses = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    return elapsed, statuses
+
+
+def summary(elapsed, statuses):
+    ''' answered requests per second, and the ones refused with a 503 when the hashing pool is full '''
+    return '%.0f' % (statuses.count(200) / elapsed), statuses.count(503)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=200, help='requests in flight on the event loop')
+    parser.add_argument('--threads', type=int, default=4, help='threads of the WSGI worker')
+    parser.add_argument('--rounds', type=int, default=10, help='bcrypt cost')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'bench.sqlite'),
+                       PASSWORD_POOL_ENABLED=True, BCRYPT_LOG_ROUNDS=args.rounds)
+        from jwtAuthenticator.models import db, hashing_pool
+        with app.app_context():
+            db.create_all()
+        client = app.test_client()
+        credentials = json.dumps({'username': 'bench', 'password': PASSWORD})
+        client.post('/register', content_type='application/json', data=credentials)
+        client.post('/login', content_type='application/json', data=credentials)
+        cookie = '; '.join('%s=%s' % (c.name, c.value) for c in client.cookie_jar)
+
+        validate = [scope_for('GET', '/validate_token', b'', cookie)] * args.requests
+        login = [scope_for('POST', '/login', credentials.encode('utf-8'))] * args.logins
+
+        rows = []
+        for name, requests in (('/validate_token', validate), ('/login', login)):
+            wsgi = summary(*wsgi_rate(app, requests, args.threads))
+            asgi = summary(*asgi_rate(app, requests, args.concurrency))
+            rows.append((name,) + wsgi + asgi)
+        hashing_pool.shutdown()
+    print_table(rows, ('endpoint', 'wsgi ok/s', 'wsgi 503', 'asgi ok/s', 'asgi 503'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+'''
+Validations per second of /auth_request against /validate_token, with the
+token cache of the workers on and off
+
+    python -m benchmarks.bench_auth_request --tokens 100 --repeat 10
+
+Every token is validated --repeat times, as nginx would ask for every
+request of a client. With nginx caching the answers (nginx-auth-request.conf)
+only the first request of a token in every AUTH_REQUEST_MAX_AGE seconds
+reaches the app at all; measure that with a load generator against nginx.
+'''
+import os
+import time
+import argparse
+import tempfile
+
+from benchmarks.common import make_app, print_table
+
+
+def run(url, cached, tokens, repeat):
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'bench.sqlite'), TOKEN_CACHE_ENABLED=cached)
+        from flask_jwt_extended import create_access_token
+        from werkzeug.test import EnvironBuilder
+        from jwtAuthenticator.models import db, User
+        from jwtAuthenticator.token_cache import token_cache
+        # the cache reads its settings when it is initialised
+        token_cache.init_app(app)
+        with app.app_context():
+            db.create_all()
+            # the users behind the tokens, the user loader refuses the others
+            db.session.execute(User.__table__.insert(),
+                               [{'username': 'user%06d' % i, 'password_hash': '-'} for i in range(tokens)])
+            db.session.commit()
+            # the requests are built up front, only the app is timed
+            environs = [
+                EnvironBuilder(path=url, headers={'Cookie': 'access_token_cookie=' + token}).get_environ()
+                for token in (create_access_token(identity={'username': 'user%06d' % i}) for i in range(tokens))
+            ]
+            statuses = []
+
+            def start_response(status, headers):
+                statuses.append(status)
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for environ in environs:
+                    b''.join(app(dict(environ), start_response))
+            elapsed = time.perf_counter() - start
+            assert all(status.startswith(('200', '204')) for status in statuses)
+            db.session.remove()
+    return tokens * repeat / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tokens', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=10, help='validations per token')
+    args = parser.parse_args()
+
+    rows = []
+    for url in ('/validate_token', '/auth_request'):
+        for cached in (False, True):
+            rate = run(url, cached, args.tokens, args.repeat)
+            rows.append((url, 'on' if cached else 'off', '%.0f' % rate))
+    print_table(rows, ('path', 'token cache', 'validations/s'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+'''
+Size and per call cost of the access tokens, in the default format (the
+request data as identity) against JWT_COMPACT_CLAIMS (the user id as sub)
+
+    python -m benchmarks.bench_claims
+
+Sizes are of the access and refresh cookie values, which every request to
+the app carries. Encoding includes the signature, decoding the signature
+check and the claim checks of flask_jwt_extended.
+'''
+import os
+import argparse
+import tempfile
+
+from benchmarks.common import make_app, per_call, print_table
+
+MODES = {
+    'default': {'JWT_COMPACT_CLAIMS': False},
+    'compact': {'JWT_COMPACT_CLAIMS': True},
+}
+
+
+def measure(overrides, number):
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'bench.sqlite'), **overrides)
+        from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+        from jwtAuthenticator.views.auth_api import jwt, token_identity
+        # the claim names are picked when the manager is initialised
+        app.config.pop('JWT_IDENTITY_CLAIM')
+        app.config.pop('JWT_USER_CLAIMS')
+        jwt.init_app(app)
+
+        with app.test_request_context():
+            # what a login puts in the tokens
+            identity = token_identity({'username': 'testUsername'}, 12345)
+            access = create_access_token(identity=identity, fresh=True)
+            refresh = create_refresh_token(identity=identity, user_claims={'fam': 'f' * 32})
+            encode = per_call(lambda: create_access_token(identity=identity, fresh=True), number=number)
+            decode = per_call(lambda: decode_token(access), number=number)
+    return len(access), len(refresh), encode, decode
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = []
+    for mode, overrides in MODES.items():
+        access, refresh, encode, decode = measure(overrides, args.number)
+        rows.append((mode, access, refresh, '%.1f' % encode, '%.1f' % decode))
+    print_table(rows, ('format', 'access bytes', 'refresh bytes', 'encode us', 'decode us'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+'''
+Mixed /register and /login load from several processes on one sqlite file,
+with the flask_sqlalchemy engine defaults against the tuned engine (WAL,
+busy timeout and a per worker pool)
+
+    python -m benchmarks.bench_concurrency --processes 5 --seconds 5
+
+Every process plays one uWSGI worker with its own app and engine.
+'''
+import os
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+from benchmarks.common import make_app, print_table, latency_summary
+
+MODES = {
+    'default': {'DATABASE_POOL_SIZE': 0, 'SQLITE_PRAGMAS': {}},
+    'tuned': {},
+}
+SEED_USERS = 50
+PASSWORD = 'Password123@'
+
+
+def worker(path, overrides, number, seconds, register_share, results):
+    from sqlalchemy.exc import OperationalError
+
+    app = make_app(path, BCRYPT_LOG_ROUNDS=4, **overrides)
+    client = app.test_client()
+    counts = {'ok': 0, 'locked': 0, 'failed': 0}
+    latencies = []
+    with app.app_context():
+        deadline = time.perf_counter() + seconds
+        i = 0
+        while time.perf_counter() < deadline:
+            i += 1
+            if i % 100 < register_share * 100:
+                url, username = '/register', 'w%02du%07d' % (number, i)
+            else:
+                url, username = '/login', 'seed%04d' % (i % SEED_USERS)
+            body = json.dumps({'username': username, 'password': PASSWORD})
+            start = time.perf_counter()
+            try:
+                response = client.post(url, content_type='application/json', data=body)
+                counts['ok' if response.status_code < 300 else 'failed'] += 1
+            except OperationalError:
+                from jwtAuthenticator.models import db
+                db.session.rollback()
+                counts['locked'] += 1
+            latencies.append(time.perf_counter() - start)
+    results.put((counts, latencies))
+
+
+def run(mode, processes, seconds, register_share):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.sqlite')
+        app = make_app(path, BCRYPT_LOG_ROUNDS=4, **MODES[mode])
+        from jwtAuthenticator.models import db
+        with app.app_context():
+            db.create_all()
+            client = app.test_client()
+            for i in range(SEED_USERS):
+                client.post('/register', content_type='application/json',
+                            data=json.dumps({'username': 'seed%04d' % i, 'password': PASSWORD}))
+            db.session.remove()
+            # the workers must not inherit the parent's connections
+            db.get_engine(app).dispose()
+
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=worker, args=(path, MODES[mode], n, seconds, register_share, results))
+            for n in range(processes)
+        ]
+        for process in workers:
+            process.start()
+        totals = {'ok': 0, 'locked': 0, 'failed': 0}
+        latencies = []
+        for _ in workers:
+            counts, samples = results.get()
+            for key in totals:
+                totals[key] += counts[key]
+            latencies.extend(samples)
+        for process in workers:
+            process.join()
+    return totals, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--processes', type=int, default=5)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--register-share', type=float, default=0.3,
+                        help='fraction of the requests that are registrations')
+    args = parser.parse_args()
+
+    rows = []
+    for mode in MODES:
+        totals, latencies = run(mode, args.processes, args.seconds, args.register_share)
+        rows.append((mode, '%.0f' % (totals['ok'] / args.seconds), totals['locked'], totals['failed'])
+                    + latency_summary(latencies))
+    print_table(rows, ('engine', 'ok/s', 'locked', 'failed', 'mean us', 'p50 us', 'p99 us'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''
+Cost profiles of the password hashers: time per hash, memory per hash and
+the logins per second the hashing pool sustains with one process per cpu
+
+    python -m benchmarks.bench_hashers --verifies 64
+
+Pick the profile with the best throughput that still meets the security
+bar, then set PASSWORD_HASHER and its cost settings. Argon2id rows need
+argon2-cffi and are skipped without it.
+'''
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.common import print_table
+from jwtAuthenticator.hashers import BcryptHasher, ScryptHasher, Argon2idHasher, argon2
+from jwtAuthenticator.hashing import check_hash
+
+PASSWORD = 'Password123@'
+
+# (label, hasher factory, memory per hash in bytes)
+PROFILES = [
+    ('bcrypt cost 10', lambda: BcryptHasher(10), 4 * 1024),
+    ('bcrypt cost 12', lambda: BcryptHasher(12), 4 * 1024),
+    ('scrypt ln=14 r=8 p=1', lambda: ScryptHasher(14, 8, 1), 128 * 8 * 2 ** 14),
+    ('scrypt ln=15 r=8 p=1', lambda: ScryptHasher(15, 8, 1), 128 * 8 * 2 ** 15),
+    ('argon2id t=2 m=19MiB', lambda: Argon2idHasher(2, 19456, 1), 19456 * 1024),
+    ('argon2id t=3 m=64MiB', lambda: Argon2idHasher(3, 65536, 1), 65536 * 1024),
+]
+
+
+def measure(factory, verifies, workers):
+    hasher = factory()
+    pw_hash = hasher.hash(PASSWORD)
+
+    samples = []
+    for _ in range(3):
+        start = time.perf_counter()
+        check_hash(pw_hash, PASSWORD)
+        samples.append(time.perf_counter() - start)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # warm the processes up before timing
+        list(executor.map(check_hash, [pw_hash] * workers, [PASSWORD] * workers))
+        start = time.perf_counter()
+        list(executor.map(check_hash, [pw_hash] * verifies, [PASSWORD] * verifies))
+        elapsed = time.perf_counter() - start
+    return min(samples), verifies / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--verifies', type=int, default=64, help='password checks per profile')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='pool processes')
+    args = parser.parse_args()
+
+    rows = []
+    for label, factory, memory in PROFILES:
+        if label.startswith('argon2id') and argon2 is None:
+            continue
+        latency, throughput = measure(factory, args.verifies, args.workers)
+        rows.append((label, '%.1f' % (latency * 1000), '%d' % (memory // 1024), '%.1f' % throughput))
+    print_table(rows, ('profile', 'ms/hash', 'KiB/hash', 'logins/s'))
+
+
+if __name__ == '__main__':
+    main()
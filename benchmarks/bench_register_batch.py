@@ -0,0 +1,58 @@
+'''
+Registrations per second, one /register call per user against /register/batch
+
+    python -m benchmarks.bench_register_batch --users 200 --rounds 10
+
+Both paths run against a fresh sqlite file with the hashing pool enabled.
+'''
+import os
+import json
+import time
+import argparse
+import tempfile
+
+from benchmarks.common import make_app, print_table
+
+
+def run(path, users, rounds, batch_size):
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'bench.sqlite'),
+                       PASSWORD_POOL_ENABLED=True, BCRYPT_LOG_ROUNDS=rounds)
+        from jwtAuthenticator.models import db, hashing_pool
+        with app.app_context():
+            db.create_all()
+            client = app.test_client()
+            payload = [{'username': 'user%06d' % i, 'password': 'Password123@'} for i in range(users)]
+
+            start = time.perf_counter()
+            if path == 'single':
+                for user in payload:
+                    client.post('/register', content_type='application/json', data=json.dumps(user))
+            else:
+                for i in range(0, users, batch_size):
+                    client.post('/register/batch', content_type='application/json',
+                                data=json.dumps(payload[i:i + batch_size]))
+            elapsed = time.perf_counter() - start
+
+            db.session.remove()
+            hashing_pool.shutdown()
+    return users / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=10, help='bcrypt cost')
+    parser.add_argument('--batch-size', type=int, default=50)
+    args = parser.parse_args()
+
+    single = run('single', args.users, args.rounds, args.batch_size)
+    batch = run('batch', args.users, args.rounds, args.batch_size)
+    print_table([
+        ('/register', '%.1f' % single, '1.0x'),
+        ('/register/batch', '%.1f' % batch, '%.1fx' % (batch / single)),
+    ], ('path', 'registrations/s', 'speedup'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+'''
+Per call cost of building the json responses of the views
+
+    python -m benchmarks.bench_responses
+
+compares jsonify with the json provider (orjson when it is installed) for
+a fixed answer, a validation answer and a page of users, and the prebuilt
+bodies of the fixed answers. Whole requests to a forbidden GET are timed
+too, since those are what a flood of bad requests costs.
+'''
+import os
+import argparse
+import tempfile
+
+from flask import jsonify
+
+from benchmarks.common import make_app, per_call, print_table
+from jwtAuthenticator.responses import json_provider, json_response, constant_response
+
+PAYLOADS = {
+    'forbidden': {'ok': False, 'message': 'forbidden'},
+    'validation': {'ok': True, 'is_valid': True, 'user': {'username': 'testUsername'}},
+    'users page': {'ok': True, 'data': [{'id': i, 'username': 'user%06d' % i} for i in range(100)], 'next': 'abc'},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'bench.sqlite'))
+        rows = []
+        with app.test_request_context():
+            baseline = {}
+            for name, data in PAYLOADS.items():
+                baseline[name] = per_call(lambda: jsonify(data), number=args.number)
+                after = per_call(lambda: json_response(data), number=args.number)
+                rows.append((name, 'jsonify', '%.2f' % baseline[name], '1.0x'))
+                rows.append((name, json_provider.name, '%.2f' % after, '%.1fx' % (baseline[name] / after)))
+            after = per_call(lambda: constant_response('forbidden'), number=args.number)
+            rows.append(('forbidden', 'prebuilt', '%.2f' % after, '%.1fx' % (baseline['forbidden'] / after)))
+
+        client = app.test_client()
+        request = per_call(lambda: client.get('/register'), number=args.number // 10)
+        rows.append(('GET /register', 'whole request', '%.2f' % request, ''))
+    print_table(rows, ('response', 'built with', 'us/call', 'speedup'))
+
+
+if __name__ == '__main__':
+    main()
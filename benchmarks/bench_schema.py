@@ -0,0 +1,48 @@
+'''
+Per call cost of the user schema validation
+
+    python -m benchmarks.bench_schema
+
+compares jsonschema.validate, which checks the schema and builds a new
+validator on every call, with the compiled registry used by validate_user.
+'''
+import argparse
+
+from jsonschema import validate
+from jsonschema.exceptions import ValidationError
+
+from benchmarks.common import per_call, print_table
+from jwtAuthenticator.schemas.schema_user import user_schema, validate_user
+
+PAYLOADS = {
+    'valid': {'username': 'testUsername', 'password': 'testPassword123@'},
+    'bad password': {'username': 'testUsername', 'password': 'password'},
+    'bad username': {'username': 'no spaces allowed', 'password': 'testPassword123@'},
+    'not an object': ['testUsername', 'testPassword123@'],
+}
+
+
+def uncompiled(data):
+    ''' the validation as it was before the registry '''
+    try:
+        validate(data, user_schema)
+    except ValidationError:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = []
+    for name, data in PAYLOADS.items():
+        before = per_call(lambda: uncompiled(data), number=args.number)
+        after = per_call(lambda: validate_user(data), number=args.number)
+        rows.append((name, '%.1f' % before, '%.1f' % after, '%.1fx' % (before / after)))
+    print_table(rows, ('payload', 'validate() us', 'registry us', 'speedup'))
+
+
+if __name__ == '__main__':
+    main()
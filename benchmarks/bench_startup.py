@@ -0,0 +1,113 @@
+'''
+Time from a new worker to its first response: a cold worker that imports
+and builds the app itself, with and without the migration command loaded,
+against a worker forked from a master that preloaded the app
+
+    python -m benchmarks.bench_startup --workers 5
+
+The private KiB column is the memory a worker does not share with anything
+else after its first request, read from /proc (linux only).
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.common import print_table, percentile
+
+# the child of a cold start, prints its phase timings as json
+COLD = '''
+import json, time
+start = time.perf_counter()
+from jwtAuthenticator import create_app
+imported = time.perf_counter()
+app = create_app('testing')
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + %(path)r
+created = time.perf_counter()
+app.test_client().get('/.well-known/jwks.json')
+done = time.perf_counter()
+from benchmarks.bench_startup import private_kib
+print(json.dumps([imported - start, created - imported, done - created, private_kib()]))
+'''
+
+
+def private_kib():
+    ''' private memory of this process, or None off linux '''
+    try:
+        with open('/proc/self/smaps_rollup') as handle:
+            lines = handle.read().splitlines()
+    except OSError:
+        return None
+    return sum(int(line.split()[1]) for line in lines if line.startswith(('Private_Clean', 'Private_Dirty')))
+
+
+def cold(path, cli):
+    env = dict(os.environ)
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    if cli:
+        env['FLASK_RUN_FROM_CLI'] = 'true'
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', COLD % {'path': path}], env=env,
+                            check=True, capture_output=True, text=True).stdout
+    total = time.perf_counter() - start
+    return [total] + json.loads(output.splitlines()[-1])
+
+
+def forked(app, after_fork):
+    read_end, write_end = os.pipe()
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        after_fork(app)
+        app.test_client().get('/.well-known/jwks.json')
+        os.write(write_end, json.dumps([time.perf_counter() - start, private_kib()]).encode())
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as handle:
+        total, memory = json.loads(handle.read())
+    os.waitpid(pid, 0)
+    return [total, 0.0, 0.0, total, memory]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=5, help='workers started per mode')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.sqlite')
+        results = {
+            'cold, with flask db': [cold(path, True) for _ in range(args.workers)],
+            'cold': [cold(path, False) for _ in range(args.workers)],
+        }
+
+        import gc
+        from jwtAuthenticator import create_app, after_fork
+        app = create_app('testing')
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+        # the master answers nothing, but has everything imported and built
+        with app.app_context():
+            app.test_client().get('/.well-known/jwks.json')
+        gc.freeze()
+        results['forked from preloaded master'] = [forked(app, after_fork) for _ in range(args.workers)]
+
+    rows = []
+    for mode, samples in results.items():
+        column = list(zip(*samples))
+        memory = [value for value in column[4] if value is not None]
+        rows.append((
+            mode,
+            '%.1f' % (percentile(column[1], 0.5) * 1000),
+            '%.1f' % (percentile(column[2], 0.5) * 1000),
+            '%.1f' % (percentile(column[0], 0.5) * 1000),
+            '%d' % percentile(memory, 0.5) if memory else '-',
+        ))
+    print_table(rows, ('mode', 'import ms', 'create_app ms', 'first response ms', 'private KiB'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''
+Token validations per second, one /validate_token call per token against
+/validate_token/batch
+
+    python -m benchmarks.bench_validate_batch --tokens 500 --batch-size 50
+
+Every path runs twice: with an empty token cache, and again with every
+token already cached.
+'''
+import os
+import json
+import time
+import argparse
+import tempfile
+
+from benchmarks.common import make_app, print_table
+
+
+def run(path, tokens, batch_size):
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'bench.sqlite'))
+        from flask_jwt_extended import create_access_token
+        from jwtAuthenticator.models import db, User
+        from jwtAuthenticator.token_cache import token_cache
+        with app.app_context():
+            db.create_all()
+            # the users behind the tokens, the user loader refuses the others
+            db.session.execute(User.__table__.insert(),
+                               [{'username': 'user%06d' % i, 'password_hash': '-'} for i in range(tokens)])
+            db.session.commit()
+            client = app.test_client()
+            encoded = [create_access_token(identity={'username': 'user%06d' % i}) for i in range(tokens)]
+
+            rates = []
+            for _ in ('cold', 'cached'):
+                start = time.perf_counter()
+                if path == 'single':
+                    for token in encoded:
+                        client.set_cookie('localhost', 'access_token_cookie', token)
+                        assert client.get('/validate_token').status_code == 200
+                else:
+                    for i in range(0, tokens, batch_size):
+                        client.post('/validate_token/batch', content_type='application/json',
+                                    data=json.dumps(encoded[i:i + batch_size]))
+                rates.append(tokens / (time.perf_counter() - start))
+            token_cache.clear()
+            db.session.remove()
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tokens', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=50)
+    args = parser.parse_args()
+
+    single = run('single', args.tokens, args.batch_size)
+    batch = run('batch', args.tokens, args.batch_size)
+    rows = []
+    for index, cache in enumerate(('cold', 'cached')):
+        rows.append(('/validate_token', cache, '%.0f' % single[index], '1.0x'))
+        rows.append(('/validate_token/batch', cache, '%.0f' % batch[index],
+                     '%.1fx' % (batch[index] / single[index])))
+    print_table(rows, ('path', 'cache', 'tokens/s', 'speedup'))
+
+
+if __name__ == '__main__':
+    main()
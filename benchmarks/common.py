@@ -0,0 +1,46 @@
+import timeit
+
+
+def per_call(fn, number=10000, repeat=5):
+    ''' best per call time of fn in microseconds '''
+    timer = timeit.Timer(fn)
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def print_table(rows, headers):
+    ''' print rows of values as an aligned table '''
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    for row in [headers] + list(rows):
+        print('  '.join(str(value).ljust(width) for value, width in zip(row, widths)))
+
+
+def make_app(database_path, **overrides):
+    '''
+    A testing app on its own sqlite file, with config overrides applied
+    before anything reads them
+    '''
+    from jwtAuthenticator import create_app
+    from jwtAuthenticator.models import hashing_pool
+
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + database_path
+    app.config.update(overrides)
+    # the pool reads its settings when it is initialised
+    hashing_pool.init_app(app)
+    return app
+
+
+def percentile(samples, fraction):
+    ''' the value below which the given fraction of the samples fall '''
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def latency_summary(samples):
+    ''' mean, p50 and p99 of a list of seconds, in microseconds '''
+    return (
+        '%.0f' % (sum(samples) / len(samples) * 1e6),
+        '%.0f' % (percentile(samples, 0.50) * 1e6),
+        '%.0f' % (percentile(samples, 0.99) * 1e6),
+    )
@@ -0,0 +1,286 @@
+'''
+Latency percentiles, throughput and a per phase breakdown of every auth
+route, saved as json so runs can be compared
+
+    python -m benchmarks.suite run --users 10000 --concurrency 4 --requests 500 --out before.json
+    python -m benchmarks.suite run ... --out after.json
+    python -m benchmarks.suite compare before.json after.json
+
+Each of --concurrency threads drives the app through its own test client.
+The phases are timed by wrapping the hashing pool (bcrypt), the schema
+registry (validation), the engine cursor events (database) and PyJWT
+(encode and decode), and are reported as mean milliseconds per request.
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import make_app, percentile, print_table
+
+PASSWORD = 'Password123@'
+ENDPOINTS = ['/register', '/login', '/fresh_login', '/refresh', '/validate_token', '/validate_fresh_token', '/users']
+PHASES = ['bcrypt', 'schema', 'db', 'jwt_encode', 'jwt_decode']
+
+
+class PhaseTimer:
+    ''' time spent in each phase, summed per endpoint from every thread '''
+
+    def __init__(self):
+        self.totals = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._restore = []
+
+    def begin(self, endpoint):
+        self._local.endpoint = endpoint
+
+    def add(self, phase, seconds):
+        endpoint = getattr(self._local, 'endpoint', None)
+        if endpoint is None:
+            return
+        with self._lock:
+            phases = self.totals.setdefault(endpoint, dict.fromkeys(PHASES, 0.0))
+            phases[phase] += seconds
+
+    def wrap(self, owner, name, phase):
+        original = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add(phase, time.perf_counter() - start)
+
+        setattr(owner, name, timed)
+        self._restore.append((owner, name, original))
+
+    def install(self, app):
+        import jwt
+        from sqlalchemy import event
+        from jwtAuthenticator.models import db, hashing_pool
+        from jwtAuthenticator.schemas.registry import registry
+
+        for name in ('generate', 'generate_many', 'check'):
+            self.wrap(hashing_pool, name, 'bcrypt')
+        self.wrap(registry, 'first_error', 'schema')
+        self.wrap(jwt, 'encode', 'jwt_encode')
+        self.wrap(jwt, 'decode', 'jwt_decode')
+
+        with app.app_context():
+            engine = db.engine
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('bench_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after(conn, cursor, statement, parameters, context, executemany):
+            self.add('db', time.perf_counter() - conn.info['bench_start'].pop())
+
+    def uninstall(self):
+        for owner, name, original in reversed(self._restore):
+            setattr(owner, name, original)
+        self._restore = []
+
+
+def seed_users(app, count, rounds):
+    ''' count users sharing one password hash, inserted in bulk '''
+    from jwtAuthenticator.hashers import BcryptHasher
+    from jwtAuthenticator.models import db, User
+
+    pw_hash = BcryptHasher(rounds).hash(PASSWORD)
+    with app.app_context():
+        db.create_all()
+        for start in range(0, count, 10000):
+            db.session.execute(User.__table__.insert(), [
+                {'username': 'user%08d' % i, 'password_hash': pw_hash}
+                for i in range(start, min(count, start + 10000))
+            ])
+        db.session.commit()
+
+
+def cookie(client, name):
+    for item in client.cookie_jar:
+        if item.name == name:
+            return item.value
+
+
+class Driver:
+    ''' one thread's client, logged in as its own user '''
+
+    def __init__(self, app, number, users):
+        self.client = app.test_client(use_cookies=True)
+        self.number = number
+        self.users = users
+        self.counter = 0
+        self.login()
+
+    def credentials(self):
+        self.counter += 1
+        username = 'user%08d' % ((self.number * 7919 + self.counter) % self.users)
+        return json.dumps({'username': username, 'password': PASSWORD})
+
+    def login(self):
+        response = self.client.post('/login', content_type='application/json', data=self.credentials())
+        assert response.status_code == 200, response.data
+
+    def request(self, endpoint):
+        if endpoint == '/register':
+            self.counter += 1
+            data = json.dumps({'username': 'new%03d_%07d' % (self.number, self.counter), 'password': PASSWORD})
+            return self.client.post(endpoint, content_type='application/json', data=data)
+        if endpoint in ('/login', '/fresh_login'):
+            return self.client.post(endpoint, content_type='application/json', data=self.credentials())
+        if endpoint == '/refresh':
+            # every refresh rotates the token, so send the newest csrf value
+            return self.client.post(endpoint, headers={'X-CSRF-TOKEN': cookie(self.client, 'csrf_refresh_token')})
+        # /validate_token, /validate_fresh_token and /users
+        return self.client.get(endpoint)
+
+
+def run_endpoint(app, drivers, endpoint, requests, timer):
+    def work(driver):
+        timer.begin(endpoint)
+        samples = []
+        failures = 0
+        for _ in range(requests // len(drivers)):
+            start = time.perf_counter()
+            response = driver.request(endpoint)
+            samples.append(time.perf_counter() - start)
+            failures += response.status_code >= 300
+        timer.begin(None)
+        return samples, failures
+
+    # start each route from a fresh login, the refresh runs make tokens stale
+    for driver in drivers:
+        driver.login()
+    timer.totals.pop(endpoint, None)
+    with ThreadPoolExecutor(max_workers=len(drivers)) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(work, drivers))
+        elapsed = time.perf_counter() - start
+
+    samples = [sample for result, _ in results for sample in result]
+    phases = timer.totals.get(endpoint, dict.fromkeys(PHASES, 0.0))
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        'requests': len(samples),
+        'failures': sum(failures for _, failures in results),
+        'throughput': round(len(samples) / elapsed, 1),
+        'mean_ms': ms(sum(samples) / len(samples)),
+        'p50_ms': ms(percentile(samples, 0.50)),
+        'p90_ms': ms(percentile(samples, 0.90)),
+        'p99_ms': ms(percentile(samples, 0.99)),
+        'max_ms': ms(max(samples)),
+        'phases_ms': {phase: ms(seconds / len(samples)) for phase, seconds in phases.items()},
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    endpoints = args.endpoints or ENDPOINTS
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'bench.sqlite'), BCRYPT_LOG_ROUNDS=args.rounds)
+        seed_users(app, args.users, args.rounds)
+        timer = PhaseTimer()
+        timer.install(app)
+        try:
+            drivers = [Driver(app, number, args.users) for number in range(args.concurrency)]
+            results = {endpoint: run_endpoint(app, drivers, endpoint, args.requests, timer)
+                       for endpoint in endpoints}
+        finally:
+            timer.uninstall()
+
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'users': args.users,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'rounds': args.rounds,
+        },
+        'endpoints': results,
+    }
+    print_table([
+        (endpoint, result['throughput'], result['p50_ms'], result['p90_ms'], result['p99_ms'], result['failures'])
+        + tuple(result['phases_ms'][phase] for phase in PHASES)
+        for endpoint, result in results.items()
+    ], ('endpoint', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'failed') + tuple(phase + ' ms' for phase in PHASES))
+    if args.out:
+        with open(args.out, 'w') as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+        print('results written to %s' % args.out)
+
+
+def compare(args):
+    with open(args.before) as handle:
+        before = json.load(handle)
+    with open(args.after) as handle:
+        after = json.load(handle)
+
+    def change(old, new):
+        return '%+.1f%%' % ((new - old) / old * 100) if old else 'n/a'
+
+    rows = []
+    for endpoint, new in after['endpoints'].items():
+        old = before['endpoints'].get(endpoint)
+        if old is None:
+            continue
+        rows.append((
+            endpoint,
+            old['throughput'], new['throughput'], change(old['throughput'], new['throughput']),
+            old['p50_ms'], new['p50_ms'], change(old['p50_ms'], new['p50_ms']),
+            old['p99_ms'], new['p99_ms'], change(old['p99_ms'], new['p99_ms']),
+        ))
+    print('%s (%s) -> %s (%s)' % (args.before, before['meta'].get('revision'),
+                                  args.after, after['meta'].get('revision')))
+    print_table(rows, ('endpoint', 'req/s', 'req/s', 'change', 'p50 ms', 'p50 ms', 'change',
+                       'p99 ms', 'p99 ms', 'change'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+
+    run_parser = commands.add_parser('run', help='benchmark the routes')
+    run_parser.add_argument('--users', type=int, default=10000, help='rows in the users table')
+    run_parser.add_argument('--concurrency', type=int, default=4, help='client threads')
+    run_parser.add_argument('--requests', type=int, default=400, help='requests per route')
+    run_parser.add_argument('--rounds', type=int, default=10, help='bcrypt cost')
+    run_parser.add_argument('--endpoints', nargs='*', choices=ENDPOINTS, help='routes to run, all by default')
+    run_parser.add_argument('--out', help='write the results to this json file')
+
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'compare':
+        compare(args)
+    else:
+        parser.print_help()
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,22 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URI')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # connection pool of every worker, for server databases and sqlite files
+    # alike, 0 keeps the flask_sqlalchemy defaults
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+    DATABASE_MAX_OVERFLOW = 10
+    DATABASE_POOL_TIMEOUT = 10
+    DATABASE_POOL_RECYCLE = 1800
+    DATABASE_POOL_PRE_PING = True
+    # run on every new sqlite connection: WAL lets reads go on during a
+    # write, and writers wait up to busy_timeout ms instead of failing
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 268435456,
+        'cache_size': -16000,
+    }
     JWT_SECRET = os.environ.get('JWT_SECRET_KEY')
     JWT_ACCESS_TOKEN_EXPIRES = datetime.timedelta(days=1)
     JWT_TOKEN_LOCATION = ['cookies']
@@ -19,6 +35,114 @@ class Config:
     JWT_COOKIE_CSRF_PROTECT = True
     JWT_COOKIE_SECURE = False
     JWT_ACCESS_CSRF_COOKIE_PATH = '/'
+    # check every token against the revoked_tokens denylist
+    JWT_BLACKLIST_ENABLED = True
+    JWT_BLACKLIST_TOKEN_CHECKS = ['access', 'refresh']
+    DENYLIST_SYNC_SECONDS = 5
+    DENYLIST_SWEEP_SECONDS = 300
+    DENYLIST_CAPACITY = 100000
+    # refresh tokens are single use, expired ones are swept this often
+    REFRESH_SWEEP_SECONDS = 300
+    # HS256 signs with the shared secret, RS256/ES256/EdDSA sign with the
+    # private key and publish the public key at /.well-known/jwks.json
+    JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
+    JWT_PRIVATE_KEY = os.environ.get('JWT_PRIVATE_KEY')
+    JWT_PRIVATE_KEY_FILE = os.environ.get('JWT_PRIVATE_KEY_FILE')
+    JWT_PUBLIC_KEY = os.environ.get('JWT_PUBLIC_KEY')
+    JWT_PUBLIC_KEY_FILE = os.environ.get('JWT_PUBLIC_KEY_FILE')
+    JWKS_MAX_AGE = 3600
+    # several signing keys with kid headers and scheduled rotation, see KeyRing
+    JWT_KEYRING = None
+    JWT_KEYRING_FILE = os.environ.get('JWT_KEYRING_FILE')
+    # /users page size, and the largest page a client may ask for
+    USERS_PAGE_SIZE = 100
+    USERS_PAGE_MAX = 1000
+    # rows read per query when streaming /users as ndjson
+    USERS_EXPORT_BATCH_SIZE = 1000
+    # most users accepted by one /register/batch request: at the default
+    # 250ms bcrypt cost 50 users are about 12 CPU seconds, well inside the
+    # 60s uwsgi_read_timeout of nginx even with a single hashing process
+    REGISTER_BATCH_MAX = 50
+    # most tokens checked by one /validate_token/batch request
+    VALIDATE_BATCH_MAX = 500
+    # compact tokens: the user id as sub and only the claims that carry
+    # information, see claims.py. Tokens of the other format stop working
+    # when this is switched.
+    JWT_COMPACT_CLAIMS = False
+    # json library of the responses: auto (orjson when installed), orjson or json
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'auto')
+    # longest an /auth_request answer may be cached by nginx, in seconds,
+    # which is also how long a revoked token can still get through
+    AUTH_REQUEST_MAX_AGE = 30
+    # bloom filter of taken usernames, so duplicates are rejected before bcrypt,
+    # updated with the names registered by the other workers this often
+    USERNAME_FILTER_CAPACITY = 1000000
+    USERNAME_FILTER_ERROR_RATE = 0.01
+    USERNAME_FILTER_SYNC_SECONDS = 5
+    # login attempts per second and burst, per client IP and per username,
+    # shared by all the workers through a memory mapped file
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMIT_FILE = os.environ.get('RATE_LIMIT_FILE')
+    RATE_LIMIT_IP_RATE = 1.0
+    RATE_LIMIT_IP_BURST = 20
+    RATE_LIMIT_USER_RATE = 0.2
+    RATE_LIMIT_USER_BURST = 5
+    # request latency, phase timers and outcome counters served on /metrics,
+    # every worker writes its numbers to METRICS_DIR to be added up there
+    METRICS_ENABLED = True
+    METRICS_DIR = os.environ.get('METRICS_DIR') or os.path.join(basedir, 'instance', 'metrics')
+    METRICS_FLUSH_SECONDS = 1
+    # algorithm of new password hashes: bcrypt, scrypt or argon2id (needs
+    # argon2-cffi), hashes of any of them are verified and users move to
+    # the preferred one when they log in
+    PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'bcrypt')
+    # scrypt uses 128 * r * 2**SCRYPT_LOG_N bytes per hash
+    SCRYPT_LOG_N = 14
+    SCRYPT_R = 8
+    SCRYPT_P = 1
+    ARGON2_TIME_COST = 3
+    ARGON2_MEMORY_KIB = 65536
+    ARGON2_PARALLELISM = 1
+    # bcrypt cost, fixed from the environment or calibrated once to the
+    # highest cost that hashes within BCRYPT_TARGET_MS on this machine and
+    # kept in BCRYPT_ROUNDS_FILE for every later process, until the file is
+    # BCRYPT_RECALIBRATE_DAYS old or was written on another host; hashes of a
+    # lower cost are upgraded on the next successful login
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 0)) or None
+    BCRYPT_ROUNDS_FILE = os.environ.get('BCRYPT_ROUNDS_FILE') or os.path.join(basedir, 'instance', 'bcrypt_rounds')
+    BCRYPT_TARGET_MS = int(os.environ.get('BCRYPT_TARGET_MS', 250))
+    BCRYPT_RECALIBRATE_DAYS = float(os.environ.get('BCRYPT_RECALIBRATE_DAYS', 30))
+    BCRYPT_MIN_ROUNDS = 10
+    BCRYPT_MAX_ROUNDS = 16
+    # server processes sharing the cores of the host, read from uWSGI when
+    # it runs the app; set WEB_CONCURRENCY for gunicorn or uvicorn workers
+    SERVER_PROCESSES = int(os.environ.get('WEB_CONCURRENCY', 0)) or None
+    # run bcrypt in a process pool, answer 503 when it is saturated. Every
+    # server process runs cores // SERVER_PROCESSES hashes at a time unless
+    # PASSWORD_POOL_WORKERS says otherwise, and queues at most
+    # PASSWORD_POOL_QUEUE_SIZE more (twice its workers by default)
+    PASSWORD_POOL_ENABLED = True
+    PASSWORD_POOL_WORKERS = int(os.environ.get('PASSWORD_POOL_WORKERS', 0)) or None
+    PASSWORD_POOL_QUEUE_SIZE = int(os.environ['PASSWORD_POOL_QUEUE_SIZE']) if 'PASSWORD_POOL_QUEUE_SIZE' in os.environ else None
+    # the hashing processes start from a forkserver, which runs the python
+    # interpreter at PASSWORD_POOL_PYTHON when sys.executable is not one
+    PASSWORD_POOL_START_METHOD = 'forkserver'
+    PASSWORD_POOL_PYTHON = os.environ.get('PASSWORD_POOL_PYTHON')
+    PASSWORD_POOL_MAX_WAIT = float(os.environ.get('PASSWORD_POOL_MAX_WAIT', 0.5))
+    PASSWORD_POOL_RETRY_AFTER = 1
+    # remember successful password checks for a few seconds (opt-in)
+    CREDENTIAL_CACHE_ENABLED = os.environ.get('CREDENTIAL_CACHE_ENABLED') == '1'
+    CREDENTIAL_CACHE_TTL = 30
+    CREDENTIAL_CACHE_SIZE = 1024
+    CREDENTIAL_CACHE_PEPPER = os.environ.get('CREDENTIAL_CACHE_PEPPER')
+    # answer repeat /validate_token calls from a per worker cache of verified tokens
+    TOKEN_CACHE_ENABLED = True
+    TOKEN_CACHE_SIZE = 4096
+    # per worker cache of the users behind the tokens, see user_cache.py; a
+    # user deleted by another worker is still let in for up to the ttl
+    USER_CACHE_ENABLED = True
+    USER_CACHE_SIZE = 4096
+    USER_CACHE_TTL = 30
 
     @staticmethod
     def init_app(app):
@@ -36,6 +160,13 @@ class TestingConfig(Config):
     SECRET_KEY = "test"
     JWT_SECRET = "jwt-test"
     TESTING = True
+    PASSWORD_POOL_ENABLED = False
+    # cheap hashes, the cost does not matter to the tests
+    BCRYPT_LOG_ROUNDS = 4
+    BCRYPT_ROUNDS_FILE = None
+    RATE_LIMIT_ENABLED = False
+    # report the answering process only, nothing is written
+    METRICS_DIR = None
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URI') or 'sqlite:///' + os.path.join(basedir, 'data-test.sqlite')
 
 class ProductinConfig(Config):
@@ -1,73 +1,79 @@
 import os
-import datetime
-import click
 
 from flask import Flask
-from flask_jwt_extended import JWTManager
-from flask_migrate import Migrate
 from config import config
 
 def create_app(config_name='default'):
     # create and configure the app
     app = Flask(__name__, instance_relative_config=True)
-    app.config.from_mapping(
-        SECRET_KEY ="dev",
-        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(app.instance_path, 'database.sqlite'),
-        SQLALCHEMY_TRACK_MODIFICATIONS = False,
-        JWT_SECRET = "dev",
-        JWT_ACCESS_TOKEN_EXPIRES = datetime.timedelta(days=1),
-        JWT_TOKEN_LOCATION = ['cookies'],
-        JWT_ACCESS_COOKIE_PATH = '/',
-        JWT_REFRESH_COOKIE_PATH = '/refresh',
-        JWT_COOKIE_CSRF_PROTECT = True,
-        JWT_COOKIE_SECURE = False
-    )
-
-    #load the instance config if it exists when not testing
-    #app.config.from_pyfile('config.py', silent=True)
-
-    #app.config.from_mapping(
-    #    SECRET_KEY ="dev",
-    #    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(app.instance_path, 'database.sqlite'),
-    #    SQLALCHEMY_TRACK_MODIFICATIONS = False,
-    #    JWT_SECRET = "dev",
-    #    JWT_ACCESS_TOKEN_EXPIRES = datetime.timedelta(days=1)
-    #)
-
-    #load the instance config if it exists when not testing
-    #app.config.from_pyfile('config.py', silent=True)
+    # every setting, the defaults included, lives in config.py
     app.config.from_object(config[config_name])
 
     # ensure the instance folder exists
-    try:
-        os.makedirs(app.instance_path)
-    except OSError:
-        pass
+    os.makedirs(app.instance_path, exist_ok=True)
+
+    # first, the other extensions report to it
+    from .metrics import metrics
+    metrics.init_app(app)
+
+    # the json library of the responses, and the prebuilt fixed answers
+    from .responses import json_provider
+    json_provider.init_app(app)
 
-    from .models import db, User, bcrypt
+    from .models import db, User, hashing_pool, credential_cache
     db.init_app(app)
-    bcrypt.init_app(app)
+    hashing_pool.init_app(app)
+    credential_cache.init_app(app)
 
-    # initialize the migration command
-    migrate = Migrate(app, db)
+    from .registration import username_filter
+    username_filter.init_app(app)
+
+    from .ratelimit import login_rate_limiter
+    login_rate_limiter.init_app(app)
+
+    # the migration command is only needed by "flask db", and alembic takes
+    # about as long to import as the rest of the app, so workers skip it
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db)
 
     # pass the app context to the views
     #with app.app_context():
     # import the registration and authentication api from views
+    from .keys import keyring
+    from .token_cache import token_cache
+    from .user_cache import user_cache
+    from .revocation import denylist
+    from .refresh_tokens import refresh_tokens
     from .views.auth_api import(
-        jwt, RegisterAPI, AuthenticateAPI, RefreshAPI, FreshLogin, ValidateToken, ValidateFreshToken, Home, LogoutAPI, GetUsers
+        jwt, RegisterAPI, AuthenticateAPI, RefreshAPI, FreshLogin, ValidateToken, ValidateFreshToken, Home, LogoutAPI, GetUsers,
+        JWKSAPI, RegisterBatchAPI, MetricsAPI, ValidateTokenBatch, AuthRequest
     )
     jwt.init_app(app)
+    keyring.init_app(app)
+    token_cache.init_app(app)
+    user_cache.init_app(app)
+    denylist.init_app(app)
+    refresh_tokens.init_app(app)
+    # report the cache statistics with the metrics
+    metrics.add_collector(lambda: {
+        'credentials': credential_cache.stats(), 'tokens': token_cache.stats(), 'users': user_cache.stats()
+    })
     # add the url rules
     app.add_url_rule('/register', view_func=RegisterAPI.as_view('register'))
+    app.add_url_rule('/register/batch', view_func=RegisterBatchAPI.as_view('register_batch'))
     app.add_url_rule('/login', view_func=AuthenticateAPI.as_view('login'))
     app.add_url_rule('/logout', view_func=LogoutAPI.as_view('logout'))
     app.add_url_rule('/refresh', view_func=RefreshAPI.as_view('refresh'))
     app.add_url_rule('/fresh_login', view_func=FreshLogin.as_view('fresh_login'))
     app.add_url_rule('/validate_token', view_func=ValidateToken.as_view('validate_token'))
+    app.add_url_rule('/validate_token/batch', view_func=ValidateTokenBatch.as_view('validate_token_batch'))
+    app.add_url_rule('/auth_request', view_func=AuthRequest.as_view('auth_request'))
     app.add_url_rule('/validate_fresh_token', view_func=ValidateFreshToken.as_view('validate_fresh_token'))
     app.add_url_rule('/users', view_func=GetUsers.as_view('users'))
     app.add_url_rule('/home', view_func=Home.as_view('home'))
+    app.add_url_rule('/.well-known/jwks.json', view_func=JWKSAPI.as_view('jwks'))
+    app.add_url_rule('/metrics', view_func=MetricsAPI.as_view('metrics'))
 
     # register the test module to add the "flask test" click command
     # uncomment the following two lines when testing
@@ -76,3 +82,30 @@ def create_app(config_name='default'):
 
     return app
 
+
+def after_fork(app):
+    '''
+    Reset the per process state of an app that was created before a fork,
+    so a worker never shares a database connection with the master or its
+    siblings. The hashing pool and the rate limiter notice the new pid on
+    their own.
+    '''
+    from .models import db
+    with app.app_context():
+        db.engine.dispose()
+
+
+def after_fork_on_first_request(app):
+    '''
+    Run after_fork in a worker before the first request it answers, for
+    servers without a post fork hook of their own. Unlike
+    os.register_at_fork, this never runs in the processes of the hashing
+    pool, which answer no requests.
+    '''
+    pids = {'app': os.getpid()}
+
+    @app.before_request
+    def _after_fork_in_worker():
+        if pids['app'] != os.getpid():
+            pids['app'] = os.getpid()
+            after_fork(app)
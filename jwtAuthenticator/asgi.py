@@ -0,0 +1,322 @@
+import io
+import sys
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request
+from werkzeug.wrappers import BaseResponse
+from flask_jwt_extended.config import config as jwt_config
+
+from .hashing import check_hash, generate_hash
+from .metrics import metrics
+from .models import db, User, hashing_pool, credential_cache, rehash_password
+from .ratelimit import limit_response
+from .registration import username_taken, insert_user
+from .responses import constant_response
+from .revocation import denylist
+from .schemas.schema_user import validate_user
+from .token_cache import token_cache
+from .user_cache import user_cache
+from .views.auth_api import login_response
+
+
+def invalid_credentials(data):
+    ''' the answer to a body that failed validation, same as the sync views '''
+    metrics.outcome('invalid_request')
+    if data['error'] == 'validation':
+        return constant_response('invalid_credentials')
+    return constant_response('bad_request')
+
+
+class AsyncAuthApp:
+    '''
+    An ASGI application in front of the flask app.
+
+    /login, /register, /refresh and /validate_token are served natively:
+    bcrypt is awaited on the hashing pool, the database is used from a
+    small thread pool, and everything else (validation, cookies, jwt
+    encoding) runs on the event loop. A repeat /validate_token whose token
+    is in the token cache and whose revocation status is known in memory is
+    answered without leaving the loop, so one process can hold thousands
+    of validations in flight. Every other route is handed to the flask app
+    on the thread pool.
+
+    Each step runs in its own flask request context, pushed and popped
+    without an await in between, so the context locals of concurrent
+    requests never mix.
+    '''
+
+    def __init__(self, app, threads=None):
+        self.app = app
+        # one thread per pooled connection keeps the pool from queueing
+        self.threads = threads or app.config.get('ASGI_THREADS') or (
+            app.config.get('DATABASE_POOL_SIZE', 5) + app.config.get('DATABASE_MAX_OVERFLOW', 10))
+        self._executor = None
+        self.routes = {
+            ('POST', '/login'): self.login,
+            ('POST', '/register'): self.register,
+            ('POST', '/refresh'): self.refresh,
+            ('GET', '/validate_token'): self.validate_token,
+            ('POST', '/validate_token'): self.validate_token,
+        }
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='asgi-db')
+        return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise RuntimeError('unsupported scope type %s' % scope['type'])
+
+        body = await self._read_body(receive)
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is None:
+            return await self._wsgi(scope, body, send)
+        # the native handlers run in several request contexts, time the whole request
+        scope = dict(scope, **{'metrics.start': time.perf_counter()})
+        response = await self._guard(scope, body, handler(scope, body))
+        await self._send_response(send, response)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                hashing_pool.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    @staticmethod
+    def environ(scope, body):
+        ''' a WSGI environ for the request of an http scope '''
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('127.0.0.1', 0)
+        path = scope['path'].encode('utf-8').decode('latin-1')
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': path,
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+            'REMOTE_ADDR': client[0],
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if 'metrics.start' in scope:
+            environ['metrics.start'] = scope['metrics.start']
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = 'HTTP_' + name
+                if key in environ:
+                    # repeated headers are folded, cookies with their own separator
+                    value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+                environ[key] = value
+        return environ
+
+    @staticmethod
+    async def _send_response(send, response):
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.headers.to_wsgi_list()],
+        })
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    def _run(self, scope, body, step, *args):
+        '''
+        Run step in a request context of the flask app. Whatever step
+        returns is passed back, a raised error becomes the response of the
+        app's error handlers.
+        '''
+        with self.app.request_context(self.environ(scope, body)):
+            try:
+                return step(*args)
+            except Exception as error:
+                try:
+                    rv = self.app.handle_user_exception(error)
+                except Exception as error:
+                    # nothing handles it, a 500 like any other flask view
+                    return self.app.handle_exception(error)
+                return self.app.finalize_request(rv)
+
+    async def _thread(self, scope, body, step, *args):
+        ''' _run on the thread pool, for the steps that use the database '''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), self._run, scope, body, step, *args)
+
+    async def _guard(self, scope, body, coroutine):
+        ''' errors raised between the steps, like a busy hashing pool, go to the error handlers too '''
+        try:
+            return await coroutine
+        except Exception as error:
+            return self._run(scope, body, self._raise, error)
+
+    @staticmethod
+    def _raise(error):
+        raise error
+
+    def _finish(self, rv):
+        ''' a view return value turned into the final response '''
+        return self.app.finalize_request(rv)
+
+    def _begin(self):
+        '''
+        The before request hooks, the rate limit and the body validation,
+        returns the validated user data or a response
+        '''
+        rv = self.app.preprocess_request()
+        if rv is None and request.endpoint == 'login':
+            rv = limit_response()
+        if rv is not None:
+            return self._finish(rv)
+        data = validate_user(request.get_json())
+        if not data['ok']:
+            return self._finish(invalid_credentials(data))
+        return data['user_data']
+
+    @staticmethod
+    def _credentials(username):
+        ''' the (id, password_hash) of a user, or None '''
+        return db.session.query(User.id, User.password_hash).filter_by(username=username).first()
+
+    async def login(self, scope, body):
+        user_data = self._run(scope, body, self._begin)
+        if isinstance(user_data, BaseResponse):
+            return user_data
+        username, password = user_data['username'], user_data.pop('password')
+
+        credentials = await self._thread(scope, body, self._credentials, username)
+        user_id, pw_hash = credentials or (None, None)
+        if pw_hash is None:
+            valid = False
+        elif credential_cache.verify(username, pw_hash, password):
+            # a recent successful check of the same password skips bcrypt
+            valid = True
+        else:
+            valid = await hashing_pool.run_async(check_hash, pw_hash, password)
+            if valid and hashing_pool.needs_rehash(pw_hash):
+                # the hasher or its costs changed since the hash was made
+                new_hash = await hashing_pool.run_async(generate_hash, password, hashing_pool.hasher)
+                await self._thread(scope, body, rehash_password, username, pw_hash, new_hash)
+                pw_hash = new_hash
+            if valid:
+                credential_cache.remember(username, pw_hash, password)
+
+        if not valid:
+            metrics.outcome('invalid_credentials')
+            return self._run(scope, body, lambda: self._finish(constant_response('invalid_credentials')))
+        # issuing the refresh token writes its row
+        return await self._thread(scope, body, lambda: self._finish(login_response(user_data, user_id)))
+
+    async def register(self, scope, body):
+        user_data = self._run(scope, body, self._begin)
+        if isinstance(user_data, BaseResponse):
+            return user_data
+        username = user_data['username']
+
+        # only names that can be accepted pay for bcrypt
+        created = False
+        if not await self._thread(scope, body, username_taken, username):
+            pw_hash = await hashing_pool.run_async(generate_hash, user_data['password'], hashing_pool.hasher)
+            created = await self._thread(scope, body, insert_user, username, pw_hash)
+
+        outcome = 'user_created' if created else 'duplicate_username'
+        metrics.outcome(outcome)
+        return self._run(scope, body, lambda: self._finish(constant_response(outcome)))
+
+    async def refresh(self, scope, body):
+        # the rotation is a conditional update, the whole view runs on a thread
+        return await self._thread(scope, body, self.app.full_dispatch_request)
+
+    def _validate_in_memory(self):
+        '''
+        Answer the validation on the loop when nothing has to be read from
+        the database: the token was verified before, its revocation status
+        is known in memory and its user is cached. None sends the request
+        to a thread.
+        '''
+        if not token_cache.enabled or list(jwt_config.token_location) != ['cookies']:
+            return None
+        encoded_token = request.cookies.get(jwt_config.access_cookie_name)
+        entry = token_cache.get(encoded_token) if encoded_token else None
+        if entry is None or denylist.sync_due() or denylist.revoked_in_memory(entry[0].get('jti')) is None:
+            return None
+        # and the user behind it is in the user cache
+        if not user_cache.cached(entry[0][jwt_config.identity_claim_key]):
+            return None
+        return self.app.full_dispatch_request()
+
+    async def validate_token(self, scope, body):
+        response = self._run(scope, body, self._validate_in_memory)
+        if response is None:
+            response = await self._thread(scope, body, self.app.full_dispatch_request)
+        return response
+
+    def _wsgi_stream(self, loop, scope, body, queue):
+        '''
+        Run the flask app on a thread and pass the response to the loop
+        piece by piece, a streamed body (the ndjson export) is iterated on
+        the same thread that started it
+        '''
+        def put(message):
+            asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            put({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            })
+
+        try:
+            iterable = self.app(self.environ(scope, body), start_response)
+            try:
+                for chunk in iterable:
+                    if chunk:
+                        put({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+        finally:
+            put({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def _wsgi(self, scope, body, send):
+        loop = asyncio.get_running_loop()
+        # a small queue holds the thread back when the client reads slowly
+        queue = asyncio.Queue(maxsize=8)
+        done = loop.run_in_executor(self._get_executor(), self._wsgi_stream, loop, scope, body, queue)
+        while True:
+            message = await queue.get()
+            await send(message)
+            if message['type'] == 'http.response.body' and not message['more_body']:
+                break
+        await done
@@ -0,0 +1,43 @@
+import math
+import hashlib
+
+
+class BloomFilter:
+    '''
+    A plain bloom filter: "not in the filter" is always right, "in the
+    filter" is wrong at most error_rate of the time once capacity items are in.
+    '''
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        # the usual sizing for m bits and k hash functions
+        self.size = max(8, int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        if isinstance(item, str):
+            item = item.encode('utf-8')
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        # double hashing, k positions out of two 64 bit hashes
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
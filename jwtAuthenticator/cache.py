@@ -0,0 +1,127 @@
+import os
+import hmac
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    '''
+    A small thread safe LRU cache whose entries expire after a ttl, or at an
+    explicit wall clock time. Every worker process holds its own copy.
+    '''
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.time():
+                # the entry outlived its ttl, drop it
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires_at=None):
+        if expires_at is None:
+            expires_at = time.time() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            # evict the least recently used entries
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        # a lookup that leaves the statistics and the lru order alone
+        entry = self._data.get(key)
+        return entry is not None and entry[1] > time.time()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+
+class CredentialCache:
+    '''
+    Remembers recent successful password checks so a client that logs in and
+    then asks for a fresh login does not pay for bcrypt twice.
+
+    Entries are keyed by username and hold an HMAC of the password under a
+    server side pepper, never the password itself, along with the hash the
+    password was checked against. A changed hash never matches an old entry.
+    '''
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.hits = 0
+        self.misses = 0
+        self._pepper = os.urandom(32)
+        self._cache = TTLCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('CREDENTIAL_CACHE_ENABLED', False)
+        self.hits = 0
+        self.misses = 0
+        pepper = app.config.get('CREDENTIAL_CACHE_PEPPER')
+        if pepper:
+            self._pepper = pepper.encode('utf-8') if isinstance(pepper, str) else pepper
+        self._cache = TTLCache(
+            maxsize=app.config.get('CREDENTIAL_CACHE_SIZE', 1024),
+            ttl=app.config.get('CREDENTIAL_CACHE_TTL', 30)
+        )
+        app.extensions['credential_cache'] = self
+
+    def _digest(self, password):
+        return hmac.new(self._pepper, password.encode('utf-8'), hashlib.sha256).digest()
+
+    def verify(self, username, password_hash, password):
+        ''' return True if this password was verified for the user recently '''
+        if not self.enabled:
+            return False
+        entry = self._cache.get(username)
+        if entry is not None:
+            digest, cached_hash = entry
+            if cached_hash == password_hash and hmac.compare_digest(digest, self._digest(password)):
+                self.hits += 1
+                return True
+        self.misses += 1
+        return False
+
+    def remember(self, username, password_hash, password):
+        ''' record a successful bcrypt check '''
+        if self.enabled:
+            self._cache.set(username, (self._digest(password), password_hash))
+
+    def invalidate(self, username):
+        self._cache.pop(username)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache)}
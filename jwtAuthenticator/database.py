@@ -0,0 +1,59 @@
+from functools import partial
+
+import flask_sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from .metrics import metrics
+
+
+def apply_pragmas(pragmas, dbapi_connection, connection_record):
+    ''' run the configured pragmas on a new sqlite connection '''
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute('PRAGMA %s = %s' % (name, value))
+    cursor.close()
+
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+    '''
+    flask_sqlalchemy with the engine settings of config.py applied.
+
+    Server databases get a sized pool with pre-ping and recycling. A sqlite
+    file gets a per worker pool instead of a new connection per request, and
+    every new connection runs SQLITE_PRAGMAS (WAL, busy timeout, ...), so the
+    workers wait for each other instead of failing with "database is locked".
+    Anything in SQLALCHEMY_ENGINE_OPTIONS still has the last word.
+    '''
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+        pool_size = app.config.get('DATABASE_POOL_SIZE')
+
+        if sa_url.drivername.startswith('sqlite'):
+            pragmas = app.config.get('SQLITE_PRAGMAS')
+            if pragmas:
+                options['sqlite_pragmas'] = dict(pragmas)
+            in_memory = sa_url.database in (None, '', ':memory:')
+            if pool_size and not in_memory:
+                # a pooled connection is only ever used by one thread at a time
+                options['poolclass'] = QueuePool
+                options['pool_size'] = pool_size
+                options['max_overflow'] = app.config.get('DATABASE_MAX_OVERFLOW', 10)
+                options.setdefault('connect_args', {})['check_same_thread'] = False
+        elif pool_size:
+            options.setdefault('pool_size', pool_size)
+            options.setdefault('max_overflow', app.config.get('DATABASE_MAX_OVERFLOW', 10))
+            options.setdefault('pool_timeout', app.config.get('DATABASE_POOL_TIMEOUT', 10))
+            options.setdefault('pool_recycle', app.config.get('DATABASE_POOL_RECYCLE', 1800))
+            options.setdefault('pool_pre_ping', app.config.get('DATABASE_POOL_PRE_PING', True))
+        return sa_url, options
+
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop('sqlite_pragmas', None)
+        engine = super().create_engine(sa_url, engine_opts)
+        if pragmas:
+            event.listen(engine, 'connect', partial(apply_pragmas, pragmas))
+        if metrics.enabled:
+            metrics.instrument_engine(engine)
+        return engine
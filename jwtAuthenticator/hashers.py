@@ -0,0 +1,162 @@
+import os
+import hmac
+import base64
+import hashlib
+
+import bcrypt as bcrypt_lib
+
+try:
+    import argon2
+    from argon2.exceptions import VerificationError, InvalidHash
+except ImportError:  # pragma: no cover
+    argon2 = None
+
+
+def _b64encode(raw):
+    return base64.b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _bytes(password):
+    return password.encode('utf-8') if isinstance(password, str) else password
+
+
+class BcryptHasher:
+    ''' bcrypt, $2b$<rounds>$... '''
+
+    name = 'bcrypt'
+    prefixes = ('$2a$', '$2b$', '$2y$')
+
+    def __init__(self, rounds=12):
+        self.rounds = rounds
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('BCRYPT_LOG_ROUNDS') or 12)
+
+    def hash(self, password):
+        return bcrypt_lib.hashpw(_bytes(password), bcrypt_lib.gensalt(self.rounds)).decode('utf-8')
+
+    @staticmethod
+    def verify(pw_hash, password):
+        pw_hash = _bytes(pw_hash)
+        return hmac.compare_digest(bcrypt_lib.hashpw(_bytes(password), pw_hash), pw_hash)
+
+    def needs_update(self, pw_hash):
+        # only ever upgrade, so two processes on different costs never undo
+        # each other's work
+        parts = pw_hash.split('$')
+        return len(parts) < 4 or not parts[2].isdigit() or int(parts[2]) < self.rounds
+
+
+class ScryptHasher:
+    '''
+    scrypt from hashlib, $scrypt$ln=<log2 n>,r=<r>,p=<p>$<salt>$<hash>.
+    Memory per hash is 128 * r * 2**ln bytes, 16MB with the defaults.
+    '''
+
+    name = 'scrypt'
+    prefixes = ('$scrypt$',)
+
+    def __init__(self, log_n=14, r=8, p=1):
+        self.log_n = log_n
+        self.r = r
+        self.p = p
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('SCRYPT_LOG_N', 14), config.get('SCRYPT_R', 8), config.get('SCRYPT_P', 1))
+
+    @property
+    def params(self):
+        return 'ln=%d,r=%d,p=%d' % (self.log_n, self.r, self.p)
+
+    @staticmethod
+    def _derive(password, salt, log_n, r, p):
+        n = 2 ** log_n
+        # hashlib refuses anything above 32MB unless it is told otherwise
+        maxmem = 128 * r * n * p + 1024 * 1024
+        return hashlib.scrypt(_bytes(password), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=32)
+
+    def hash(self, password):
+        salt = os.urandom(16)
+        derived = self._derive(password, salt, self.log_n, self.r, self.p)
+        return '$scrypt$%s$%s$%s' % (self.params, _b64encode(salt), _b64encode(derived))
+
+    @classmethod
+    def verify(cls, pw_hash, password):
+        try:
+            _, _, params, salt, derived = pw_hash.split('$')
+            values = dict(item.split('=') for item in params.split(','))
+            expected = cls._derive(password, _b64decode(salt), int(values['ln']), int(values['r']), int(values['p']))
+        except (ValueError, KeyError):
+            return False
+        return hmac.compare_digest(expected, _b64decode(derived))
+
+    def needs_update(self, pw_hash):
+        return pw_hash.split('$')[2:3] != [self.params]
+
+
+class Argon2idHasher:
+    '''
+    Argon2id from the optional argon2-cffi package, in the PHC format
+    $argon2id$v=19$m=<KiB>,t=<passes>,p=<lanes>$<salt>$<hash>
+    '''
+
+    name = 'argon2id'
+    prefixes = ('$argon2id$',)
+
+    def __init__(self, time_cost=3, memory_kib=65536, parallelism=1):
+        if argon2 is None:
+            raise RuntimeError('the argon2id hasher needs the argon2-cffi package')
+        self.time_cost = time_cost
+        self.memory_kib = memory_kib
+        self.parallelism = parallelism
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('ARGON2_TIME_COST', 3), config.get('ARGON2_MEMORY_KIB', 65536),
+                   config.get('ARGON2_PARALLELISM', 1))
+
+    def _hasher(self):
+        # built on use, so the hasher pickles into the pool as three numbers
+        return argon2.PasswordHasher(time_cost=self.time_cost, memory_cost=self.memory_kib,
+                                     parallelism=self.parallelism, type=argon2.Type.ID)
+
+    def hash(self, password):
+        return self._hasher().hash(password)
+
+    @staticmethod
+    def verify(pw_hash, password):
+        if argon2 is None:
+            raise RuntimeError('argon2id hashes need the argon2-cffi package')
+        try:
+            return argon2.PasswordHasher().verify(pw_hash, password)
+        except (VerificationError, InvalidHash):
+            return False
+
+    def needs_update(self, pw_hash):
+        return self._hasher().check_needs_rehash(pw_hash)
+
+
+# every hasher the app can read, by name
+HASHERS = {hasher.name: hasher for hasher in (BcryptHasher, ScryptHasher, Argon2idHasher)}
+
+
+def identify(pw_hash):
+    ''' the hasher class that made pw_hash, from its prefix '''
+    for hasher in HASHERS.values():
+        if pw_hash.startswith(hasher.prefixes):
+            return hasher
+    raise ValueError('unknown password hash format')
+
+
+def make_hasher(config):
+    ''' the preferred hasher, PASSWORD_HASHER with its cost settings '''
+    name = config.get('PASSWORD_HASHER') or 'bcrypt'
+    if name not in HASHERS:
+        raise RuntimeError('PASSWORD_HASHER must be one of %s' % ', '.join(sorted(HASHERS)))
+    return HASHERS[name].from_config(config)
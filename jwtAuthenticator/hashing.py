@@ -0,0 +1,283 @@
+import os
+import json
+import math
+import time
+import platform
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .hashers import BcryptHasher, identify, make_hasher
+from .metrics import metrics
+from .responses import constant_response
+
+
+class HashingPoolBusy(Exception):
+    ''' raised when no hashing slot frees up within the configured wait '''
+
+    def __init__(self, retry_after):
+        super().__init__("password hashing pool is saturated")
+        self.retry_after = retry_after
+
+
+# the functions below run inside the pool processes, so they must stay
+# at module level to be picklable
+def generate_hash(password, hasher):
+    ''' hash a password with the given hasher (see hashers.py) '''
+    return hasher.hash(password)
+
+
+def check_hash(pw_hash, password):
+    ''' check a password against a hash of any known algorithm '''
+    if isinstance(pw_hash, bytes):
+        pw_hash = pw_hash.decode('utf-8')
+    return identify(pw_hash).verify(pw_hash, password)
+
+
+def calibrate_rounds(target_ms, minimum=10, maximum=16, sample_rounds=8):
+    '''
+    The highest bcrypt cost whose hash takes at most target_ms on this
+    machine, within [minimum, maximum]. Every extra round doubles the work,
+    so a few cheap hashes at sample_rounds are enough to extrapolate.
+    '''
+    # the best of three, a busy machine only ever makes a sample slower
+    sample = min(_time_hash(sample_rounds) for _ in range(3))
+    rounds = sample_rounds + int(math.floor(math.log2(target_ms / 1000.0 / sample)))
+    return max(minimum, min(maximum, rounds))
+
+
+def host_fingerprint():
+    ''' the host name, cpu model and core count, which a calibration is only good for '''
+    model = platform.processor()
+    try:
+        with open('/proc/cpuinfo') as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith('model name'):
+                    model = line.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return '%s/%s/%d' % (platform.node(), model, os.cpu_count() or 1)
+
+
+def pinned_rounds(config):
+    '''
+    The bcrypt cost of this host. The first process to start calibrates it
+    and writes it to BCRYPT_ROUNDS_FILE, every later process and restart
+    reads it back, so all of them hash at the same cost. A file written on
+    another host (an image build, a copied volume) or older than
+    BCRYPT_RECALIBRATE_DAYS is calibrated again.
+    '''
+    path = config.get('BCRYPT_ROUNDS_FILE')
+    fingerprint = host_fingerprint()
+    max_age = config.get('BCRYPT_RECALIBRATE_DAYS', 30) * 86400
+    if path:
+        try:
+            with open(path) as rounds_file:
+                pinned = json.load(rounds_file)
+            if pinned['host'] == fingerprint and time.time() - pinned['calibrated_at'] < max_age:
+                return int(pinned['rounds'])
+        except (OSError, ValueError, TypeError, KeyError):
+            # missing, or written by an older version without the host
+            pass
+    rounds = calibrate_rounds(
+        config.get('BCRYPT_TARGET_MS', 250),
+        config.get('BCRYPT_MIN_ROUNDS', 10),
+        config.get('BCRYPT_MAX_ROUNDS', 16),
+    )
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written aside and renamed, so a concurrent reader never sees half a file
+        partial = '%s.%d' % (path, os.getpid())
+        with open(partial, 'w') as rounds_file:
+            json.dump({'rounds': rounds, 'host': fingerprint, 'calibrated_at': time.time()}, rounds_file)
+        os.replace(partial, path)
+    return rounds
+
+
+def _time_hash(rounds):
+    start = time.perf_counter()
+    BcryptHasher(rounds).hash('calibration')
+    return time.perf_counter() - start
+
+
+def server_processes(config):
+    ''' how many server processes share the cores of this host '''
+    if config.get('SERVER_PROCESSES'):
+        return config['SERVER_PROCESSES']
+    try:
+        import uwsgi
+        return uwsgi.numproc
+    except (ImportError, AttributeError):
+        return 1
+
+
+class HashingPool:
+    '''
+    Run bcrypt in a dedicated process pool so the request threads only wait
+    on a future, and refuse work quickly once the pool is saturated.
+
+    Every server process gets its own pool of cores // processes hashing
+    processes, so all the pools of a host together never run more hashes
+    than there are cores. On top of the running ones, each server process
+    queues at most PASSWORD_POOL_QUEUE_SIZE hashes. The slots are plain
+    thread semaphores of that process, so a worker that is killed mid hash
+    takes its slots with it instead of leaking them for its siblings.
+
+    The hashing processes are started through a forkserver, never forked
+    from a worker that is already running threads.
+    '''
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.hasher = BcryptHasher()
+        self.workers = os.cpu_count() or 1
+        self.queue_size = 2 * self.workers
+        self.max_wait = 0.5
+        self.retry_after = 1
+        self.start_method = 'forkserver'
+        self._pid = None
+        self._process_slots = None
+        self._executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.shutdown()
+        self.enabled = app.config.get('PASSWORD_POOL_ENABLED', False)
+        if app.config.get('PASSWORD_HASHER', 'bcrypt') == 'bcrypt' and not app.config.get('BCRYPT_LOG_ROUNDS'):
+            # no fixed cost, the one that fits the login budget on this host
+            app.config['BCRYPT_LOG_ROUNDS'] = pinned_rounds(app.config)
+        # new hashes use the preferred hasher, any known one is verified
+        self.hasher = make_hasher(app.config)
+        # the cores of the host are split between the server processes
+        self.workers = (app.config.get('PASSWORD_POOL_WORKERS')
+                        or max(1, (os.cpu_count() or 1) // server_processes(app.config)))
+        self.queue_size = app.config.get('PASSWORD_POOL_QUEUE_SIZE')
+        if self.queue_size is None:
+            self.queue_size = 2 * self.workers
+        self.max_wait = app.config.get('PASSWORD_POOL_MAX_WAIT', 0.5)
+        self.retry_after = app.config.get('PASSWORD_POOL_RETRY_AFTER', 1)
+        self.start_method = app.config.get('PASSWORD_POOL_START_METHOD') or 'forkserver'
+        python = app.config.get('PASSWORD_POOL_PYTHON')
+        if python:
+            # under uWSGI sys.executable is the uwsgi binary, not python
+            multiprocessing.set_executable(python)
+
+        # answer saturation with a 503 and a hint of when to come back
+        app.register_error_handler(HashingPoolBusy, self._busy_response)
+
+    def _busy_response(self, error):
+        metrics.outcome('hashing_busy')
+        resp = constant_response('busy')
+        resp.headers['Retry-After'] = str(error.retry_after)
+        return resp
+
+    def _claim(self):
+        # the slots and the executor belong to one process, a forked worker
+        # builds its own on first use and never touches the parent's
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._process_slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+                    self._executor = None
+                    self._pid = os.getpid()
+
+    @property
+    def _slots(self):
+        self._claim()
+        return self._process_slots
+
+    def _get_executor(self):
+        self._claim()
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context(self.start_method)
+                if self.start_method == 'forkserver':
+                    # the hashing processes fork from a server with this module loaded
+                    context.set_forkserver_preload([__name__])
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def submit(self, fn, *args):
+        '''
+        Queue fn on the pool and return a future, raise HashingPoolBusy if
+        no slot frees up within max_wait seconds
+        '''
+        slots = self._slots
+        if not slots.acquire(timeout=self.max_wait):
+            raise HashingPoolBusy(self.retry_after)
+        return self._submit_acquired(slots, fn, *args)
+
+    def _submit_acquired(self, slots, fn, *args):
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # give the slot back as soon as the hash is done
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    async def run_async(self, fn, *args):
+        '''
+        Await fn on the pool without blocking the event loop, waiting for a
+        slot up to max_wait like submit. With the pool disabled fn runs in
+        the loop's default thread pool, bcrypt releases the GIL.
+        '''
+        loop = asyncio.get_running_loop()
+        with metrics.phase('bcrypt'):
+            if not self.enabled:
+                return await loop.run_in_executor(None, fn, *args)
+            slots = self._slots
+            deadline = loop.time() + self.max_wait
+            while not slots.acquire(False):
+                if loop.time() >= deadline:
+                    raise HashingPoolBusy(self.retry_after)
+                await asyncio.sleep(0.005)
+            return await asyncio.wrap_future(self._submit_acquired(slots, fn, *args))
+
+    def generate(self, password):
+        ''' hash the password, in the pool when it is enabled '''
+        with metrics.phase('bcrypt'):
+            if not self.enabled:
+                return generate_hash(password, self.hasher)
+            return self.submit(generate_hash, password, self.hasher).result()
+
+    def generate_many(self, passwords):
+        '''
+        Hash a list of passwords in rounds of one password per pool process.
+        A round holds the slots for a single hash, so logins queued in
+        between get their turn instead of waiting for the whole batch.
+        '''
+        if not self.enabled or len(passwords) < 2:
+            return [self.generate(password) for password in passwords]
+        with metrics.phase('bcrypt'):
+            hashes = []
+            for start in range(0, len(passwords), self.workers):
+                futures = [self.submit(generate_hash, password, self.hasher)
+                           for password in passwords[start:start + self.workers]]
+                hashes.extend(future.result() for future in futures)
+            return hashes
+
+    def needs_rehash(self, pw_hash):
+        ''' True when the hash was made by another hasher or with other costs '''
+        # flask_bcrypt stored its hashes as bytes
+        if isinstance(pw_hash, bytes):
+            pw_hash = pw_hash.decode('utf-8')
+        return not pw_hash.startswith(self.hasher.prefixes) or self.hasher.needs_update(pw_hash)
+
+    def check(self, pw_hash, password):
+        ''' verify the password, in the pool when it is enabled '''
+        with metrics.phase('bcrypt'):
+            if not self.enabled:
+                return check_hash(pw_hash, password)
+            return self.submit(check_hash, pw_hash, password).result()
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False)
+        self._executor = None
+        self._pid = None
@@ -0,0 +1,248 @@
+import json
+import time
+import base64
+import hashlib
+import datetime
+import threading
+
+from jwt import InvalidTokenError
+from jwt.algorithms import get_default_algorithms
+
+# the curve names used in a JWK for each elliptic curve
+EC_CURVES = {'secp256r1': 'P-256', 'secp384r1': 'P-384', 'secp521r1': 'P-521'}
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _int_b64(number):
+    return _b64(number.to_bytes((number.bit_length() + 7) // 8 or 1, 'big'))
+
+
+def _read_key(settings, name):
+    ''' a key from a mapping, either the PEM itself or a path in name_file '''
+    value = settings.get(name)
+    path = settings.get(name + '_file') or settings.get(name + '_FILE')
+    if not value and path:
+        with open(path) as key_file:
+            value = key_file.read()
+    return value
+
+
+def _timestamp(value):
+    ''' epoch seconds from a number, an ISO 8601 string (UTC) or a datetime '''
+    if value is None:
+        return 0.0
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.timestamp()
+    return float(value)
+
+
+def public_jwk(public_pem, algorithm, kid=None):
+    ''' build the public JWK (RFC 7517) for a PEM encoded public key '''
+    from cryptography.hazmat.primitives.serialization import load_pem_public_key
+    from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
+
+    if isinstance(public_pem, str):
+        public_pem = public_pem.encode('utf-8')
+    key = load_pem_public_key(public_pem)
+
+    if isinstance(key, rsa.RSAPublicKey):
+        numbers = key.public_numbers()
+        jwk = {'kty': 'RSA', 'e': _int_b64(numbers.e), 'n': _int_b64(numbers.n)}
+    elif isinstance(key, ec.EllipticCurvePublicKey):
+        numbers = key.public_numbers()
+        size = (key.curve.key_size + 7) // 8
+        jwk = {
+            'kty': 'EC',
+            'crv': EC_CURVES[key.curve.name],
+            'x': _b64(numbers.x.to_bytes(size, 'big')),
+            'y': _b64(numbers.y.to_bytes(size, 'big')),
+        }
+    elif isinstance(key, ed25519.Ed25519PublicKey):
+        from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+        raw = key.public_bytes(Encoding.Raw, PublicFormat.Raw)
+        jwk = {'kty': 'OKP', 'crv': 'Ed25519', 'x': _b64(raw)}
+    else:
+        raise ValueError('unsupported public key type: %s' % type(key).__name__)
+
+    if kid is None:
+        # default to the RFC 7638 thumbprint of the required members
+        required = {k: jwk[k] for k in sorted(jwk)}
+        thumbprint = hashlib.sha256(json.dumps(required, separators=(',', ':')).encode('utf-8'))
+        kid = _b64(thumbprint.digest())
+    jwk.update({'kid': kid, 'use': 'sig', 'alg': algorithm})
+    return jwk
+
+
+def public_pem_from_private(private_pem):
+    ''' derive the PEM public key from a PEM private key '''
+    from cryptography.hazmat.primitives.serialization import (
+        load_pem_private_key, Encoding, PublicFormat
+    )
+    if isinstance(private_pem, str):
+        private_pem = private_pem.encode('utf-8')
+    key = load_pem_private_key(private_pem, password=None)
+    return key.public_key().public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo).decode('utf-8')
+
+
+class SigningKey:
+    ''' one entry of the keyring '''
+
+    __slots__ = ('kid', 'encode_key', 'decode_key', 'not_before', 'retire_at', 'jwk')
+
+    def __init__(self, kid, encode_key, decode_key, not_before, jwk=None):
+        self.kid = kid
+        self.encode_key = encode_key
+        self.decode_key = decode_key
+        self.not_before = not_before
+        self.retire_at = float('inf')
+        self.jwk = jwk
+
+
+class KeyRing:
+    '''
+    The keys tokens are signed and verified with.
+
+    JWT_KEYRING (or the json file in JWT_KEYRING_FILE) lists the keys, each
+    with a kid and a not_before time. The newest key whose not_before has
+    passed signs new tokens, so a rotation is scheduled by adding a key with
+    a future not_before. A key keeps verifying until every token it could
+    have signed has expired, and tokens are matched to their key by the kid
+    header with a single dict lookup, so rotating never logs anybody out.
+
+    Without a keyring the single key from JWT_SECRET_KEY / SECRET_KEY (the
+    order flask_jwt_extended reads them in) or JWT_PRIVATE_KEY is used. Tokens issued before kid headers
+    existed are checked against the first key of the ring.
+
+    With an asymmetric JWT_ALGORITHM (RS*, ES*, PS*, EdDSA) the public keys,
+    scheduled ones included, are published at /.well-known/jwks.json so
+    services can verify tokens locally. The document is built once here.
+    '''
+
+    def __init__(self, app=None):
+        self.algorithm = 'HS256'
+        self.keys = []
+        self.jwks = {'keys': []}
+        self.jwks_body = b'{"keys":[]}'
+        self.jwks_etag = None
+        self._by_kid = {}
+        self._legacy = None
+        self._current = None
+        self._next_change = 0.0
+        self._pending = threading.local()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.algorithm = app.config.get('JWT_ALGORITHM', 'HS256')
+        if self.algorithm not in get_default_algorithms():
+            raise RuntimeError(
+                'JWT_ALGORITHM %s is not available, asymmetric algorithms need '
+                'the cryptography package (and PyJWT 2 for EdDSA)' % self.algorithm)
+
+        entries = app.config.get('JWT_KEYRING')
+        if not entries and app.config.get('JWT_KEYRING_FILE'):
+            with open(app.config['JWT_KEYRING_FILE']) as keyring_file:
+                entries = json.load(keyring_file)
+        if not entries:
+            entries = [self._single_key_entry(app)]
+
+        self.keys = sorted((self._load(entry) for entry in entries), key=lambda k: k.not_before)
+        if not any(key.encode_key for key in self.keys):
+            raise RuntimeError('the keyring has no key that can sign tokens')
+
+        # a key that stopped signing is kept until its longest lived token expires
+        lifetimes = [app.config.get('JWT_ACCESS_TOKEN_EXPIRES'), app.config.get('JWT_REFRESH_TOKEN_EXPIRES')]
+        if all(isinstance(lifetime, datetime.timedelta) for lifetime in lifetimes):
+            lifetime = max(lifetimes).total_seconds()
+        else:
+            # some tokens never expire, so their keys must never retire
+            lifetime = float('inf')
+        signers = [key for key in self.keys if key.encode_key]
+        for key, successor in zip(signers, signers[1:]):
+            key.retire_at = successor.not_before + lifetime
+
+        self._by_kid = {key.kid: key for key in self.keys}
+        self._legacy = self.keys[0]
+        self._current = None
+        self._next_change = 0.0
+
+        published = [key.jwk for key in self.keys if key.jwk]
+        self.jwks = {'keys': published}
+        self.jwks_body = json.dumps(self.jwks, separators=(',', ':')).encode('utf-8')
+        self.jwks_etag = hashlib.sha256(self.jwks_body).hexdigest()[:32]
+        app.extensions['keyring'] = self
+
+    def _single_key_entry(self, app):
+        if self.algorithm.startswith('HS'):
+            # the secret flask_jwt_extended signed with before the keyring, so
+            # the tokens issued until now keep verifying
+            secret = app.config.get('JWT_SECRET_KEY') or app.config.get('SECRET_KEY')
+            if not secret:
+                raise RuntimeError('JWT_SECRET_KEY or SECRET_KEY is required for %s' % self.algorithm)
+            return {'secret': secret}
+        return {
+            'private_key': _read_key(app.config, 'JWT_PRIVATE_KEY'),
+            'public_key': _read_key(app.config, 'JWT_PUBLIC_KEY'),
+        }
+
+    def _load(self, entry):
+        not_before = _timestamp(entry.get('not_before'))
+        if self.algorithm.startswith('HS'):
+            secret = entry['secret']
+            raw = secret.encode('utf-8') if isinstance(secret, str) else secret
+            # never derive a kid that reveals anything about the secret
+            kid = entry.get('kid') or _b64(hashlib.sha256(b'kid:' + raw).digest()[:12])
+            return SigningKey(kid, secret, secret, not_before)
+
+        private_pem = _read_key(entry, 'private_key')
+        public_pem = _read_key(entry, 'public_key')
+        if not public_pem:
+            if not private_pem:
+                raise RuntimeError('a keyring entry needs a private or public key for %s' % self.algorithm)
+            public_pem = public_pem_from_private(private_pem)
+        jwk = public_jwk(public_pem, self.algorithm, entry.get('kid'))
+        # an entry with only a public key verifies but never signs
+        return SigningKey(jwk['kid'], private_pem, public_pem, not_before, jwk)
+
+    def signing_key(self):
+        ''' the key new tokens are signed with, re-picked only when a rotation is due '''
+        now = time.time()
+        if now >= self._next_change:
+            signers = [key for key in self.keys if key.encode_key]
+            active = [key for key in signers if key.not_before <= now]
+            self._current = active[-1] if active else signers[0]
+            upcoming = [key.not_before for key in signers if key.not_before > now]
+            self._next_change = min(upcoming) if upcoming else float('inf')
+        return self._current
+
+    def headers(self):
+        ''' the kid header of a new token, remembered for the encode key callback '''
+        key = self.signing_key()
+        self._pending.key = key
+        return {'kid': key.kid}
+
+    def encode_key(self):
+        # sign with the key whose kid went into the headers of this token
+        key = getattr(self._pending, 'key', None) or self.signing_key()
+        self._pending.key = None
+        return key.encode_key
+
+    def decode_key(self, headers):
+        ''' the verification key for a token, picked by its kid header '''
+        kid = headers.get('kid')
+        key = self._by_kid.get(kid) if kid else self._legacy
+        if key is None:
+            raise InvalidTokenError('Unknown signing key')
+        if time.time() >= key.retire_at:
+            raise InvalidTokenError('Signing key has been retired')
+        return key.decode_key
+
+
+keyring = KeyRing()
@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+from flask import request, Response
+
+# seconds, wide enough for a cached validation and a slow bcrypt
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+HELP = {
+    'auth_request_duration_seconds': ('histogram', 'Request latency per view'),
+    'auth_phase_duration_seconds': ('histogram', 'Time spent in one phase of a request'),
+    'auth_requests_total': ('counter', 'Requests per view and status code'),
+    'auth_outcomes_total': ('counter', 'Results of the auth endpoints'),
+    'auth_cache_hits_total': ('counter', 'Cache hits per cache'),
+    'auth_cache_misses_total': ('counter', 'Cache misses per cache'),
+    'auth_cache_entries': ('gauge', 'Entries per cache, summed over the workers'),
+}
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+class Metrics:
+    '''
+    Counters and histograms kept in memory by every worker.
+
+    Recording is a dict update under a lock, so it can stay on all the
+    time. Every METRICS_FLUSH_SECONDS a worker writes a snapshot to its own
+    file in METRICS_DIR, and /metrics adds up the files of all the workers
+    (the ones that exited included, so the counters never go down) and
+    renders the Prometheus text format. The gauges of an exited worker are
+    left out, they describe caches that are gone. Without METRICS_DIR only the
+    answering worker is reported.
+    '''
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.directory = None
+        self.flush_seconds = 1
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._next_flush = 0.0
+        self._flush_at_exit = False
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', False)
+        self.directory = app.config.get('METRICS_DIR')
+        self.flush_seconds = app.config.get('METRICS_FLUSH_SECONDS', 1)
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._next_flush = 0.0
+        app.extensions['metrics'] = self
+        if not self.enabled:
+            return
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._remove_stale()
+            if not self._flush_at_exit:
+                atexit.register(self.flush)
+                self._flush_at_exit = True
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def add_collector(self, collector):
+        '''
+        collector() returns {cache name: stats dict with hits, misses and size},
+        read whenever a snapshot is taken
+        '''
+        self._collectors.append(collector)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def outcome(self, outcome):
+        ''' count one result of an auth endpoint, e.g. invalid_credentials '''
+        self.inc('auth_outcomes_total', outcome=outcome)
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # one count per bucket, then the +Inf count and the sum
+                histogram = self._histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[index] += 1
+                    break
+            else:
+                histogram[len(BUCKETS)] += 1
+            histogram[-1] += seconds
+
+    @contextmanager
+    def phase(self, phase):
+        ''' time a block as one phase of the current request '''
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('auth_phase_duration_seconds', time.perf_counter() - start, phase=phase)
+
+    def instrument_engine(self, engine):
+        ''' time every statement run on the engine as the db phase '''
+        from sqlalchemy import event
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after(conn, cursor, statement, parameters, context, executemany):
+            self.observe('auth_phase_duration_seconds',
+                         time.perf_counter() - conn.info['metrics_start'].pop(), phase='db')
+
+    def _before_request(self):
+        # the ASGI app sets the start itself, its steps run in several contexts
+        request.environ.setdefault('metrics.start', time.perf_counter())
+
+    def _after_request(self, response):
+        start = request.environ.get('metrics.start')
+        if start is not None and request.endpoint != 'metrics':
+            view = request.endpoint or 'unknown'
+            self.observe('auth_request_duration_seconds', time.perf_counter() - start, view=view)
+            self.inc('auth_requests_total', view=view, status=str(response.status_code))
+        if self.directory and time.time() >= self._next_flush:
+            self.flush()
+        return response
+
+    def snapshot(self):
+        ''' this worker's values as json friendly lists '''
+        with self._lock:
+            counters = [[name, dict(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, dict(labels), list(values)] for (name, labels), values in self._histograms.items()]
+        gauges = []
+        for collector in self._collectors:
+            for cache, stats in collector().items():
+                counters.append(['auth_cache_hits_total', {'cache': cache}, stats['hits']])
+                counters.append(['auth_cache_misses_total', {'cache': cache}, stats['misses']])
+                gauges.append(['auth_cache_entries', {'cache': cache}, stats['size']])
+        return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def _path(self, pid):
+        return os.path.join(self.directory, '%d.json' % pid)
+
+    def flush(self):
+        ''' write this worker's snapshot, replacing the previous one atomically '''
+        if not self.directory:
+            return
+        self._next_flush = time.time() + self.flush_seconds
+        path = self._path(os.getpid())
+        # one temporary file per thread, two flushes may overlap
+        temporary = '%s.%d.tmp' % (path, threading.get_ident())
+        with open(temporary, 'w') as handle:
+            json.dump(self.snapshot(), handle)
+        os.replace(temporary, path)
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # running as another user
+            pass
+        return True
+
+    def _remove_stale(self):
+        ''' drop the files of workers that are gone, a restart starts from zero '''
+        for name in os.listdir(self.directory):
+            pid = name.split('.', 1)[0]
+            if pid.isdigit() and not self._alive(int(pid)):
+                os.remove(os.path.join(self.directory, name))
+
+    def collect(self):
+        ''' the snapshots of every worker, added up '''
+        if not self.directory:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            snapshots = []
+            for name in os.listdir(self.directory):
+                pid = name[:-len('.json')]
+                if not name.endswith('.json') or not pid.isdigit():
+                    continue
+                try:
+                    with open(os.path.join(self.directory, name)) as handle:
+                        snapshot = json.load(handle)
+                except (OSError, ValueError):
+                    # a worker is rewriting it, it will be there next scrape
+                    continue
+                if not self._alive(int(pid)):
+                    # keep its counters so the totals never go down, drop its gauges
+                    snapshot['gauges'] = []
+                snapshots.append(snapshot)
+
+        totals = {'counters': {}, 'gauges': {}, 'histograms': {}}
+        for snapshot in snapshots:
+            for kind in ('counters', 'gauges'):
+                for name, labels, value in snapshot[kind]:
+                    key = _key(name, labels)
+                    totals[kind][key] = totals[kind].get(key, 0) + value
+            for name, labels, values in snapshot['histograms']:
+                key = _key(name, labels)
+                summed = totals['histograms'].get(key)
+                totals['histograms'][key] = values if summed is None else [a + b for a, b in zip(summed, values)]
+        return totals
+
+    def render(self):
+        ''' the Prometheus text exposition of collect() '''
+        totals = self.collect()
+        series = {}
+        for kind in ('counters', 'gauges', 'histograms'):
+            for (name, labels), value in totals[kind].items():
+                series.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name in sorted(series):
+            kind, description = HELP.get(name, ('untyped', name))
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels, value in sorted(series[name]):
+                if kind != 'histogram':
+                    lines.append('%s%s %s' % (name, _labels(labels), _number(value)))
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    lines.append('%s_bucket%s %d' % (name, _labels(labels + (('le', str(bound)),)), cumulative))
+                lines.append('%s_sum%s %s' % (name, _labels(labels), _number(value[-1])))
+                lines.append('%s_count%s %d' % (name, _labels(labels), cumulative))
+        return '\n'.join(lines) + '\n'
+
+    def response(self):
+        return Response(self.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{%s}' % ','.join('%s="%s"' % (name, escape(value)) for name, value in labels)
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+metrics = Metrics()
@@ -1,10 +1,13 @@
 import datetime
 
-from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
+from .cache import CredentialCache
+from .database import SQLAlchemy
+from .hashing import HashingPool
+from .metrics import metrics
 
 db = SQLAlchemy()
-bcrypt = Bcrypt()
+hashing_pool = HashingPool()
+credential_cache = CredentialCache()
 
 class User(db.Model):
 
@@ -19,10 +22,95 @@ class User(db.Model):
 
     @password.setter
     def password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password)
+        self.password_hash = hashing_pool.generate(password)
+        # a new password must never be answered from an old verification
+        credential_cache.invalidate(self.username)
 
     def verify_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        # a recent successful check of the same password skips bcrypt
+        if credential_cache.verify(self.username, self.password_hash, password):
+            return True
+        if hashing_pool.check(self.password_hash, password):
+            if hashing_pool.needs_rehash(self.password_hash):
+                # the hasher or its costs changed since the hash was made,
+                # upgrade it now that the password is known
+                rehash_password(self.username, self.password_hash, hashing_pool.generate(password))
+            credential_cache.remember(self.username, self.password_hash, password)
+            return True
+        return False
 
     def as_dict(self):
         return {'id': self.id, 'username': self.username}
+
+    @staticmethod
+    def page(after=None, limit=100):
+        '''
+        One page of (id, username) rows ordered by username then id, starting
+        after the (username, id) key of the previous page. Only the two
+        columns are selected, so no User objects are built.
+        '''
+        query = db.session.query(User.id, User.username)
+        if after is not None:
+            username, user_id = after
+            query = query.filter(db.or_(
+                User.username > username,
+                db.and_(User.username == username, User.id > user_id)
+            ))
+        return query.order_by(User.username, User.id).limit(limit).all()
+
+
+def rehash_password(username, old_hash, new_hash):
+    '''
+    Store a hash made at the current cost, unless the password was changed
+    since old_hash was read. A loaded User is updated in the session too.
+    '''
+    db.session.query(User).filter_by(username=username, password_hash=old_hash).update(
+        {'password_hash': new_hash}, synchronize_session='evaluate')
+    db.session.commit()
+    metrics.outcome('rehash')
+
+
+class RevokedToken(db.Model):
+    ''' a revoked token, kept until the token would have expired anyway '''
+
+    __tablename__ = "revoked_tokens"
+    jti = db.Column(db.String(36), primary_key=True)
+    # epoch seconds, the row can be swept once this has passed
+    expires_at = db.Column(db.Integer, nullable=False, index=True)
+    # epoch seconds, lets every worker pick up the revocations it missed
+    revoked_at = db.Column(db.Integer, nullable=False, index=True)
+
+
+def sweep_expired(column, now, batch_size=1000):
+    '''
+    Delete the rows whose expiry column is before now, batch_size rows per
+    statement so a big backlog never holds a long write lock.
+    Returns the number of deleted rows.
+
+    The keys of a batch are read first and deleted by that list: MySQL
+    refuses a LIMIT inside an IN subquery.
+    '''
+    table = column.table
+    key = list(table.primary_key.columns)[0]
+    deleted = 0
+    while True:
+        expired = [row[0] for row in db.session.execute(
+            db.select([key]).where(column < now).limit(batch_size))]
+        if expired:
+            result = db.session.execute(table.delete().where(key.in_(expired)).where(column < now))
+            deleted += result.rowcount
+        db.session.commit()
+        if len(expired) < batch_size:
+            return deleted
+
+
+class RefreshToken(db.Model):
+    ''' one refresh token of a rotation family, see RefreshTokenStore '''
+
+    __tablename__ = "refresh_tokens"
+    jti = db.Column(db.String(36), primary_key=True)
+    family = db.Column(db.String(32), nullable=False, index=True)
+    # epoch seconds, the row can be swept once this has passed
+    expires_at = db.Column(db.Integer, nullable=False, index=True)
+    # set when the token is exchanged, a second exchange is a replay
+    used = db.Column(db.Boolean, nullable=False, default=False)
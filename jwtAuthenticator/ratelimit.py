@@ -0,0 +1,170 @@
+import os
+import math
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import threading
+from functools import wraps
+
+from flask import request
+
+from .metrics import metrics
+from .responses import constant_response
+
+# one bucket: key hash, tokens left, last update (epoch seconds)
+SLOT = struct.Struct('<Qdd')
+# slots looked at before the oldest one is recycled
+PROBES = 8
+
+
+class SharedTokenBuckets:
+    '''
+    Token buckets in a memory mapped file, shared by every process that maps
+    the same path, e.g. all the uWSGI workers.
+
+    The file is a fixed open addressing table of SLOT records keyed by a 64
+    bit hash. A full neighbourhood recycles its least recently used bucket,
+    which is the one most likely to be full again anyway. Updates take an
+    flock on the file, so a check is a hash, a lock and a few memory reads.
+    '''
+
+    def __init__(self, path, slots=65536):
+        self.path = path
+        self.slots = slots
+        self._map = None
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        # every forked worker opens its own descriptor, flock is per descriptor
+        if self._map is None or self._pid != os.getpid():
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            size = self.slots * SLOT.size
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size, mmap.MAP_SHARED)
+            self._fd = fd
+            self._pid = os.getpid()
+        return self._map
+
+    @staticmethod
+    def _hash(key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        # zero marks an empty slot
+        return int.from_bytes(digest, 'little') or 1
+
+    def take(self, key, rate, burst, cost=1.0):
+        '''
+        Take cost tokens from the bucket of key, refilled at rate tokens per
+        second up to burst. Returns (allowed, seconds until allowed).
+        '''
+        if rate <= 0:
+            # an empty bucket would never refill
+            raise ValueError('the refill rate must be positive')
+        table = self._open()
+        key_hash = self._hash(key)
+        start = key_hash % self.slots
+        now = time.time()
+
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                slot = None
+                oldest = None
+                for probe in range(PROBES):
+                    index = (start + probe) % self.slots
+                    stored_hash, tokens, updated = SLOT.unpack_from(table, index * SLOT.size)
+                    if stored_hash == key_hash:
+                        slot = index
+                        break
+                    if stored_hash == 0:
+                        slot, tokens = index, float(burst)
+                        break
+                    if oldest is None or updated < oldest[1]:
+                        oldest = (index, updated)
+                else:
+                    # recycle the bucket that was used the longest time ago
+                    slot, tokens = oldest[0], float(burst)
+
+                if stored_hash == key_hash:
+                    tokens = min(float(burst), tokens + max(0.0, now - updated) * rate)
+                if tokens >= cost:
+                    tokens -= cost
+                    wait = 0.0
+                else:
+                    wait = (cost - tokens) / rate
+                SLOT.pack_into(table, slot * SLOT.size, key_hash, tokens, now)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return wait == 0.0, wait
+
+
+class LoginRateLimiter:
+    '''
+    Per IP and per username token buckets for the login endpoints, checked
+    before the request body is validated or the database is touched.
+    '''
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.buckets = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', False)
+        self.ip_rate = app.config.get('RATE_LIMIT_IP_RATE', 1.0)
+        self.ip_burst = app.config.get('RATE_LIMIT_IP_BURST', 20)
+        self.user_rate = app.config.get('RATE_LIMIT_USER_RATE', 0.2)
+        self.user_burst = app.config.get('RATE_LIMIT_USER_BURST', 5)
+        if self.enabled and min(self.ip_rate, self.user_rate) <= 0:
+            # refused here rather than as a 500 once a bucket runs out
+            raise RuntimeError('RATE_LIMIT_IP_RATE and RATE_LIMIT_USER_RATE must be positive, '
+                               'set RATE_LIMIT_ENABLED = False to turn the limits off')
+        path = app.config.get('RATE_LIMIT_FILE') or os.path.join(app.instance_path, 'ratelimit.bin')
+        self.buckets = SharedTokenBuckets(path, app.config.get('RATE_LIMIT_SLOTS', 65536))
+        app.extensions['login_rate_limiter'] = self
+
+    def check(self):
+        ''' return the seconds to wait if the request is over a limit, else 0 '''
+        allowed, wait = self.buckets.take('ip:%s' % request.remote_addr, self.ip_rate, self.ip_burst)
+        if not allowed:
+            return wait
+        # the username is only peeked at, the view validates the body later
+        data = request.get_json(silent=True)
+        username = data.get('username') if isinstance(data, dict) else None
+        if isinstance(username, str):
+            allowed, wait = self.buckets.take('user:' + username, self.user_rate, self.user_burst)
+            if not allowed:
+                return wait
+        return 0
+
+
+login_rate_limiter = LoginRateLimiter()
+
+
+def limit_response():
+    ''' a 429 response when the request's IP or username is over the limit, else None '''
+    if not login_rate_limiter.enabled:
+        return None
+    wait = login_rate_limiter.check()
+    if not wait:
+        return None
+    metrics.outcome('rate_limited')
+    resp = constant_response('too_many_requests')
+    resp.headers['Retry-After'] = str(int(math.ceil(wait)))
+    return resp
+
+
+def rate_limited(fn):
+    ''' refuse the request with a 429 when its IP or username is over the limit '''
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        refused = limit_response()
+        if refused is not None:
+            return refused
+        return fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,110 @@
+import time
+import uuid
+import threading
+
+from sqlalchemy.exc import IntegrityError
+from flask_jwt_extended import create_refresh_token, decode_token
+from flask_jwt_extended.config import config
+
+from .models import db, RefreshToken, sweep_expired
+
+
+class RefreshTokenStore:
+    '''
+    Single use refresh tokens, grouped in families.
+
+    A login starts a family, and every refresh hands out a new refresh token
+    of the same family and marks the old one used. The access tokens carry
+    the family id too, so a logout burns the family even though the refresh
+    cookie is never sent outside /refresh. The family id travels in
+    the token claims, so a refresh is one conditional UPDATE on the jti
+    primary key plus one INSERT, in one transaction. A used (or unknown)
+    token coming back means it was copied: the whole family is burnt and
+    the client has to log in again.
+
+    Rows of expired tokens are deleted in batches every
+    REFRESH_SWEEP_SECONDS instead of on every request.
+    '''
+
+    def __init__(self, app=None):
+        self.sweep_seconds = 300
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.sweep_seconds = app.config.get('REFRESH_SWEEP_SECONDS', 300)
+        self._next_sweep = 0.0
+        app.extensions['refresh_tokens'] = self
+
+    def _create(self, identity, family):
+        token = create_refresh_token(identity=identity, user_claims={'fam': family})
+        claims = decode_token(token)
+        db.session.add(RefreshToken(jti=claims['jti'], family=family, expires_at=claims['exp']))
+        return token
+
+    @staticmethod
+    def new_family():
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def family_of(claims):
+        ''' the family id in the claims of a refresh or access token, or None '''
+        return (claims.get(config.user_claims_key) or {}).get('fam')
+
+    def issue(self, identity, family):
+        ''' the first refresh token of a new family '''
+        token = self._create(identity, family)
+        db.session.commit()
+        return token
+
+    def rotate(self, claims):
+        '''
+        Exchange the refresh token with these claims for a new one of the
+        same family, return (token, family), or None if it was already used
+        '''
+        self._sweep()
+        identity = claims[config.identity_claim_key]
+        family = self.family_of(claims)
+        if family is None:
+            # issued before rotation existed, exchange it once for a new family
+            db.session.add(RefreshToken(jti=claims['jti'], family='', expires_at=claims['exp'], used=True))
+            try:
+                db.session.flush()
+            except IntegrityError:
+                db.session.rollback()
+                return None
+            family = self.new_family()
+            token = self._create(identity, family)
+            db.session.commit()
+            return token, family
+
+        # the update only matches a token that was never exchanged
+        exchanged = RefreshToken.query.filter_by(jti=claims['jti'], used=False).update(
+            {'used': True}, synchronize_session=False)
+        if not exchanged:
+            db.session.rollback()
+            self.revoke_family(family)
+            return None
+        token = self._create(identity, family)
+        db.session.commit()
+        return token, family
+
+    def revoke_family(self, family):
+        ''' mark every token of the family used, so none of them refreshes again '''
+        RefreshToken.query.filter_by(family=family).update({'used': True}, synchronize_session=False)
+        db.session.commit()
+
+    def _sweep(self):
+        now = time.time()
+        if now < self._next_sweep:
+            return
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + self.sweep_seconds
+        sweep_expired(RefreshToken.expires_at, int(now))
+
+
+refresh_tokens = RefreshTokenStore()
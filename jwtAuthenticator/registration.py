@@ -0,0 +1,112 @@
+import time
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+from .bloom import BloomFilter
+from .models import db, User, hashing_pool, credential_cache
+
+
+class UsernameFilter:
+    '''
+    A per worker bloom filter of the taken usernames, warmed from the users
+    table on first use.
+
+    A name the filter has never seen is free as far as this worker knows,
+    so registration goes straight to hashing. A name it has seen is looked up
+    in the database first, so a duplicate never pays for bcrypt. Every
+    USERNAME_FILTER_SYNC_SECONDS the filter picks up the users the other
+    workers inserted (the ids above the highest one it has read), and the
+    unique index catches the few names taken in between.
+    '''
+
+    def __init__(self, app=None):
+        self.capacity = 1000000
+        self.error_rate = 0.01
+        self.sync_seconds = 5
+        self._filter = None
+        self._watermark = 0
+        self._next_sync = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.capacity = app.config.get('USERNAME_FILTER_CAPACITY', 1000000)
+        self.error_rate = app.config.get('USERNAME_FILTER_ERROR_RATE', 0.01)
+        self.sync_seconds = app.config.get('USERNAME_FILTER_SYNC_SECONDS', 5)
+        self._filter = None
+        self._next_sync = 0.0
+
+    def _warm(self):
+        # stream the usernames, never load the users
+        count = db.session.query(User.id).count()
+        self._filter = BloomFilter(max(self.capacity, 2 * count), self.error_rate)
+        self._watermark = 0
+        self._add_since_watermark()
+
+    def _add_since_watermark(self):
+        query = db.session.query(User.id, User.username).filter(User.id > self._watermark).order_by(User.id)
+        for user_id, username in query.yield_per(10000):
+            self._filter.add(username)
+            self._watermark = user_id
+
+    def _get(self):
+        now = time.time()
+        if self._filter is None or self._filter.full or now >= self._next_sync:
+            with self._lock:
+                if self._filter is None or self._filter.full:
+                    self._warm()
+                elif now >= self._next_sync:
+                    # the names the other workers registered since the last sync
+                    self._add_since_watermark()
+                self._next_sync = now + self.sync_seconds
+        return self._filter
+
+    def might_exist(self, username):
+        return username in self._get()
+
+    def add(self, username):
+        self._get().add(username)
+
+
+username_filter = UsernameFilter()
+
+
+def username_taken(username):
+    ''' check the filter, and the database only when the filter says maybe '''
+    if not username_filter.might_exist(username):
+        return False
+    return db.session.query(User.id).filter_by(username=username).first() is not None
+
+
+def insert_user(username, password_hash):
+    '''
+    Insert a user whose password is already hashed, return False if the
+    unique index says the name was taken meanwhile
+    '''
+    db.session.add(User(username=username, password_hash=password_hash))
+    # a recreated name must never be answered from the old password
+    credential_cache.invalidate(username)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # somebody registered the name between the check and the insert
+        db.session.rollback()
+        username_filter.add(username)
+        return False
+    username_filter.add(username)
+    return True
+
+
+def register_user(username, password):
+    '''
+    Create a user, return False if the username is taken.
+
+    The existence check comes before the password is hashed, so bcrypt only
+    runs for names that can be accepted, and the unique index has the last
+    word when two workers race for the same name.
+    '''
+    if username_taken(username):
+        return False
+    return insert_user(username, hashing_pool.generate(password))
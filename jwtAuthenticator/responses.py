@@ -0,0 +1,102 @@
+import json
+from types import MappingProxyType
+
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+# the fixed answers of the views, name -> (data, status)
+CONSTANT_RESPONSES = MappingProxyType({
+    'forbidden': ({'ok': False, 'message': 'forbidden'}, 403),
+    'not_found': ({'ok': False, 'message': 'not found'}, 404),
+    'bad_request': ({'ok': False, 'message': 'Bad Request'}, 400),
+    'bad_credentials': ({'ok': False, 'message': 'Bad Credentials'}, 400),
+    'invalid_credentials': ({'ok': False, 'message': 'Invalid Credentials'}, 400),
+    'duplicate_username': ({'ok': False, 'message': 'duplicate_username'}, 400),
+    'batch_too_large': ({'ok': False, 'message': 'batch too large'}, 400),
+    'invalid_cursor': ({'ok': False, 'message': 'invalid cursor'}, 400),
+    'refresh_reuse': ({'ok': False, 'message': 'Token has been revoked'}, 401),
+    'too_many_requests': ({'ok': False, 'message': 'too many requests'}, 429),
+    'busy': ({'ok': False, 'message': 'busy'}, 503),
+    'user_created': ({'ok': True, 'message': 'User Created'}, 200),
+    'refresh': ({'refresh': True}, 200),
+    'logout': ({'logout': True}, 200),
+    'home_get': ({'message': 'this is home in get'}, 200),
+    'home_post': ({'message': 'this is home in post'}, 200),
+})
+
+# the flask_jwt_extended errors with a fixed message, sent under JWT_ERROR_MESSAGE_KEY
+CONSTANT_JWT_ERRORS = MappingProxyType({
+    'token_expired': ('Token has expired', 401),
+    'token_revoked': ('Token has been revoked', 401),
+    'fresh_token_required': ('Fresh token required', 401),
+    'user_not_found': ('User not found', 401),
+})
+
+
+class JSONProvider:
+    '''
+    Serializes the json responses of the views.
+
+    JSON_PROVIDER picks the library: 'orjson', 'json', or 'auto' for orjson
+    when it is installed and the json module otherwise. The bodies of the
+    fixed answers are serialized once, when the app is created, so an error
+    path only wraps ready bytes in a response.
+    '''
+
+    def __init__(self, app=None):
+        self.name = 'json'
+        self.dumps = self._json_dumps
+        self._constants = MappingProxyType({})
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        name = app.config.get('JSON_PROVIDER') or 'auto'
+        if name == 'auto':
+            name = 'json' if orjson is None else 'orjson'
+        if name == 'orjson':
+            if orjson is None:
+                raise RuntimeError('JSON_PROVIDER orjson needs the orjson package')
+            self.dumps = orjson.dumps
+        elif name == 'json':
+            encoder = app.json_encoder
+            self.dumps = lambda data: self._json_dumps(data, encoder)
+        else:
+            raise RuntimeError('JSON_PROVIDER must be auto, orjson or json')
+        self.name = name
+
+        constants = {label: (self.dumps(data), status) for label, (data, status) in CONSTANT_RESPONSES.items()}
+        key = app.config.get('JWT_ERROR_MESSAGE_KEY', 'msg')
+        for label, (message, status) in CONSTANT_JWT_ERRORS.items():
+            constants[label] = (self.dumps({key: message}), status)
+        self._constants = MappingProxyType(constants)
+        app.extensions['json_provider'] = self
+
+    @staticmethod
+    def _json_dumps(data, encoder=None):
+        return json.dumps(data, separators=(',', ':'), cls=encoder).encode('utf-8')
+
+    def response(self, data, status=200):
+        ''' a json response of data, like jsonify but through the chosen library '''
+        return current_app.response_class(self.dumps(data), status=status, mimetype='application/json')
+
+    def constant(self, name):
+        ''' a new response around the prebuilt body of a fixed answer '''
+        body, status = self._constants[name]
+        return current_app.response_class(body, status=status, mimetype='application/json')
+
+
+json_provider = JSONProvider()
+
+
+def json_response(data, status=200):
+    return json_provider.response(data, status)
+
+
+def constant_response(name):
+    return json_provider.constant(name)
@@ -0,0 +1,134 @@
+import time
+import threading
+
+from jwt import InvalidTokenError
+from sqlalchemy.exc import IntegrityError
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+
+from .bloom import BloomFilter
+from .models import db, RevokedToken, sweep_expired
+from .token_cache import token_cache
+
+
+class Denylist:
+    '''
+    Revoked token ids, stored in the revoked_tokens table.
+
+    Every worker keeps a bloom filter of the revoked ids plus a small exact
+    set of the ids revoked since the filter was built, so the common case,
+    a token that was never revoked, is answered without touching the
+    database. Only a bloom filter hit is checked against the table.
+
+    Every DENYLIST_SYNC_SECONDS a worker picks up the revocations made by
+    the others, and every DENYLIST_SWEEP_SECONDS the rows of tokens that
+    have expired anyway are deleted in batches.
+    '''
+
+    def __init__(self, app=None):
+        self.sync_seconds = 5
+        self.sweep_seconds = 300
+        self.capacity = 100000
+        self.recent_max = 1000
+        self._bloom = None
+        self._recent = set()
+        self._watermark = 0
+        self._next_sync = 0.0
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.sync_seconds = app.config.get('DENYLIST_SYNC_SECONDS', 5)
+        self.sweep_seconds = app.config.get('DENYLIST_SWEEP_SECONDS', 300)
+        self.capacity = app.config.get('DENYLIST_CAPACITY', 100000)
+        self.recent_max = app.config.get('DENYLIST_RECENT_MAX', 1000)
+        self._bloom = None
+        self._recent = set()
+        self._next_sync = 0.0
+        self._next_sweep = 0.0
+        app.extensions['denylist'] = self
+
+    def _rebuild(self, now):
+        ''' a new bloom filter of every revoked token that has not expired '''
+        query = db.session.query(RevokedToken.jti).filter(RevokedToken.expires_at >= now)
+        bloom = BloomFilter(max(self.capacity, 2 * query.count()))
+        for (jti,) in query.yield_per(10000):
+            bloom.add(jti)
+        self._bloom = bloom
+        self._recent = set()
+        # overlap by a second so a revocation in the same second is never missed
+        self._watermark = int(now) - 1
+
+    def _sync(self):
+        now = time.time()
+        if now < self._next_sync and self._bloom is not None:
+            return
+        with self._lock:
+            if now < self._next_sync and self._bloom is not None:
+                return
+            if now >= self._next_sweep:
+                sweep_expired(RevokedToken.expires_at, int(now))
+                self._next_sweep = now + self.sweep_seconds
+            if self._bloom is None or self._bloom.full or len(self._recent) > self.recent_max:
+                self._rebuild(now)
+            else:
+                # the revocations other workers made since the last sync
+                query = db.session.query(RevokedToken.jti).filter(RevokedToken.revoked_at >= self._watermark)
+                self._recent.update(jti for (jti,) in query)
+                self._watermark = int(now) - 1
+            self._next_sync = now + self.sync_seconds
+
+    def sync_due(self):
+        ''' True when the next check has to read the table first '''
+        return self._bloom is None or time.time() >= self._next_sync
+
+    def revoked_in_memory(self, jti):
+        ''' True or False when memory is enough to tell, None when the table has to decide '''
+        if jti in self._recent:
+            return True
+        if jti not in self._bloom:
+            return False
+        return None
+
+    def is_revoked(self, jti):
+        self._sync()
+        revoked = self.revoked_in_memory(jti)
+        if revoked is not None:
+            return revoked
+        # a bloom filter hit may be a false positive, the table decides
+        return db.session.query(RevokedToken.jti).filter_by(jti=jti).first() is not None
+
+    def revoke(self, jti, expires_at):
+        ''' revoke a token id until expires_at (epoch seconds) '''
+        if not jti:
+            return
+        db.session.add(RevokedToken(jti=jti, expires_at=int(expires_at), revoked_at=int(time.time())))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # already revoked
+            db.session.rollback()
+        with self._lock:
+            self._recent.add(jti)
+
+    def revoke_token(self, encoded_token):
+        '''
+        Revoke an encoded token if it is one of ours and still valid, and
+        drop it from this worker's token cache. Returns the claims of the
+        revoked token, or None.
+        '''
+        if not encoded_token:
+            return None
+        try:
+            claims = decode_token(encoded_token)
+        except (InvalidTokenError, JWTExtendedException):
+            # forged or already expired, nothing to revoke
+            return None
+        self.revoke(claims.get('jti'), claims['exp'])
+        token_cache.discard(encoded_token)
+        return claims
+
+
+denylist = Denylist()
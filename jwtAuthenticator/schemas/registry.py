@@ -0,0 +1,63 @@
+import re
+from jsonschema import validators
+from jsonschema.exceptions import ValidationError
+
+from ..metrics import metrics
+
+
+class SchemaRegistry:
+    '''
+    Check and compile every json schema once and reuse the validators.
+
+    jsonschema.validate checks the schema, builds a new validator and hands
+    the "pattern" regexes to re on every call. Here the schema is checked
+    when it is registered, the validator is built once, and the patterns are
+    compiled up front and looked up by the "pattern" keyword.
+    '''
+
+    def __init__(self):
+        self._validators = {}
+        self._patterns = {}
+
+    def register(self, name, schema):
+        ''' check, compile and store a schema, raise SchemaError if it is invalid '''
+        validator_class = validators.validator_for(schema)
+        validator_class.check_schema(schema)
+        self._compile_patterns(schema)
+        compiled_class = validators.extend(validator_class, {'pattern': self._pattern})
+        self._validators[name] = compiled_class(schema)
+        return self._validators[name]
+
+    def _compile_patterns(self, schema):
+        # walk the schema and compile every pattern it contains
+        if isinstance(schema, dict):
+            for key, value in schema.items():
+                if key == 'pattern' and isinstance(value, str):
+                    self._patterns.setdefault(value, re.compile(value))
+                else:
+                    self._compile_patterns(value)
+        elif isinstance(schema, list):
+            for item in schema:
+                self._compile_patterns(item)
+
+    def _pattern(self, validator, pattern, instance, schema):
+        ''' the "pattern" keyword using the precompiled regexes '''
+        if not validator.is_type(instance, 'string'):
+            return
+        compiled = self._patterns.get(pattern)
+        if compiled is None:
+            compiled = self._patterns.setdefault(pattern, re.compile(pattern))
+        if not compiled.search(instance):
+            yield ValidationError('%r does not match %r' % (instance, pattern))
+
+    def first_error(self, name, data):
+        ''' return the first validation error or None, without collecting the rest '''
+        with metrics.phase('schema'):
+            return next(self._validators[name].iter_errors(data), None)
+
+    def is_valid(self, name, data):
+        return self.first_error(name, data) is None
+
+
+# the registry shared by all the schemas
+registry = SchemaRegistry()
@@ -1,5 +1,4 @@
-from jsonschema import validate
-from jsonschema.exceptions import ValidationError, SchemaError
+from jwtAuthenticator.schemas.registry import registry
 
 # define the tasks data
 tasks_schema = {
@@ -13,19 +12,17 @@ tasks_schema = {
     "additionalProperties": False
 }
 
+# compile the schema once at import
+registry.register('tasks', tasks_schema)
+
 def validate_task(data):
 
-    try:
-        # validate the task data with the above defined above
-        validate(data, tasks_schema)
+    # validate the task data with the schema defined above
+    error = registry.first_error('tasks', data)
 
-    except ValidationError as validate_error:
+    if error is not None:
         # if there was a validation error, return the error
-        return {'ok': False, 'message': validate_error, 'error': 'validation'}
-
-    except SchemaError as schema_error:
-        # if there was a schema error, return the error
-        return {'ok': False, 'message': schema_error, 'error': 'schema'}
+        return {'ok': False, 'message': error, 'error': 'validation'}
 
     # if everything was valid, return the data with validation confirmation
     return {'ok': True, 'tasks_data': data}
@@ -1,6 +1,5 @@
-# import the modules required for validating the user using json schema
-from jsonschema import validate
-from jsonschema.exceptions import ValidationError, SchemaError
+# import the registry that checks and compiles the schema once
+from jwtAuthenticator.schemas.registry import registry
 
 # define the user schema
 user_schema = {
@@ -13,7 +12,7 @@ user_schema = {
         },
         "password": {
             "type": "string",
-            "pattern": "^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[@$!%*?&])[A-Za-z\d@$!%*?&]{8,}$",
+            "pattern": r"^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[@$!%*?&])[A-Za-z\d@$!%*?&]{8,}$",
             "minLength": 8
         },
     },
@@ -21,17 +20,15 @@ user_schema = {
     "additionalProperties": False
 }
 
+# compile the schema at import, an invalid schema fails here instead of per request
+registry.register('user', user_schema)
+
 # validate the user based data based on the json schema
 def validate_user(data):
-    try:
-        # validate user data with the schema defined above
-        validate(data, user_schema)
-    except ValidationError as validate_error:
+    # stop at the first error, the callers only need to know the data is invalid
+    error = registry.first_error('user', data)
+    if error is not None:
         # if there was a validation error, return the error
-        return {'ok': False, 'message': validate_error, 'error': 'validation'}
-    except SchemaError as schema_error:
-        # if there was a schema error, return the error
-        return {'ok': False, 'message': schema_error, 'error': 'schema'}
+        return {'ok': False, 'message': error, 'error': 'validation'}
     # if everything was valid and good, return the data with validation confirmation
     return {'ok': True, 'user_data': data}
-
@@ -0,0 +1,242 @@
+import hmac
+from functools import wraps
+from calendar import timegm
+from datetime import datetime
+
+from flask import request
+try:
+    from flask import _app_ctx_stack as ctx_stack
+except ImportError:  # pragma: no cover
+    from flask import _request_ctx_stack as ctx_stack
+
+import jwt
+from flask_jwt_extended import verify_jwt_in_request, verify_fresh_jwt_in_request
+from flask_jwt_extended.config import config
+from flask_jwt_extended.exceptions import (
+    CSRFError, FreshTokenRequired, JWTExtendedException, RevokedTokenError, UserLoadError
+)
+from flask_jwt_extended.tokens import decode_jwt
+from flask_jwt_extended.utils import (
+    _get_jwt_manager,
+    get_raw_jwt, get_raw_jwt_header, has_user_loader, user_loader,
+    verify_token_claims, verify_token_not_blacklisted
+)
+
+from .cache import TTLCache
+
+
+class TokenCache:
+    '''
+    Per worker LRU of access tokens that already passed verification.
+
+    Entries are keyed by the token signature and expire at the token's own
+    exp claim, so a repeat validation skips the HMAC check and the json
+    decoding. The csrf double submit, freshness, revocation and the user
+    loader are still checked on every request.
+
+    The cached claims are shared between requests and must not be mutated.
+    '''
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self._cache = TTLCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('TOKEN_CACHE_ENABLED', False)
+        self._cache = TTLCache(maxsize=app.config.get('TOKEN_CACHE_SIZE', 4096))
+        app.extensions['token_cache'] = self
+
+    @staticmethod
+    def _key(encoded_token):
+        return encoded_token.rpartition('.')[2]
+
+    def get(self, encoded_token):
+        ''' return the (claims, header) of a verified token or None '''
+        entry = self._cache.get(self._key(encoded_token))
+        if entry is None:
+            return None
+        cached_token, jwt_data, jwt_header = entry
+        # the signature is the key, but the whole token has to match
+        if not hmac.compare_digest(cached_token, encoded_token):
+            return None
+        return jwt_data, jwt_header
+
+    def store(self, encoded_token, jwt_data, jwt_header):
+        if 'exp' not in jwt_data:
+            return
+        self._cache.set(self._key(encoded_token), (encoded_token, jwt_data, jwt_header),
+                        expires_at=jwt_data['exp'])
+
+    def discard(self, encoded_token):
+        ''' drop a token, used on logout and revocation '''
+        if encoded_token:
+            self._cache.pop(self._key(encoded_token))
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+token_cache = TokenCache()
+
+
+def check_csrf(jwt_data):
+    # the double submit value is per request, so it is never cached
+    if not config.csrf_protect or request.method not in config.csrf_request_methods:
+        return
+    csrf_value = request.headers.get(config.access_csrf_header_name, None)
+    if not csrf_value and config.csrf_check_form:
+        csrf_value = request.form.get(config.access_csrf_field_name, None)
+    if not csrf_value:
+        raise CSRFError("Missing CSRF token")
+    if not hmac.compare_digest(str(jwt_data.get('csrf', '')), csrf_value):
+        raise CSRFError("CSRF double submit tokens do not match")
+
+
+def is_fresh(jwt_data):
+    fresh = jwt_data.get('fresh', False)
+    if isinstance(fresh, bool):
+        return fresh
+    return fresh >= timegm(datetime.utcnow().utctimetuple())
+
+
+def _check_fresh(jwt_data):
+    if not is_fresh(jwt_data):
+        raise FreshTokenRequired('Fresh token required')
+
+
+def _load_user(identity):
+    if has_user_loader():
+        user = user_loader(identity)
+        if user is None:
+            raise UserLoadError("user_loader returned None for {}".format(identity))
+        ctx_stack.top.jwt_user = user
+
+
+def verify_cached_jwt_in_request(fresh=False):
+    '''
+    Same checks as verify_jwt_in_request (or verify_fresh_jwt_in_request),
+    answered from the token cache when the access cookie was seen before
+    '''
+    verify = verify_fresh_jwt_in_request if fresh else verify_jwt_in_request
+    if request.method in config.exempt_methods:
+        return
+    # the cache only knows about tokens sent in the access cookie
+    if not token_cache.enabled or list(config.token_location) != ['cookies']:
+        return verify()
+
+    encoded_token = request.cookies.get(config.access_cookie_name)
+    entry = token_cache.get(encoded_token) if encoded_token else None
+    if entry is None:
+        verify()
+        token_cache.store(encoded_token, get_raw_jwt(), get_raw_jwt_header())
+        return
+
+    jwt_data, jwt_header = entry
+    check_csrf(jwt_data)
+    verify_token_not_blacklisted(jwt_data, 'access')
+    ctx_stack.top.jwt = jwt_data
+    ctx_stack.top.jwt_header = jwt_header
+    if fresh:
+        _check_fresh(jwt_data)
+    verify_token_claims(jwt_data)
+    _load_user(jwt_data[config.identity_claim_key])
+
+
+def cached_jwt_required(fn):
+    ''' jwt_required backed by the token cache '''
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        verify_cached_jwt_in_request()
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def cached_fresh_jwt_required(fn):
+    ''' fresh_jwt_required backed by the token cache '''
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        verify_cached_jwt_in_request(fresh=True)
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def error_message(error):
+    ''' the message the single token endpoints answer a verification error with '''
+    if isinstance(error, jwt.ExpiredSignatureError):
+        return 'Token has expired'
+    if isinstance(error, RevokedTokenError):
+        return 'Token has been revoked'
+    return str(error) or error.__class__.__name__
+
+
+def decode_settings():
+    ''' the decode_jwt arguments of the current app '''
+    return {
+        'algorithms': config.decode_algorithms,
+        'identity_claim_key': config.identity_claim_key,
+        'user_claims_key': config.user_claims_key,
+        'audience': config.audience,
+        'issuer': config.decode_issuer,
+        'leeway': config.leeway,
+    }
+
+
+def verify_token(encoded_token, settings=None, keys=None):
+    '''
+    The claims of a valid access token, from the token cache when it was
+    verified before. Raises an InvalidTokenError or a JWTExtendedException.
+    settings and keys (decode keys by kid) can be shared between calls.
+    '''
+    if not isinstance(encoded_token, str):
+        raise jwt.InvalidTokenError('Token must be a string')
+    entry = token_cache.get(encoded_token) if token_cache.enabled else None
+    if entry is None:
+        settings = settings or decode_settings()
+        keys = {} if keys is None else keys
+        headers = jwt.get_unverified_header(encoded_token)
+        kid = headers.get('kid')
+        if kid not in keys:
+            # the decode key loader only looks at the headers
+            keys[kid] = _get_jwt_manager()._decode_key_callback({}, headers)
+        jwt_data = decode_jwt(encoded_token, keys[kid], **settings)
+        if jwt_data['type'] != 'access':
+            raise jwt.InvalidTokenError('Only access tokens are allowed')
+        if token_cache.enabled:
+            token_cache.store(encoded_token, jwt_data, headers)
+    else:
+        jwt_data = entry[0]
+    verify_token_not_blacklisted(jwt_data, 'access')
+    verify_token_claims(jwt_data)
+    if has_user_loader() and user_loader(jwt_data[config.identity_claim_key]) is None:
+        raise UserLoadError('User not found')
+    return jwt_data
+
+
+def verify_tokens(encoded_tokens):
+    '''
+    Verify a list of access tokens for the batch validation endpoint, one
+    result dict per token. The decoding settings are read and the key of
+    every kid is looked up once per batch.
+    '''
+    settings = decode_settings()
+    keys = {}
+    results = []
+    for index, encoded_token in enumerate(encoded_tokens):
+        try:
+            jwt_data = verify_token(encoded_token, settings, keys)
+        except (jwt.InvalidTokenError, JWTExtendedException) as error:
+            results.append({'index': index, 'is_valid': False, 'message': error_message(error)})
+            continue
+        results.append({
+            'index': index,
+            'is_valid': True,
+            'user': jwt_data[settings['identity_claim_key']],
+            'fresh': is_fresh(jwt_data),
+            'expires_at': jwt_data.get('exp'),
+        })
+    return results
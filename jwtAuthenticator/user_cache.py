@@ -0,0 +1,103 @@
+from collections import namedtuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .cache import TTLCache
+from .models import db, User
+
+# what the protected endpoints know of the current user, immutable so the
+# cached rows can be shared between requests
+CurrentUser = namedtuple('CurrentUser', ('id', 'username'))
+
+
+def user_key(identity):
+    ''' the cache key of a token identity: the user id of compact tokens, else the username '''
+    if isinstance(identity, dict):
+        return ('username', identity.get('username'))
+    # compact tokens carry the id as a string, the table has integers
+    if isinstance(identity, str) and identity.isdigit():
+        return ('id', int(identity))
+    return ('id', identity)
+
+
+class UserCache:
+    '''
+    Per worker LRU of the users behind the tokens, (id, username) only, used
+    as the user loader of the protected endpoints so the tokens of a deleted
+    user stop working without a query per request.
+
+    Entries are dropped as soon as a user is updated or deleted through the
+    session of this worker, and expire after USER_CACHE_TTL seconds, so the
+    changes made by other workers are seen within that time. Unknown users
+    are not cached.
+    '''
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self._cache = TTLCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('USER_CACHE_ENABLED', False)
+        self._cache = TTLCache(
+            maxsize=app.config.get('USER_CACHE_SIZE', 4096),
+            ttl=app.config.get('USER_CACHE_TTL', 30)
+        )
+        app.extensions['user_cache'] = self
+
+    def load(self, identity):
+        ''' the CurrentUser of a token identity, None when there is no such user '''
+        key = user_key(identity)
+        if self.enabled:
+            user = self._cache.get(key)
+            if user is not None:
+                return user
+        column = User.id if key[0] == 'id' else User.username
+        row = db.session.query(User.id, User.username).filter(column == key[1]).first()
+        if row is None:
+            return None
+        user = CurrentUser(row.id, row.username)
+        if self.enabled:
+            self._cache.set(key, user)
+        return user
+
+    def cached(self, identity):
+        ''' whether load(identity) is answered without the database '''
+        return self.enabled and user_key(identity) in self._cache
+
+    def forget(self, user_id, username):
+        self._cache.pop(('id', user_id))
+        self._cache.pop(('username', username))
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def forget_user(mapper, connection, target):
+    user_cache.forget(target.id, target.username)
+    # a renamed user is cached under the old name too
+    for username in inspect(target).attrs.username.history.deleted:
+        user_cache.forget(target.id, username)
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def forget_users(context):
+    # query updates and deletes do not say which rows they touched
+    if context.mapper.class_ is not User:
+        return
+    values = getattr(context, 'values', None)
+    if values is not None and not {getattr(name, 'key', name) for name in values} & {'id', 'username'}:
+        # a new password hash changes nothing the cache holds
+        return
+    user_cache.clear()
@@ -1,35 +1,191 @@
 import functools
 import json
+import time
+import base64
+import binascii
 from jwtAuthenticator.schemas.schema_user import validate_user
-from jwtAuthenticator.models import db
+from jwtAuthenticator.models import db, hashing_pool
 from jwtAuthenticator.models import User
+from sqlalchemy.exc import IntegrityError
+from jwtAuthenticator.keys import keyring
+from jwtAuthenticator.registration import register_user, username_filter
+from jwtAuthenticator.revocation import denylist
+from jwtAuthenticator.refresh_tokens import refresh_tokens
+from jwtAuthenticator.ratelimit import rate_limited
+from jwtAuthenticator.metrics import metrics
+from jwtAuthenticator.claims import encode_compact_token
+from jwtAuthenticator.responses import json_response, constant_response
+from jwtAuthenticator.user_cache import user_cache, user_key
+from jwtAuthenticator.token_cache import (
+    cached_jwt_required, cached_fresh_jwt_required, verify_tokens, verify_token,
+    check_csrf, is_fresh, error_message
+)
 from flask.views import MethodView
+from jwt import InvalidTokenError
+from flask_jwt_extended.exceptions import JWTExtendedException
 
 from flask_jwt_extended import (
     JWTManager,
     create_access_token,
-    create_refresh_token,
-    jwt_required,
+    decode_token,
     jwt_refresh_token_required,
     get_jwt_identity,
-    fresh_jwt_required,
+    get_raw_jwt,
     set_access_cookies,
     set_refresh_cookies,
     unset_jwt_cookies
 )
 
+from flask_jwt_extended.config import config as jwt_config
+
 from flask import (
-    request, jsonify
+    request, current_app, Response, stream_with_context
 )
 
-jwt = JWTManager()
+class InstrumentedJWTManager(JWTManager):
+    '''
+    A JWTManager that times token signing as the jwt_sign phase.
+
+    With JWT_COMPACT_CLAIMS the tokens are written by encode_compact_token,
+    with the user id in sub and short claim names. Claims returned by the
+    additional_claims_loader callback go at the top level of compact tokens,
+    and in the user claims of the others, in access tokens (and refresh
+    tokens too with JWT_CLAIMS_IN_REFRESH_TOKEN, like the user claims).
+    '''
+
+    def __init__(self, app=None):
+        self.compact = False
+        self._additional_claims_callback = None
+        super().__init__(app)
+
+    def init_app(self, app):
+        self.compact = app.config.get('JWT_COMPACT_CLAIMS', False)
+        if self.compact:
+            app.config.setdefault('JWT_IDENTITY_CLAIM', 'sub')
+            app.config.setdefault('JWT_USER_CLAIMS', 'uc')
+        super().init_app(app)
+
+    def additional_claims_loader(self, callback):
+        ''' callback(identity) returns a dict of claims to add to every token '''
+        self._additional_claims_callback = callback
+        return callback
+
+    def _additional_claims(self, identity):
+        if self._additional_claims_callback is None:
+            return None
+        return self._additional_claims_callback(identity)
+
+    def _with_additional_claims(self, identity, user_claims):
+        additional = self._additional_claims(identity)
+        if not additional:
+            return user_claims
+        if user_claims is None:
+            user_claims = self._user_claims_callback(identity)
+        return dict(user_claims or {}, **additional)
+
+    def _create_compact(self, identity, token_type, expires_delta, fresh, user_claims, additional, headers):
+        # the callbacks run in the order of JWTManager, the keyring relies on it
+        if headers is None:
+            headers = self._jwt_additional_header_callback(identity)
+        return encode_compact_token(
+            identity=self._user_identity_callback(identity),
+            token_type=token_type,
+            secret=self._encode_key_callback(identity),
+            expires_delta=expires_delta,
+            fresh=fresh,
+            user_claims=user_claims,
+            additional_claims=additional,
+            headers=headers,
+        )
+
+    def _create_access_token(self, identity, fresh=False, expires_delta=None, user_claims=None, headers=None):
+        with metrics.phase('jwt_sign'):
+            if not self.compact:
+                user_claims = self._with_additional_claims(identity, user_claims)
+                return super()._create_access_token(identity, fresh, expires_delta, user_claims, headers)
+            if expires_delta is None:
+                expires_delta = jwt_config.access_expires
+            if user_claims is None:
+                user_claims = self._user_claims_callback(identity)
+            additional = self._additional_claims(identity)
+            return self._create_compact(identity, 'access', expires_delta, fresh, user_claims, additional, headers)
+
+    def _create_refresh_token(self, identity, expires_delta=None, user_claims=None, headers=None):
+        with metrics.phase('jwt_sign'):
+            with_claims = jwt_config.user_claims_in_refresh_token
+            if not self.compact:
+                if with_claims:
+                    user_claims = self._with_additional_claims(identity, user_claims)
+                return super()._create_refresh_token(identity, expires_delta, user_claims, headers)
+            if expires_delta is None:
+                expires_delta = jwt_config.refresh_expires
+            if user_claims is None and with_claims:
+                user_claims = self._user_claims_callback(identity)
+            additional = self._additional_claims(identity) if with_claims else None
+            return self._create_compact(identity, 'refresh', expires_delta, False, user_claims, additional, headers)
+
+
+jwt = InstrumentedJWTManager()
+
+
+# put the key id in the token headers so consumers can pick the key from the jwks
+@jwt.additional_headers_loader
+def add_key_id(identity):
+    return keyring.headers()
+
+# sign with the current key of the keyring
+@jwt.encode_key_loader
+def encode_key(identity):
+    return keyring.encode_key()
+
+# verify with the key named by the kid header
+@jwt.decode_key_loader
+def decode_key(claims, headers):
+    return keyring.decode_key(headers)
+
+# refuse revoked tokens, answered from memory unless the bloom filter hits
+@jwt.token_in_blacklist_loader
+def check_if_token_revoked(decoded_token):
+    return denylist.is_revoked(decoded_token['jti'])
+
+# the user behind the token, for get_current_user(), from the user cache;
+# the tokens of a deleted user are refused
+@jwt.user_loader_callback_loader
+def load_user(identity):
+    return user_cache.load(identity)
+
+@jwt.user_loader_error_loader
+def user_not_found(identity):
+    return constant_response('user_not_found')
+
+# the token errors every protected endpoint can answer with, through the
+# json provider, the fixed ones from prebuilt bodies
+@jwt.expired_token_loader
+def expired_token(jwt_data):
+    return constant_response('token_expired')
+
+@jwt.revoked_token_loader
+def revoked_token():
+    return constant_response('token_revoked')
+
+@jwt.needs_fresh_token_loader
+def fresh_token_required():
+    return constant_response('fresh_token_required')
+
+@jwt.invalid_token_loader
+def invalid_token(error_string):
+    return json_response({jwt_config.error_msg_key: error_string}, 422)
+
+@jwt.unauthorized_loader
+def unauthorized(error_string):
+    return json_response({jwt_config.error_msg_key: error_string}, 401)
 
 
 # registration endpoint
 class RegisterAPI(MethodView):
 
     def get(self):
-        return jsonify({'ok': False, 'message': 'forbidden'}), 403
+        return constant_response('forbidden')
 
     def post(self):
         ''' user registration endpoint '''
@@ -40,22 +196,20 @@ class RegisterAPI(MethodView):
             # get the user data
             user_data = data['user_data']
 
-            # create a new user and save it in the database
-            newUser = User(username=user_data['username'], password=user_data['password'])
-
-            # if the User with the given username already exists
-            if (User.query.filter_by(username=user_data['username']).first()):
+            # create a new user and save it in the database, the password is
+            # only hashed once the username is known to be free
+            if not register_user(user_data['username'], user_data['password']):
                 # send the username already exists in the json response
-                return jsonify({'ok': False, 'message': 'duplicate_username'}), 400
+                metrics.outcome('duplicate_username')
+                return constant_response('duplicate_username')
 
-            # add the user in the database
-            db.session.add(newUser)
-            db.session.commit()
             # send the reponse with a message indicating a successful registration
-            return jsonify({'ok': True, 'message': 'User Created'}), 200
+            metrics.outcome('user_created')
+            return constant_response('user_created')
 
         # validation did not succeed
         else:
+            metrics.outcome('invalid_request')
 
             if data['error'] == 'validation':
                 #message = ""
@@ -66,18 +220,133 @@ class RegisterAPI(MethodView):
                 #    message = "Password must be atleast 8 characters in length "
                 #    message += "and must contain a capital letter, a small letter, "
                 #    message += "a number and a special character"
-                return jsonify({'ok': False, 'message': "Invalid Credentials"}), 400
+                return constant_response('invalid_credentials')
 
             # send the response with a message indicating a bad request
-            return jsonify({'ok': False, 'message': "Bad Credentials"}), 400
+            return constant_response('bad_credentials')
+
+
+# batch registration endpoint
+class RegisterBatchAPI(MethodView):
+    ''' register many users in one request and one transaction '''
+
+    def get(self):
+        return constant_response('forbidden')
+
+    def post(self):
+        ''' takes a json array of users, answers with a result per user '''
+        users = request.get_json(silent=True)
+        if not isinstance(users, list):
+            return constant_response('bad_request')
+        if len(users) > current_app.config['REGISTER_BATCH_MAX']:
+            return constant_response('batch_too_large')
+
+        results = [None] * len(users)
+        accepted = {}
+        for index, user in enumerate(users):
+            data = validate_user(user)
+            if not data['ok']:
+                results[index] = {'index': index, 'ok': False, 'message': 'Invalid Credentials'}
+            elif data['user_data']['username'] in accepted:
+                # the same username twice in one batch, the first one wins
+                results[index] = {'index': index, 'ok': False, 'message': 'duplicate_username'}
+            else:
+                accepted[data['user_data']['username']] = index
+
+        # find the usernames that are already taken with IN queries
+        # (chunked to stay under the sqlite bound parameter limit); every
+        # name is looked up, the username filter of this worker can miss
+        # names other workers took, and one of those in the bulk insert
+        # would send the whole batch down the row by row path
+        names = list(accepted)
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            for (username,) in db.session.query(User.username).filter(User.username.in_(chunk)):
+                index = accepted.pop(username)
+                results[index] = {'index': index, 'ok': False, 'message': 'duplicate_username'}
+
+        # only the new users are hashed, spread over the hashing pool
+        indexes = list(accepted.values())
+        hashes = hashing_pool.generate_many([users[index]['password'] for index in indexes])
+        rows = [{'username': users[index]['username'], 'password_hash': pw_hash}
+                for index, pw_hash in zip(indexes, hashes)]
+
+        try:
+            # a single bulk insert in a single transaction
+            if rows:
+                db.session.execute(User.__table__.insert(), rows)
+            db.session.commit()
+            created = set(indexes)
+        except IntegrityError:
+            # another request took some of the names meanwhile, insert one
+            # by one so only the losing rows fail
+            db.session.rollback()
+            created = set()
+            for index, row in zip(indexes, rows):
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(User.__table__.insert(), row)
+                    created.add(index)
+                except IntegrityError:
+                    username_filter.add(row['username'])
+                    results[index] = {'index': index, 'ok': False, 'message': 'duplicate_username'}
+            db.session.commit()
+
+        for index in created:
+            username_filter.add(users[index]['username'])
+            results[index] = {'index': index, 'ok': True, 'message': 'User Created'}
+        metrics.inc('auth_outcomes_total', len(created), outcome='user_created')
+        return json_response({'ok': True, 'created': len(created), 'results': results})
+
+
+def token_identity(user_data, user_id):
+    '''
+    the identity of the tokens, the user id with compact claims and the user
+    data otherwise; sub must be a string (RFC 7519), so the id is one too
+    '''
+    return str(user_id) if jwt.compact else user_data
+
+
+def session_family(identity):
+    ''' the refresh family of the valid access cookie of the same user, or None '''
+    encoded_token = request.cookies.get(jwt_config.access_cookie_name)
+    if not encoded_token:
+        return None
+    try:
+        claims = decode_token(encoded_token)
+    except (InvalidTokenError, JWTExtendedException):
+        return None
+    if user_key(claims[jwt_config.identity_claim_key]) != user_key(identity):
+        return None
+    return refresh_tokens.family_of(claims)
+
+
+def login_response(user_data, user_id):
+    ''' the tokens and cookies of a successful login, user_data without the password '''
+    metrics.outcome('login')
+    identity = token_identity(user_data, user_id)
+    # the refresh token starts a new rotation family, the access token
+    # names it so logout can burn the family
+    family = refresh_tokens.new_family()
+    access_token = create_access_token(identity=identity, fresh=True, user_claims={'fam': family})
+    refresh_token = refresh_tokens.issue(identity, family)
+    #user_data['access_token'] = access_token
+    #user_data['refresh_token'] = refresh_token
+    user_data['login'] = True
+    resp = json_response(user_data)
+    set_access_cookies(resp, access_token)
+    set_refresh_cookies(resp, refresh_token)
+    return resp, 200
 
 
 # authentication endpoint
 class AuthenticateAPI(MethodView):
 
     def get(self):
-        return jsonify({'ok': False, 'message': 'forbidden'}), 403
+        return constant_response('forbidden')
 
+    # credential stuffing is cut off before any validation or bcrypt
+    @rate_limited
     def post(self):
         ''' user authentication endpoint '''
 
@@ -98,27 +367,20 @@ class AuthenticateAPI(MethodView):
 
                 # remove the password from the userdata
                 del user_data['password']
-                # create the access token
-                access_token = create_access_token(identity=user_data, fresh=True)
-                refresh_token = create_refresh_token(identity=user_data)
-                #user_data['access_token'] = access_token
-                #user_data['refresh_token'] = refresh_token
-                user_data['login'] = True
-                resp = jsonify(user_data)
-                set_access_cookies(resp, access_token)
-                set_refresh_cookies(resp, refresh_token)
-                return resp, 200
+                return login_response(user_data, user.id)
 
             else:
                 # the user does not exist or the password is not valid, return invalid credentials
-                return jsonify({'ok': False, 'message': 'Invalid Credentials'}), 400
+                metrics.outcome('invalid_credentials')
+                return constant_response('invalid_credentials')
         else:
+            metrics.outcome('invalid_request')
 
             if data['error'] == 'validation':
-                return jsonify({'ok': False, 'message': 'Invalid Credentials'}), 400
+                return constant_response('invalid_credentials')
 
             # the user does not exist or the password is not valid, return invalid credentials
-            return jsonify({'ok': False, 'message': 'Bad Request'}), 400
+            return constant_response('bad_request')
 
 
 # recreate accessToken
@@ -127,20 +389,33 @@ class RefreshAPI(MethodView):
 
     # get not allowed
     def get(self):
-        return jsonify({'ok': False, 'message': 'forbidden'}), 403
+        return constant_response('forbidden')
 
     # the refresh token is required to access this url
     @jwt_refresh_token_required
     def post(self):
         ''' access token refresh endpoint '''
+        # exchange the refresh token for the next one of its family
+        rotated = refresh_tokens.rotate(get_raw_jwt())
+        if rotated is None:
+            # the refresh token was already used, it has been copied
+            metrics.outcome('refresh_reuse')
+            resp = constant_response('refresh_reuse')
+            unset_jwt_cookies(resp)
+            return resp
+
+        refresh_token, family = rotated
+
         # get the current user
         current_user = get_jwt_identity()
         # create a new token
-        access_token = create_access_token(identity=current_user, fresh=False)
+        access_token = create_access_token(identity=current_user, fresh=False, user_claims={'fam': family})
 
         # response
-        resp = jsonify({'refresh': True})
+        metrics.outcome('refresh')
+        resp = constant_response('refresh')
         set_access_cookies(resp, access_token)
+        set_refresh_cookies(resp, refresh_token)
 
         # return the access_token in refresh token
         return resp, 200
@@ -150,8 +425,10 @@ class FreshLogin(MethodView):
     ''' view to create fresh access tokens '''
     
     def get(self):
-        return jsonify({'ok': False, 'message': 'forbidden'}), 403
+        return constant_response('forbidden')
 
+    # credential stuffing is cut off before any validation or bcrypt
+    @rate_limited
     def post(self):
         ''' user authentication endpoint '''
 
@@ -175,51 +452,145 @@ class FreshLogin(MethodView):
 
                 #user_data['access_token'] = access_token
                 user_data['fresh_login'] = True
+                metrics.outcome('fresh_login')
 
                 # create the access token
-                access_token = create_access_token(identity=user_data, fresh=True)
+                identity = token_identity(user_data, user.id)
+                # stay in the refresh family of the session, if there is one
+                family = session_family(identity)
+                access_token = create_access_token(identity=identity, fresh=True,
+                                                   user_claims={'fam': family} if family else None)
 
                 # create a response
-                resp = jsonify(user_data)
+                resp = json_response(user_data)
                 set_access_cookies(resp, access_token)
 
                 return resp, 200
 
             else:
                 # the user does not exist or the password is not valid, return invalid credentials
-                return jsonify({'ok': False, 'message': 'Invalid Credentials'}), 400
+                metrics.outcome('invalid_credentials')
+                return constant_response('invalid_credentials')
 
 
 class ValidateToken(MethodView):
     ''' token validation endpoint '''
 
-    # validate the token
-    @jwt_required
+    # validate the token, repeat validations are answered from the token cache
+    @cached_jwt_required
     def get(self):
         current_user = get_jwt_identity()
-        return jsonify({"ok": True, 'is_valid': True, 'user': current_user}), 200
+        return json_response({'ok': True, 'is_valid': True, 'user': current_user})
 
     # not implemented
-    @jwt_required
+    @cached_jwt_required
     def post(self):
         #current_user = get_jwt_identity()
         #return jsonify({"ok": True, 'message': 'The token is valid', 'user': current_user}), 200
         current_user = get_jwt_identity()
-        return jsonify({"ok": True, 'is_valid': True, 'user': current_user}), 200
+        return json_response({'ok': True, 'is_valid': True, 'user': current_user})
+
+class ValidateTokenBatch(MethodView):
+    ''' validate many tokens in one request, for api gateways '''
+
+    def get(self):
+        return constant_response('forbidden')
+
+    def post(self):
+        ''' takes a json array of access tokens, answers with a result per token '''
+        tokens = request.get_json(silent=True)
+        if not isinstance(tokens, list):
+            return constant_response('bad_request')
+        if len(tokens) > current_app.config['VALIDATE_BATCH_MAX']:
+            return constant_response('batch_too_large')
+        return json_response({'ok': True, 'results': verify_tokens(tokens)})
+
+def request_token():
+    ''' the access token of the request and whether it came in the cookie '''
+    encoded_token = request.cookies.get(jwt_config.access_cookie_name)
+    if encoded_token:
+        return encoded_token, True
+    header = request.headers.get(jwt_config.header_name, '')
+    prefix = jwt_config.header_type + ' ' if jwt_config.header_type else ''
+    if header.startswith(prefix) and len(header) > len(prefix):
+        return header[len(prefix):], False
+    return None, False
+
+class AuthRequest(MethodView):
+    '''
+    Header only token validation for the nginx auth_request module. Answers
+    204 with the identity and expiry in headers, or 401, and tells nginx how
+    long the answer may be cached for that token.
+    '''
+
+    # nginx asks with the method of the protected request and lets any 2xx
+    # through, so flask must never answer OPTIONS on its own
+    provide_automatic_options = False
+
+    def get(self):
+        encoded_token, from_cookie = request_token()
+        if encoded_token is None:
+            return self.denied('Missing access token')
+        try:
+            jwt_data = verify_token(encoded_token)
+            # nginx forwards the method of the protected request
+            if from_cookie:
+                check_csrf(jwt_data)
+        except (InvalidTokenError, JWTExtendedException) as error:
+            return self.denied(error_message(error))
+
+        identity = jwt_data[jwt_config.identity_claim_key]
+        fresh = is_fresh(jwt_data)
+        if not isinstance(identity, str):
+            identity = json.dumps(identity, separators=(',', ':'))
+        resp = self.empty_response(204)
+        resp.headers['X-Auth-User'] = identity
+        resp.headers['X-Auth-Expires'] = str(jwt_data['exp'])
+        resp.headers['X-Auth-Fresh'] = 'true' if fresh else 'false'
+
+        # cache until the token expires or stops being fresh, capped so a
+        # revoked token is not let through for long
+        now = int(time.time())
+        max_age = min(jwt_data['exp'] - now, current_app.config['AUTH_REQUEST_MAX_AGE'])
+        if fresh and not isinstance(jwt_data['fresh'], bool):
+            max_age = min(max_age, jwt_data['fresh'] - now)
+        if max_age > 0:
+            resp.cache_control.max_age = max_age
+        else:
+            resp.cache_control.no_store = True
+        return resp
+
+    # the protected request can use any method
+    post = put = patch = delete = options = get
+
+    @staticmethod
+    def empty_response(status):
+        # no body, so no content type either
+        resp = Response(status=status)
+        del resp.headers['Content-Type']
+        return resp
+
+    @classmethod
+    def denied(cls, message):
+        resp = cls.empty_response(401)
+        resp.headers['WWW-Authenticate'] = 'Bearer error="invalid_token"'
+        resp.headers['X-Auth-Error'] = message
+        resp.cache_control.no_store = True
+        return resp
 
 class ValidateFreshToken(MethodView):
     ''' fresh token validation '''
 
     # validate the token and verify it is fresh
-    @fresh_jwt_required
+    @cached_fresh_jwt_required
     def get(self):
         current_user = get_jwt_identity()
-        return jsonify({"ok": True, 'is_valid': True, 'user': current_user}), 200
+        return json_response({'ok': True, 'is_valid': True, 'user': current_user})
 
-    @fresh_jwt_required
+    @cached_fresh_jwt_required
     def post(self):
         current_user = get_jwt_identity()
-        return jsonify({"ok": True, 'is_valid': True, 'user': current_user}), 200
+        return json_response({'ok': True, 'is_valid': True, 'user': current_user})
 
 
 class LogoutAPI(MethodView):
@@ -227,30 +598,116 @@ class LogoutAPI(MethodView):
 
     # remove the tokens from cookies
     def get(self):
-        return jsonify({'ok': False, 'message': 'forbidden'}), 403
+        return constant_response('forbidden')
 
     def post(self):
-        resp = jsonify({'logout': True})
+        # revoke the tokens sent with the request, so a copied token stops
+        # working too, and forget them in this worker's token cache
+        for cookie_name in (jwt_config.access_cookie_name, jwt_config.refresh_cookie_name):
+            claims = denylist.revoke_token(request.cookies.get(cookie_name))
+            # the refresh cookie only goes to /refresh, the access token
+            # names the family of the session, burn it so no refresh token
+            # of this login mints access tokens anymore
+            family = claims and refresh_tokens.family_of(claims)
+            if family:
+                refresh_tokens.revoke_family(family)
+        metrics.outcome('logout')
+        resp = constant_response('logout')
         # remove the cookies from the response
         unset_jwt_cookies(resp)
         return resp, 200
 
+def encode_cursor(username, user_id):
+    ''' an opaque cursor pointing just after the given row '''
+    raw = json.dumps([username, user_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor):
+    ''' the (username, id) key from a cursor, raise ValueError if it is not one of ours '''
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        username, user_id = json.loads(raw.decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError('invalid cursor')
+    if not isinstance(username, str) or not isinstance(user_id, int):
+        raise ValueError('invalid cursor')
+    return username, user_id
+
+
+def export_users(batch_size):
+    ''' every user as one json line, read from the database a batch at a time '''
+    after = None
+    while True:
+        rows = User.page(after, batch_size)
+        for row in rows:
+            yield json.dumps({'id': row.id, 'username': row.username}, separators=(',', ':')) + '\n'
+        if len(rows) < batch_size:
+            break
+        after = (rows[-1].username, rows[-1].id)
+
+
 class GetUsers(MethodView):
-    
+    ''' users ordered by username, one page at a time, or all of them as ndjson '''
+
     def get(self):
-        all_users = User.query.order_by(User.username).all()
-        #return jsonify({'ok': True, 'data': all_users}), 200
-        json_encodeable_users = [a_user.as_dict() for a_user in all_users]
-        return jsonify({'ok': True, 'data': json_encodeable_users}, 200)
+        # stream the whole table when the client asks for ndjson
+        if request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson':
+            batch_size = current_app.config['USERS_EXPORT_BATCH_SIZE']
+            resp = Response(stream_with_context(export_users(batch_size)), mimetype='application/x-ndjson')
+            # tell nginx to pass the lines on as they come instead of buffering them
+            resp.headers['X-Accel-Buffering'] = 'no'
+            return resp
+
+        # the page size, bounded so one request can't pull the whole table
+        limit = request.args.get('limit', current_app.config['USERS_PAGE_SIZE'], type=int)
+        limit = max(1, min(limit, current_app.config['USERS_PAGE_MAX']))
+
+        # the page starts after the row the cursor points at
+        cursor = request.args.get('cursor')
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            return constant_response('invalid_cursor')
+
+        # fetch one extra row to know if there is a next page
+        rows = User.page(after, limit + 1)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].username, rows[-1].id)
+
+        users = [{'id': row.id, 'username': row.username} for row in rows]
+        return json_response({'ok': True, 'data': users, 'next': next_cursor})
+
+class JWKSAPI(MethodView):
+    ''' the public signing keys, so services can verify tokens locally '''
+
+    def get(self):
+        # the document is built once when the app is created
+        if keyring.jwks_etag in request.if_none_match:
+            resp = Response(status=304)
+        else:
+            resp = Response(keyring.jwks_body, mimetype='application/json')
+        resp.set_etag(keyring.jwks_etag)
+        resp.cache_control.public = True
+        resp.cache_control.max_age = current_app.config.get('JWKS_MAX_AGE', 3600)
+        return resp
+
+class MetricsAPI(MethodView):
+    ''' the Prometheus metrics of every worker '''
+
+    def get(self):
+        if not metrics.enabled:
+            return constant_response('not_found')
+        return metrics.response()
 
 #TODO: This is just a test
 class Home(MethodView):
     ''' This is just to test frontend '''
 
     def get(self):
-        resp = jsonify({'message': "this is home in get"})
-        return resp, 200
+        return constant_response('home_get')
 
     def post(self):
-        resp = jsonify({'message': "this is home in post"})
-        return resp, 200
+        return constant_response('home_post')
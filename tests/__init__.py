@@ -1,3 +1,6 @@
+import json
+import unittest
+
 import click
 from flask.cli import with_appcontext
 
@@ -11,3 +14,37 @@ def test():
 
 def test_init_app(app):
     app.cli.add_command(test)
+
+
+class LoggedInTestCase(unittest.TestCase):
+    ''' base of the tests that start with a registered and logged in user '''
+
+    def setUp(self):
+        '''
+        Create an app with testing config, register and log a user in
+        '''
+        from jwtAuthenticator import create_app
+        from jwtAuthenticator.models import db
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client(use_cookies=True)
+        self.credentials = json.dumps({'username': 'test', 'password': 'Password123@'})
+        self.client.post('/register', content_type='application/json', data=self.credentials)
+        self.client.post('/login', content_type='application/json', data=self.credentials)
+
+    def tearDown(self):
+        '''
+        Remove the session, drop the tables and pop the app context
+        '''
+        from jwtAuthenticator.models import db
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    # get the value of a cookie stored in the test client
+    def get_cookie(self, cookie_name):
+        for cookie in self.client.cookie_jar:
+            if cookie.name == cookie_name:
+                return cookie.value
@@ -0,0 +1,46 @@
+import os
+import unittest
+from unittest import mock
+from jwtAuthenticator import create_app, after_fork, after_fork_on_first_request
+from jwtAuthenticator.models import db
+
+class AppFactoryTestCase(unittest.TestCase):
+
+    def test_migrate_only_from_the_cli(self):
+        '''
+        Test that the migration command is only set up for "flask db"
+        '''
+        with mock.patch.dict(os.environ):
+            os.environ.pop('FLASK_RUN_FROM_CLI', None)
+            self.assertNotIn('migrate', create_app('testing').extensions)
+            os.environ['FLASK_RUN_FROM_CLI'] = 'true'
+            self.assertIn('migrate', create_app('testing').extensions)
+
+    def test_after_fork_drops_connections(self):
+        '''
+        Test that the connections opened before a fork are not reused after it
+        '''
+        app = create_app('testing')
+        with app.app_context():
+            engine = db.engine
+            with engine.connect():
+                pass
+            self.assertEqual(engine.pool.checkedin(), 1)
+        after_fork(app)
+        self.assertEqual(engine.pool.checkedin(), 0)
+
+    def test_after_fork_on_first_request_of_a_worker(self):
+        '''
+        Test that the first request of a forked worker resets it, and nothing else does
+        '''
+        app = create_app('testing')
+        after_fork_on_first_request(app)
+        client = app.test_client()
+        with mock.patch('jwtAuthenticator.after_fork') as reset:
+            # the process that built the app is not a worker
+            client.get('/home')
+            reset.assert_not_called()
+            with mock.patch('os.getpid', return_value=os.getpid() + 1):
+                client.get('/home')
+                client.get('/home')
+            reset.assert_called_once_with(app)
@@ -0,0 +1,122 @@
+import unittest
+import json
+import asyncio
+import bcrypt
+from http.cookies import SimpleCookie
+from jwtAuthenticator import create_app
+from jwtAuthenticator.asgi import AsyncAuthApp
+from jwtAuthenticator.models import db, User
+
+class AsgiTestCase(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        Create an app with testing config and put the ASGI app in front of it
+        '''
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.asgi = AsyncAuthApp(self.app, threads=2)
+        self.cookies = {}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    async def call(self, method, path, data=None, headers=()):
+        ''' one request through the ASGI app, keeping the cookies like a browser '''
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        raw_headers = [(b'content-type', b'application/json')] + [
+            (name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        if self.cookies:
+            cookie = '; '.join('%s=%s' % item for item in self.cookies.items())
+            raw_headers.append((b'cookie', cookie.encode('latin-1')))
+        scope = {
+            'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+            'headers': raw_headers, 'client': ('127.0.0.1', 5000), 'server': ('localhost', 80),
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await self.asgi(scope, receive, send)
+        headers = [(name.decode('latin-1'), value.decode('latin-1')) for name, value in sent[0]['headers']]
+        for name, value in headers:
+            if name == 'set-cookie':
+                for morsel in SimpleCookie(value).values():
+                    if morsel.value:
+                        self.cookies[morsel.key] = morsel.value
+                    else:
+                        self.cookies.pop(morsel.key, None)
+        return sent[0]['status'], dict(headers), b''.join(message.get('body', b'') for message in sent[1:])
+
+    def request(self, *args, **kwargs):
+        return asyncio.run(self.call(*args, **kwargs))
+
+    def test_register_login_validate_refresh(self):
+        '''
+        Test the native endpoints end to end
+        '''
+        credentials = {'username': 'test', 'password': 'Password123@'}
+        status, _, body = self.request('POST', '/register', credentials)
+        self.assertEqual(status, 200)
+        self.assertTrue(json.loads(body)['ok'])
+        # a second registration of the name is refused
+        status, _, body = self.request('POST', '/register', credentials)
+        self.assertEqual(status, 400)
+        self.assertEqual(json.loads(body)['message'], 'duplicate_username')
+
+        status, _, body = self.request('POST', '/login', {'username': 'test', 'password': 'Wrong123@@'})
+        self.assertEqual(status, 400)
+        status, _, body = self.request('POST', '/login', credentials)
+        self.assertEqual(status, 200)
+        self.assertTrue(json.loads(body)['login'])
+        self.assertIn('access_token_cookie', self.cookies)
+
+        # the first validation verifies the token, the second comes from memory
+        for _ in range(2):
+            status, _, body = self.request('GET', '/validate_token')
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body)['user']['username'], 'test')
+
+        csrf = self.cookies['csrf_refresh_token']
+        status, _, body = self.request('POST', '/refresh', headers=[('X-CSRF-TOKEN', csrf)])
+        self.assertEqual(status, 200)
+        self.assertTrue(json.loads(body)['refresh'])
+
+    def test_login_with_bytes_hash(self):
+        '''
+        Test that a hash flask_bcrypt stored as bytes logs in on the async path
+        '''
+        db.session.execute(User.__table__.insert(), {
+            'username': 'legacy', 'password_hash': bcrypt.hashpw(b'Password123@', bcrypt.gensalt(4))})
+        db.session.commit()
+        status, _, body = self.request('POST', '/login', {'username': 'legacy', 'password': 'Password123@'})
+        self.assertEqual(status, 200)
+        self.assertTrue(json.loads(body)['login'])
+
+    def test_validation_errors(self):
+        '''
+        Test that bad bodies and missing tokens get the same answers as the flask views
+        '''
+        status, _, body = self.request('POST', '/login', {'username': 'x'})
+        self.assertEqual(status, 400)
+        status, _, _ = self.request('GET', '/validate_token')
+        self.assertEqual(status, 401)
+
+    def test_other_routes_fall_back_to_flask(self):
+        '''
+        Test that routes without a native handler are served by the flask app
+        '''
+        status, headers, body = self.request('GET', '/home')
+        self.assertEqual(status, 200)
+        status, headers, body = self.request('GET', '/.well-known/jwks.json')
+        self.assertEqual(status, 200)
+        self.assertIn('keys', json.loads(body))
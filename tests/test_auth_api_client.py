@@ -57,6 +57,42 @@ class AuthClientTestCase(unittest.TestCase):
         # code should be positive i.e. 200
         self.assertEqual(response.status_code, 200)
 
+    def test_batch_registration(self):
+        '''
+        Test registering several users in one request
+        '''
+        # a user that already exists
+        self.client.post('/register',
+            content_type = 'application/json',
+            data = json.dumps({'username': 'taken', 'password': 'Password123@'}))
+
+        response = self.client.post('/register/batch',
+            content_type = 'application/json',
+            data = json.dumps([
+                {'username': 'taken', 'password': 'Password123@'},
+                {'username': 'first', 'password': 'Password123@'},
+                {'username': 'second', 'password': 'password'},
+                {'username': 'first', 'password': 'Password123@'},
+            ]))
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        # every user gets a result in the order they were sent
+        self.assertEqual([result['message'] for result in body['results']],
+            ['duplicate_username', 'User Created', 'Invalid Credentials', 'duplicate_username'])
+        self.assertEqual(body['created'], 1)
+
+        # the created user can log in
+        response_login = self.client.post('/login',
+            content_type = 'application/json',
+            data = json.dumps({'username': 'first', 'password': 'Password123@'}))
+        self.assertEqual(response_login.status_code, 200)
+
+        # anything but an array is a bad request
+        response = self.client.post('/register/batch',
+            content_type = 'application/json',
+            data = json.dumps({'username': 'first', 'password': 'Password123@'}))
+        self.assertEqual(response.status_code, 400)
+
     def test_user_registration_fail(self):
         '''
         Test bad user registration
@@ -352,7 +388,37 @@ class AuthClientTestCase(unittest.TestCase):
         '''
         /users endpoint test
         '''
-        pass
+        # register a few users
+        for username in ['carol', 'alice', 'bobby']:
+            response = self.client.post('/register',
+                content_type = 'application/json',
+                data = json.dumps({
+                    'username': username,
+                    'password': 'Password123@'
+                }))
+            self.assertEqual(response.status_code, 200)
+
+        # the first page holds the first two usernames and a cursor
+        first_page = self.client.get('/users?limit=2').get_json()
+        self.assertTrue(first_page['ok'])
+        self.assertEqual([user['username'] for user in first_page['data']], ['alice', 'bobby'])
+        self.assertIsNotNone(first_page['next'])
+
+        # following the cursor gives the rest and no further cursor
+        second_page = self.client.get('/users?limit=2&cursor=' + first_page['next']).get_json()
+        self.assertEqual([user['username'] for user in second_page['data']], ['carol'])
+        self.assertIsNone(second_page['next'])
+
+        # a cursor that was not issued by the api is refused
+        response = self.client.get('/users?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+        # asking for ndjson streams every user, one per line, in batches
+        self.app.config['USERS_EXPORT_BATCH_SIZE'] = 2
+        response = self.client.get('/users', headers = {'Accept': 'application/x-ndjson'})
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)['username'] for line in lines], ['alice', 'bobby', 'carol'])
 
 
 
@@ -0,0 +1,90 @@
+import unittest
+import time
+import json
+from jwtAuthenticator import create_app
+from jwtAuthenticator.cache import TTLCache, CredentialCache
+from jwtAuthenticator.models import db, credential_cache
+
+class TTLCacheTestCase(unittest.TestCase):
+
+    def test_entries_expire(self):
+        '''
+        Test that an entry is gone once its expiry time has passed
+        '''
+        cache = TTLCache(maxsize=4, ttl=60)
+        cache.set('live', 1)
+        cache.set('dead', 2, expires_at=time.time() - 1)
+        self.assertEqual(cache.get('live'), 1)
+        self.assertIsNone(cache.get('dead'))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_least_recently_used_is_evicted(self):
+        '''
+        Test that the cache never grows past maxsize
+        '''
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # touch a so that b is the least recently used entry
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+
+
+class CredentialCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        Create an app with the credential cache turned on
+        '''
+        self.app = create_app('testing')
+        self.app.config['CREDENTIAL_CACHE_ENABLED'] = True
+        self.cache = CredentialCache(self.app)
+
+    def test_remembered_password_is_verified(self):
+        '''
+        Test that only the remembered password for the same hash is a hit
+        '''
+        self.cache.remember('test', 'hash', 'Password123@')
+        self.assertTrue(self.cache.verify('test', 'hash', 'Password123@'))
+        self.assertFalse(self.cache.verify('test', 'hash', 'password123@'))
+        # the stored password hash changed, so the entry is stale
+        self.assertFalse(self.cache.verify('test', 'new-hash', 'Password123@'))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 2)
+
+    def test_invalidate(self):
+        '''
+        Test that an invalidated user has to go through bcrypt again
+        '''
+        self.cache.remember('test', 'hash', 'Password123@')
+        self.cache.invalidate('test')
+        self.assertFalse(self.cache.verify('test', 'hash', 'Password123@'))
+
+    def test_login_then_fresh_login_hits(self):
+        '''
+        Test that a fresh login right after a login skips bcrypt
+        '''
+        app = create_app('testing')
+        app.config['CREDENTIAL_CACHE_ENABLED'] = True
+        credential_cache.init_app(app)
+        with app.app_context():
+            db.create_all()
+            client = app.test_client()
+            credentials = json.dumps({'username': 'test', 'password': 'Password123@'})
+            try:
+                client.post('/register', content_type='application/json', data=credentials)
+                login = client.post('/login', content_type='application/json', data=credentials)
+                fresh = client.post('/fresh_login', content_type='application/json', data=credentials)
+            finally:
+                credential_cache.enabled = False
+                db.session.remove()
+                db.drop_all()
+        self.assertEqual(login.status_code, 200)
+        self.assertEqual(fresh.status_code, 200)
+        # the login missed and remembered, the fresh login hit
+        self.assertEqual(credential_cache.stats()['misses'], 1)
+        self.assertEqual(credential_cache.stats()['hits'], 1)
@@ -0,0 +1,79 @@
+import unittest
+import json
+import jwt as pyjwt
+from jwtAuthenticator import create_app
+from jwtAuthenticator.models import db, User
+from jwtAuthenticator.views.auth_api import jwt
+
+class CompactClaimsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        Create an app with testing config and compact claims, register a user and log in
+        '''
+        self.app = create_app('testing')
+        self.app.config['JWT_COMPACT_CLAIMS'] = True
+        # the claim names were already defaulted by the first init_app
+        self.app.config.pop('JWT_IDENTITY_CLAIM')
+        self.app.config.pop('JWT_USER_CLAIMS')
+        jwt.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client(use_cookies=True)
+        self.credentials = json.dumps({'username': 'test', 'password': 'Password123@'})
+        self.client.post('/register', content_type='application/json', data=self.credentials)
+
+    def tearDown(self):
+        jwt._additional_claims_callback = None
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def claims(self, cookie_name):
+        for cookie in self.client.cookie_jar:
+            if cookie.name == cookie_name:
+                return pyjwt.decode(cookie.value, verify=False)
+
+    def test_compact_access_token(self):
+        '''
+        Test that the access token carries the user id as sub and no redundant claims
+        '''
+        self.client.post('/login', content_type='application/json', data=self.credentials)
+        claims = self.claims('access_token_cookie')
+        user_id = User.query.filter_by(username='test').first().id
+        # a string, other JWT libraries refuse anything else in sub
+        self.assertEqual(claims['sub'], str(user_id))
+        self.assertTrue(claims['fresh'])
+        self.assertEqual(len(claims['jti']), 22)
+        for name in ('identity', 'nbf', 'type', 'user_claims'):
+            self.assertNotIn(name, claims)
+
+        response = self.client.get('/validate_token')
+        self.assertEqual(response.get_json()['user'], str(user_id))
+
+    def test_refresh(self):
+        '''
+        Test that a compact refresh token rotates and gives a token that is not fresh
+        '''
+        self.client.post('/login', content_type='application/json', data=self.credentials)
+        refresh = self.claims('refresh_token_cookie')
+        self.assertEqual(refresh['type'], 'refresh')
+        self.assertIn('fam', refresh['uc'])
+
+        csrf = [cookie.value for cookie in self.client.cookie_jar if cookie.name == 'csrf_refresh_token'][0]
+        response = self.client.post('/refresh', headers={'X-CSRF-TOKEN': csrf})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('fresh', self.claims('access_token_cookie'))
+        self.assertEqual(self.client.get('/validate_token').status_code, 200)
+        self.assertEqual(self.client.get('/validate_fresh_token').status_code, 401)
+
+    def test_additional_claims(self):
+        '''
+        Test that the additional claims hook adds claims but cannot replace sub
+        '''
+        jwt.additional_claims_loader(lambda identity: {'role': 'admin', 'sub': 'someone else'})
+        self.client.post('/login', content_type='application/json', data=self.credentials)
+        claims = self.claims('access_token_cookie')
+        self.assertEqual(claims['role'], 'admin')
+        self.assertEqual(claims['sub'], str(User.query.filter_by(username='test').first().id))
@@ -0,0 +1,42 @@
+import unittest
+import os
+import tempfile
+from sqlalchemy.pool import QueuePool, NullPool
+from jwtAuthenticator import create_app
+from jwtAuthenticator.models import db
+
+class EngineTuningTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app('testing')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.directory.name, 'test.sqlite')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.get_engine(self.app).dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def pragma(self, name):
+        return db.session.execute('PRAGMA %s' % name).scalar()
+
+    def test_sqlite_pragmas_on_connect(self):
+        '''
+        Test that every sqlite connection runs the configured pragmas
+        '''
+        self.assertIsInstance(db.engine.pool, QueuePool)
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        # NORMAL
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+
+    def test_defaults_when_turned_off(self):
+        '''
+        Test that no pool size and no pragmas keep the flask_sqlalchemy engine
+        '''
+        self.app.config.update(DATABASE_POOL_SIZE=0, SQLITE_PRAGMAS={})
+        self.assertIsInstance(db.engine.pool, NullPool)
+        self.assertEqual(self.pragma('journal_mode'), 'delete')
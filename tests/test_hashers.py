@@ -0,0 +1,94 @@
+import unittest
+import json
+import bcrypt
+from jwtAuthenticator import create_app
+from jwtAuthenticator.hashers import BcryptHasher, ScryptHasher, Argon2idHasher, identify, argon2
+from jwtAuthenticator.hashing import check_hash
+from jwtAuthenticator.models import db, hashing_pool, User
+
+class HashersTestCase(unittest.TestCase):
+
+    def test_scrypt(self):
+        '''
+        Test hashing, verifying and cost changes with scrypt
+        '''
+        hasher = ScryptHasher(log_n=10, r=8, p=1)
+        pw_hash = hasher.hash('Password123@')
+        self.assertTrue(pw_hash.startswith('$scrypt$ln=10,r=8,p=1$'))
+        self.assertIs(identify(pw_hash), ScryptHasher)
+        self.assertTrue(check_hash(pw_hash, 'Password123@'))
+        self.assertFalse(check_hash(pw_hash, 'Password123!'))
+        self.assertFalse(hasher.needs_update(pw_hash))
+        self.assertTrue(ScryptHasher(log_n=11).needs_update(pw_hash))
+
+    def test_identify(self):
+        '''
+        Test that the hasher is picked from the hash prefix
+        '''
+        self.assertIs(identify(BcryptHasher(4).hash('x')), BcryptHasher)
+        with self.assertRaises(ValueError):
+            identify('plain text')
+
+    @unittest.skipIf(argon2 is None, 'argon2-cffi is not installed')
+    def test_argon2id(self):
+        '''
+        Test hashing and verifying with argon2id
+        '''
+        hasher = Argon2idHasher(time_cost=1, memory_kib=1024)
+        pw_hash = hasher.hash('Password123@')
+        self.assertIs(identify(pw_hash), Argon2idHasher)
+        self.assertTrue(check_hash(pw_hash, 'Password123@'))
+        self.assertFalse(check_hash(pw_hash, 'wrong'))
+        self.assertTrue(Argon2idHasher(time_cost=2, memory_kib=1024).needs_update(pw_hash))
+
+
+class MigrateOnLoginTestCase(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        Create an app with testing config and a user hashed with bcrypt
+        '''
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client(use_cookies=True)
+        self.credentials = json.dumps({'username': 'test', 'password': 'Password123@'})
+        self.client.post('/register', content_type='application/json', data=self.credentials)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_bcrypt_user_moves_to_scrypt(self):
+        '''
+        Test that a login rehashes with the preferred hasher
+        '''
+        self.app.config.update(PASSWORD_HASHER='scrypt', SCRYPT_LOG_N=10)
+        hashing_pool.init_app(self.app)
+
+        response = self.client.post('/login', content_type='application/json', data=self.credentials)
+        self.assertEqual(response.status_code, 200)
+        db.session.expire_all()
+        pw_hash = User.query.filter_by(username='test').first().password_hash
+        self.assertTrue(pw_hash.startswith('$scrypt$ln=10,'))
+        # the migrated user can still log in
+        response = self.client.post('/login', content_type='application/json', data=self.credentials)
+        self.assertEqual(response.status_code, 200)
+
+    def test_bytes_hash_of_flask_bcrypt(self):
+        '''
+        Test that a user whose hash flask_bcrypt stored as bytes logs in and is rehashed
+        '''
+        db.session.execute(User.__table__.insert(), {
+            'username': 'legacy', 'password_hash': bcrypt.hashpw(b'Password123@', bcrypt.gensalt(4))})
+        db.session.commit()
+        self.app.config['BCRYPT_LOG_ROUNDS'] = 5
+        hashing_pool.init_app(self.app)
+
+        credentials = json.dumps({'username': 'legacy', 'password': 'Password123@'})
+        response = self.client.post('/login', content_type='application/json', data=credentials)
+        self.assertEqual(response.status_code, 200)
+        db.session.expire_all()
+        self.assertTrue(User.query.filter_by(username='legacy').first().password_hash.startswith('$2b$05$'))
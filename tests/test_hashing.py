@@ -0,0 +1,235 @@
+import os
+import unittest
+import json
+import time
+import tempfile
+from jwtAuthenticator import create_app
+from jwtAuthenticator.hashing import HashingPool, HashingPoolBusy, check_hash, calibrate_rounds, pinned_rounds, host_fingerprint
+from jwtAuthenticator.hashers import BcryptHasher
+from jwtAuthenticator.models import db, hashing_pool, User
+
+class HashingPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        Create an app with testing config and a pool running in processes
+        '''
+        self.app = create_app('testing')
+        self.app.config['PASSWORD_POOL_ENABLED'] = True
+        self.app.config['PASSWORD_POOL_WORKERS'] = 1
+        self.app.config['PASSWORD_POOL_QUEUE_SIZE'] = 0
+        self.app.config['PASSWORD_POOL_MAX_WAIT'] = 0.01
+        self.app.config['BCRYPT_LOG_ROUNDS'] = 4
+        self.pool = HashingPool(self.app)
+
+    def tearDown(self):
+        '''
+        Stop the pool processes
+        '''
+        self.pool.shutdown()
+
+    def test_generate_and_check(self):
+        '''
+        Test hashing and verifying a password through the pool
+        '''
+        pw_hash = self.pool.generate('human')
+        # the hash is produced with the configured cost
+        self.assertTrue(pw_hash.startswith('$2b$04$'))
+        self.assertTrue(self.pool.check(pw_hash, 'human'))
+        self.assertFalse(self.pool.check(pw_hash, 'robot'))
+
+    def test_generate_many_in_rounds(self):
+        '''
+        Test that a batch is hashed one password per pool process at a time
+        '''
+        # a single slot is enough, every round gives it back
+        hashes = self.pool.generate_many(['human', 'robot', 'alien'])
+        self.assertEqual([check_hash(pw_hash, 'robot') for pw_hash in hashes], [False, True, False])
+        self.assertTrue(self.pool._slots.acquire(timeout=0))
+        self.pool._slots.release()
+
+    def test_saturated_pool_raises(self):
+        '''
+        Test that a full pool refuses work instead of queueing it
+        '''
+        # take the only slot in the pool
+        self.assertTrue(self.pool._slots.acquire(timeout=0))
+        try:
+            with self.assertRaises(HashingPoolBusy):
+                self.pool.generate('human')
+        finally:
+            self.pool._slots.release()
+
+    def test_pool_size_shares_the_cores(self):
+        '''
+        Test that the server processes of a host split its cores between their pools
+        '''
+        self.app.config['PASSWORD_POOL_WORKERS'] = None
+        self.app.config['PASSWORD_POOL_QUEUE_SIZE'] = None
+        self.app.config['SERVER_PROCESSES'] = os.cpu_count() * 2
+        pool = HashingPool(self.app)
+        # never less than one hashing process, and a queue of its own
+        self.assertEqual(pool.workers, 1)
+        self.assertEqual(pool.queue_size, 2)
+        self.app.config['SERVER_PROCESSES'] = 1
+        self.assertEqual(HashingPool(self.app).workers, os.cpu_count())
+
+    def test_slots_belong_to_the_process(self):
+        '''
+        Test that a forked worker starts with its own free slots
+        '''
+        self.assertTrue(self.pool._slots.acquire(timeout=0))
+        try:
+            read_end, write_end = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                # the parent holds its only slot, the child has one of its own
+                os.write(write_end, b'1' if self.pool._slots.acquire(timeout=0) else b'0')
+                os._exit(0)
+            os.close(write_end)
+            with os.fdopen(read_end, 'rb') as handle:
+                acquired = handle.read()
+            os.waitpid(pid, 0)
+        finally:
+            self.pool._slots.release()
+        self.assertEqual(acquired, b'1')
+
+    def test_inline_when_disabled(self):
+        '''
+        Test that a pool that was never initialised hashes inline
+        '''
+        pool = HashingPool()
+        pool.hasher = BcryptHasher(rounds=4)
+        self.assertTrue(check_hash(pool.generate('human'), 'human'))
+
+    def test_busy_response(self):
+        '''
+        Test that a saturated pool turns into a 503 with Retry-After
+        '''
+        with self.app.app_context():
+            db.create_all()
+            client = self.app.test_client()
+            hashing_pool.enabled = True
+            # take every slot of the app pool so registration cannot hash
+            slots = 0
+            while hashing_pool._slots.acquire(timeout=0):
+                slots += 1
+            try:
+                response = client.post('/register',
+                    content_type = 'application/json',
+                    data = json.dumps({
+                        'username': 'test',
+                        'password': 'Password123@'
+                    }))
+            finally:
+                for _ in range(slots):
+                    hashing_pool._slots.release()
+                hashing_pool.enabled = False
+                db.session.remove()
+                db.drop_all()
+        # the request is refused quickly with a retry hint
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+
+class CostCalibrationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        Create an app with testing config and a user hashed at cost 4
+        '''
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client(use_cookies=True)
+        self.credentials = json.dumps({'username': 'test', 'password': 'Password123@'})
+        self.client.post('/register', content_type='application/json', data=self.credentials)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def stored_hash(self):
+        db.session.expire_all()
+        return User.query.filter_by(username='test').first().password_hash
+
+    def test_calibration_stays_in_bounds(self):
+        '''
+        Test that the calibrated cost respects the bounds and grows with the budget
+        '''
+        self.assertEqual(calibrate_rounds(0.001, minimum=4, maximum=6), 4)
+        self.assertEqual(calibrate_rounds(60000, minimum=4, maximum=6), 6)
+        self.app.config.update(BCRYPT_LOG_ROUNDS=None, BCRYPT_TARGET_MS=1, BCRYPT_MIN_ROUNDS=5, BCRYPT_MAX_ROUNDS=6)
+        hashing_pool.init_app(self.app)
+        self.assertEqual(hashing_pool.hasher.rounds, 5)
+        self.assertEqual(self.app.config['BCRYPT_LOG_ROUNDS'], 5)
+
+    def test_calibrated_cost_is_pinned(self):
+        '''
+        Test that the first process writes the calibrated cost and the next ones read it
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bcrypt_rounds')
+            self.app.config.update(BCRYPT_LOG_ROUNDS=None, BCRYPT_ROUNDS_FILE=path,
+                                   BCRYPT_TARGET_MS=1, BCRYPT_MIN_ROUNDS=5, BCRYPT_MAX_ROUNDS=6)
+            self.assertEqual(pinned_rounds(self.app.config), 5)
+            with open(path) as rounds_file:
+                self.assertEqual(json.load(rounds_file)['rounds'], 5)
+            # a slower budget elsewhere does not change the pinned cost
+            self.app.config['BCRYPT_TARGET_MS'] = 60000
+            self.assertEqual(pinned_rounds(self.app.config), 5)
+
+    def test_pinned_cost_of_another_host_is_recalibrated(self):
+        '''
+        Test that a file from another host, an old file or an old format is calibrated again
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bcrypt_rounds')
+            self.app.config.update(BCRYPT_LOG_ROUNDS=None, BCRYPT_ROUNDS_FILE=path,
+                                   BCRYPT_TARGET_MS=1, BCRYPT_MIN_ROUNDS=5, BCRYPT_MAX_ROUNDS=6)
+            pinned = [
+                {'rounds': 12, 'host': 'build-host', 'calibrated_at': time.time()},
+                {'rounds': 12, 'host': host_fingerprint(), 'calibrated_at': time.time() - 31 * 86400},
+                12,
+            ]
+            for content in pinned:
+                with open(path, 'w') as rounds_file:
+                    json.dump(content, rounds_file)
+                self.assertEqual(pinned_rounds(self.app.config), 5)
+            # the new file is of this host
+            with open(path) as rounds_file:
+                self.assertEqual(json.load(rounds_file)['host'], host_fingerprint())
+            # an expiry of 0 recalibrates on every start
+            self.app.config['BCRYPT_RECALIBRATE_DAYS'] = 0
+            with open(path, 'w') as rounds_file:
+                json.dump({'rounds': 12, 'host': host_fingerprint(), 'calibrated_at': time.time()}, rounds_file)
+            self.assertEqual(pinned_rounds(self.app.config), 5)
+
+    def test_higher_cost_is_left_alone(self):
+        '''
+        Test that only hashes below the current cost are upgraded
+        '''
+        hasher = BcryptHasher(5)
+        self.assertTrue(hasher.needs_update(BcryptHasher(4).hash('human')))
+        self.assertFalse(hasher.needs_update(BcryptHasher(5).hash('human')))
+        self.assertFalse(hasher.needs_update(BcryptHasher(6).hash('human')))
+
+    def test_rehash_on_login(self):
+        '''
+        Test that a login upgrades a hash made at an old cost, and only once
+        '''
+        self.assertTrue(self.stored_hash().startswith('$2b$04$'))
+        self.app.config['BCRYPT_LOG_ROUNDS'] = 5
+        hashing_pool.init_app(self.app)
+
+        response = self.client.post('/login', content_type='application/json', data=self.credentials)
+        self.assertEqual(response.status_code, 200)
+        upgraded = self.stored_hash()
+        self.assertTrue(upgraded.startswith('$2b$05$'))
+        self.assertTrue(check_hash(upgraded, 'Password123@'))
+
+        response = self.client.post('/login', content_type='application/json', data=self.credentials)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stored_hash(), upgraded)
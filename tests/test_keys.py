@@ -0,0 +1,171 @@
+import unittest
+import json
+import time
+import jwt as pyjwt
+try:
+    from cryptography.hazmat.primitives.asymmetric import rsa, ec
+    from cryptography.hazmat.primitives.serialization import (
+        Encoding, PrivateFormat, NoEncryption
+    )
+except ImportError:
+    rsa = None
+from jwtAuthenticator import create_app
+from jwtAuthenticator.keys import keyring, public_pem_from_private
+from jwtAuthenticator.models import db
+
+@unittest.skipIf(rsa is None, 'asymmetric keys need the cryptography package')
+class SigningKeysTestCase(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        Create an app with testing config and the tables
+        '''
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self):
+        '''
+        Drop the tables and go back to the symmetric testing keys
+        '''
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        keyring.init_app(create_app('testing'))
+
+    def use_key(self, algorithm, private_key):
+        # switch the app to an asymmetric algorithm
+        self.app.config['JWT_ALGORITHM'] = algorithm
+        self.app.config['JWT_PRIVATE_KEY'] = private_key.private_bytes(
+            Encoding.PEM, PrivateFormat.PKCS8, NoEncryption()).decode('utf-8')
+        self.app.config['JWT_PUBLIC_KEY'] = None
+        keyring.init_app(self.app)
+
+    def login(self):
+        credentials = json.dumps({'username': 'test', 'password': 'Password123@'})
+        self.client.post('/register', content_type='application/json', data=credentials)
+        self.client.post('/login', content_type='application/json', data=credentials)
+        for cookie in self.client.cookie_jar:
+            if cookie.name == 'access_token_cookie':
+                return cookie.value
+
+    def test_symmetric_jwks_is_empty(self):
+        '''
+        Test that a shared secret is never published
+        '''
+        response = self.client.get('/.well-known/jwks.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'keys': []})
+
+    def test_rs256_token_verifies_with_public_key(self):
+        '''
+        Test that an RS256 token carries the kid of the published key
+        '''
+        self.use_key('RS256', rsa.generate_private_key(public_exponent=65537, key_size=2048))
+        token = self.login()
+        jwks = self.client.get('/.well-known/jwks.json').get_json()
+        self.assertEqual(jwks['keys'][0]['kty'], 'RSA')
+        self.assertEqual(pyjwt.get_unverified_header(token)['kid'], jwks['keys'][0]['kid'])
+        # the token can be checked with the public key only
+        public_key = public_pem_from_private(self.app.config['JWT_PRIVATE_KEY'])
+        claims = pyjwt.decode(token, public_key, algorithms=['RS256'])
+        self.assertEqual(claims['identity'], {'username': 'test'})
+        # and this app still accepts its own token
+        self.assertEqual(self.client.get('/validate_token').status_code, 200)
+
+    def test_es256_jwks_and_cache_headers(self):
+        '''
+        Test the EC key document and its cache validators
+        '''
+        private_key = ec.generate_private_key(ec.SECP256R1())
+        self.use_key('ES256', private_key)
+        response = self.client.get('/.well-known/jwks.json')
+        key = response.get_json()['keys'][0]
+        self.assertEqual((key['kty'], key['crv'], key['alg']), ('EC', 'P-256', 'ES256'))
+        self.assertIn('max-age=3600', response.headers['Cache-Control'])
+        # a client with the current etag gets an empty 304
+        revalidated = self.client.get('/.well-known/jwks.json',
+            headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+
+
+class KeyRingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        Create an app whose keyring has a current key and a scheduled one
+        '''
+        self.app = create_app('testing')
+        self.app.config['JWT_KEYRING'] = [
+            {'kid': 'old', 'secret': 'old-secret', 'not_before': 0},
+            {'kid': 'new', 'secret': 'new-secret', 'not_before': '2999-01-01T00:00:00'},
+        ]
+        keyring.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self):
+        '''
+        Drop the tables and go back to the single testing key
+        '''
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        keyring.init_app(create_app('testing'))
+
+    def login(self):
+        credentials = json.dumps({'username': 'test', 'password': 'Password123@'})
+        self.client.post('/register', content_type='application/json', data=credentials)
+        self.client.post('/login', content_type='application/json', data=credentials)
+        for cookie in self.client.cookie_jar:
+            if cookie.name == 'access_token_cookie':
+                return cookie.value
+
+    def test_rotation_keeps_old_tokens_valid(self):
+        '''
+        Test that a scheduled key takes over signing without logging anybody out
+        '''
+        old_token = self.login()
+        self.assertEqual(pyjwt.get_unverified_header(old_token)['kid'], 'old')
+
+        # the scheduled key becomes current
+        self.app.config['JWT_KEYRING'][1]['not_before'] = time.time() - 1
+        keyring.init_app(self.app)
+        self.assertEqual(keyring.signing_key().kid, 'new')
+        self.assertEqual(self.client.get('/validate_token').status_code, 200)
+
+        new_token = self.login()
+        self.assertEqual(pyjwt.get_unverified_header(new_token)['kid'], 'new')
+        self.assertEqual(self.client.get('/validate_token').status_code, 200)
+
+    def test_retired_and_unknown_keys_are_refused(self):
+        '''
+        Test that tokens of retired or unknown keys do not verify
+        '''
+        self.app.config['JWT_KEYRING'][1]['not_before'] = 1
+        keyring.init_app(self.app)
+        # the old key stopped signing long before the longest token lifetime
+        with self.assertRaises(pyjwt.InvalidTokenError):
+            keyring.decode_key({'kid': 'old'})
+        with self.assertRaises(pyjwt.InvalidTokenError):
+            keyring.decode_key({'kid': 'missing'})
+        self.assertEqual(keyring.decode_key({'kid': 'new'}), 'new-secret')
+
+    def test_single_key_is_the_flask_jwt_extended_secret(self):
+        '''
+        Test that without a keyring tokens are signed and checked with the
+        secret flask_jwt_extended used before, so no one is logged out
+        '''
+        app = create_app('testing')
+        legacy = pyjwt.encode({'identity': {'username': 'test'}}, app.config['SECRET_KEY'], 'HS256')
+        keyring.init_app(app)
+        # tokens without a kid are checked against the only key
+        key = keyring.decode_key(pyjwt.get_unverified_header(legacy))
+        self.assertEqual(pyjwt.decode(legacy, key, algorithms=['HS256'])['identity'], {'username': 'test'})
+        app.config['JWT_SECRET_KEY'] = 'jwt-secret-key'
+        keyring.init_app(app)
+        self.assertEqual(keyring.decode_key({}), 'jwt-secret-key')
@@ -0,0 +1,85 @@
+import unittest
+import json
+import os
+import tempfile
+import subprocess
+import sys
+from jwtAuthenticator import create_app
+from jwtAuthenticator.models import db
+from jwtAuthenticator.metrics import metrics
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        Create an app with testing config, register a user and log in twice
+        '''
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client(use_cookies=True)
+        credentials = json.dumps({'username': 'test', 'password': 'Password123@'})
+        self.client.post('/register', content_type='application/json', data=credentials)
+        self.client.post('/login', content_type='application/json', data=credentials)
+        wrong = json.dumps({'username': 'test', 'password': 'Wrong123@@'})
+        self.client.post('/login', content_type='application/json', data=wrong)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_metrics_endpoint(self):
+        '''
+        Test that the request histograms, phases, outcomes and caches are exposed
+        '''
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        text = response.get_data(as_text=True)
+        self.assertIn('auth_request_duration_seconds_count{view="login"} 2', text)
+        self.assertIn('auth_requests_total{status="400",view="login"} 1', text)
+        self.assertIn('auth_phase_duration_seconds_count{phase="bcrypt"} 3', text)
+        self.assertIn('auth_phase_duration_seconds_bucket{phase="db",le="+Inf"}', text)
+        self.assertIn('auth_phase_duration_seconds_count{phase="jwt_sign"} 2', text)
+        self.assertIn('auth_phase_duration_seconds_count{phase="schema"} 3', text)
+        self.assertIn('auth_outcomes_total{outcome="invalid_credentials"} 1', text)
+        self.assertIn('auth_outcomes_total{outcome="user_created"} 1', text)
+        self.assertIn('auth_cache_entries{cache="tokens"}', text)
+        # the scrape itself is not counted
+        self.assertNotIn('view="metrics"', text)
+
+    def test_workers_are_added_up(self):
+        '''
+        Test that the snapshot files of all the workers are summed
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            metrics.directory = directory
+            metrics.flush()
+            # another worker's file, with the same numbers as this one
+            with open(os.path.join(directory, '%d.json' % os.getpid())) as handle:
+                snapshot = handle.read()
+            with open(os.path.join(directory, '1.json'), 'w') as handle:
+                handle.write(snapshot)
+            text = self.client.get('/metrics').get_data(as_text=True)
+            metrics.directory = None
+        self.assertIn('auth_request_duration_seconds_count{view="login"} 4', text)
+        self.assertIn('auth_outcomes_total{outcome="invalid_credentials"} 2', text)
+
+    def test_exited_workers_keep_counters_not_gauges(self):
+        '''
+        Test that the file of an exited worker adds its counters but not its gauges
+        '''
+        worker = subprocess.Popen([sys.executable, '-c', 'pass'])
+        worker.wait()
+        with tempfile.TemporaryDirectory() as directory:
+            metrics.directory = directory
+            snapshot = metrics.snapshot()
+            snapshot['gauges'] = [['auth_cache_entries', {'cache': 'tokens'}, 1000]]
+            with open(os.path.join(directory, '%d.json' % worker.pid), 'w') as handle:
+                json.dump(snapshot, handle)
+            totals = metrics.collect()
+            metrics.directory = None
+        self.assertLess(totals['gauges'][('auth_cache_entries', (('cache', 'tokens'),))], 1000)
+        self.assertEqual(totals['counters'][('auth_outcomes_total', (('outcome', 'invalid_credentials'),))], 2)
@@ -0,0 +1,105 @@
+import unittest
+import json
+import os
+import tempfile
+from jwtAuthenticator import create_app
+from jwtAuthenticator.models import db
+from jwtAuthenticator.ratelimit import SharedTokenBuckets, login_rate_limiter
+
+class SharedTokenBucketsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_burst_then_refuse(self):
+        '''
+        Test that a bucket allows its burst and then asks the caller to wait
+        '''
+        buckets = SharedTokenBuckets(self.path, slots=64)
+        for _ in range(3):
+            self.assertTrue(buckets.take('ip:1.2.3.4', 0.5, 3)[0])
+        allowed, wait = buckets.take('ip:1.2.3.4', 0.5, 3)
+        self.assertFalse(allowed)
+        self.assertGreater(wait, 0)
+        # other keys have their own bucket
+        self.assertTrue(buckets.take('ip:5.6.7.8', 0.5, 3)[0])
+
+    def test_buckets_are_shared_through_the_file(self):
+        '''
+        Test that two mappings of the same file, like two workers, share the buckets
+        '''
+        first = SharedTokenBuckets(self.path, slots=64)
+        second = SharedTokenBuckets(self.path, slots=64)
+        self.assertTrue(first.take('user:test', 0.01, 1)[0])
+        self.assertFalse(second.take('user:test', 0.01, 1)[0])
+
+    def test_full_neighbourhood_recycles_a_bucket(self):
+        '''
+        Test that a table with more keys than slots keeps working
+        '''
+        buckets = SharedTokenBuckets(self.path, slots=4)
+        for i in range(20):
+            self.assertTrue(buckets.take('ip:%d' % i, 1.0, 1)[0])
+
+
+class LoginRateLimitTestCase(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        Create an app with testing config and the limiter turned on
+        '''
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+        self.app = create_app('testing')
+        self.app.config.update(
+            RATE_LIMIT_ENABLED=True,
+            RATE_LIMIT_FILE=self.path,
+            RATE_LIMIT_IP_BURST=10,
+            RATE_LIMIT_USER_BURST=2,
+            RATE_LIMIT_USER_RATE=0.01
+        )
+        login_rate_limiter.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        login_rate_limiter.enabled = False
+        os.remove(self.path)
+
+    def test_login_attempts_per_username(self):
+        '''
+        Test that repeated logins for one username get a 429 with Retry-After
+        '''
+        credentials = json.dumps({'username': 'victim', 'password': 'Wrong123@@'})
+        for _ in range(2):
+            response = self.client.post('/login', content_type='application/json', data=credentials)
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post('/login', content_type='application/json', data=credentials)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+        # another username from the same IP is still allowed
+        other = json.dumps({'username': 'someone', 'password': 'Wrong123@@'})
+        response = self.client.post('/login', content_type='application/json', data=other)
+        self.assertEqual(response.status_code, 400)
+
+    def test_rate_must_be_positive(self):
+        '''
+        Test that a rate of 0 is refused when the limiter is set up, not on a login
+        '''
+        self.app.config['RATE_LIMIT_USER_RATE'] = 0
+        with self.assertRaises(RuntimeError):
+            login_rate_limiter.init_app(self.app)
+        with self.assertRaises(ValueError):
+            SharedTokenBuckets(self.path, slots=64).take('key', 0, 1)
+        # a disabled limiter does not care
+        self.app.config['RATE_LIMIT_ENABLED'] = False
+        login_rate_limiter.init_app(self.app)
@@ -0,0 +1,40 @@
+from tests import LoggedInTestCase
+from jwtAuthenticator.models import RefreshToken
+
+class RefreshRotationTestCase(LoggedInTestCase):
+
+    def refresh(self):
+        return self.client.post('/refresh', headers={'X-CSRF-TOKEN': self.get_cookie('csrf_refresh_token')})
+
+    def test_every_refresh_rotates_the_token(self):
+        '''
+        Test that each refresh hands out a new refresh token of the same family
+        '''
+        first = self.get_cookie('refresh_token_cookie')
+        self.assertEqual(self.refresh().status_code, 200)
+        second = self.get_cookie('refresh_token_cookie')
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.refresh().status_code, 200)
+        # three tokens of one family, two of them used
+        self.assertEqual(len({row.family for row in RefreshToken.query.all()}), 1)
+        self.assertEqual(RefreshToken.query.filter_by(used=True).count(), 2)
+
+    def test_replay_revokes_the_family(self):
+        '''
+        Test that reusing a refresh token burns every token of its family
+        '''
+        stolen = self.get_cookie('refresh_token_cookie')
+        csrf = self.get_cookie('csrf_refresh_token')
+        self.assertEqual(self.refresh().status_code, 200)
+        latest = self.get_cookie('refresh_token_cookie')
+        latest_csrf = self.get_cookie('csrf_refresh_token')
+
+        # the copied token is replayed
+        self.client.set_cookie('localhost', 'refresh_token_cookie', stolen, path='/refresh')
+        response = self.client.post('/refresh', headers={'X-CSRF-TOKEN': csrf})
+        self.assertEqual(response.status_code, 401)
+
+        # and the legitimate latest token is dead as well
+        self.client.set_cookie('localhost', 'refresh_token_cookie', latest, path='/refresh')
+        response = self.client.post('/refresh', headers={'X-CSRF-TOKEN': latest_csrf})
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,104 @@
+import unittest
+import json
+from unittest import mock
+from jwtAuthenticator import create_app
+from jwtAuthenticator.bloom import BloomFilter
+from jwtAuthenticator.models import db, User, hashing_pool
+from jwtAuthenticator.registration import register_user, username_filter
+
+class BloomFilterTestCase(unittest.TestCase):
+
+    def test_no_false_negatives(self):
+        '''
+        Test that everything added is reported as present
+        '''
+        bloom = BloomFilter(1000)
+        names = ['user%d' % i for i in range(1000)]
+        for name in names:
+            bloom.add(name)
+        self.assertTrue(all(name in bloom for name in names))
+        self.assertTrue(bloom.full)
+
+    def test_false_positive_rate(self):
+        '''
+        Test that the false positive rate stays close to the target
+        '''
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add('user%d' % i)
+        false_positives = sum('other%d' % i in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class RegistrationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        Create an app with testing config and the tables
+        '''
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        '''
+        Remove the session, drop the tables and pop the app context
+        '''
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_duplicate_never_hashes(self):
+        '''
+        Test that a taken username is rejected before bcrypt runs
+        '''
+        self.assertTrue(register_user('test', 'Password123@'))
+        with mock.patch.object(hashing_pool, 'generate') as generate:
+            self.assertFalse(register_user('test', 'Password123@'))
+            generate.assert_not_called()
+
+    def test_unique_index_has_the_last_word(self):
+        '''
+        Test a name taken behind the filter's back is caught by the unique index
+        '''
+        # a row the filter of this worker does not know about
+        username_filter.might_exist('warm-up')
+        db.session.execute(User.__table__.insert(), {'username': 'test', 'password_hash': 'x'})
+        db.session.commit()
+        self.assertFalse(username_filter.might_exist('test'))
+        self.assertFalse(register_user('test', 'Password123@'))
+        self.assertEqual(User.query.filter_by(username='test').count(), 1)
+        # the filter learned the name from the failed insert
+        self.assertTrue(username_filter.might_exist('test'))
+
+    def test_filter_learns_names_of_other_workers(self):
+        '''
+        Test that the filter picks up the users inserted elsewhere at its next sync
+        '''
+        username_filter.might_exist('warm-up')
+        db.session.execute(User.__table__.insert(), {'username': 'test', 'password_hash': 'x'})
+        db.session.commit()
+        self.assertFalse(username_filter.might_exist('test'))
+        # the sync is due, the duplicate is caught before bcrypt
+        username_filter._next_sync = 0.0
+        self.assertTrue(username_filter.might_exist('test'))
+        with mock.patch.object(hashing_pool, 'generate') as generate:
+            self.assertFalse(register_user('test', 'Password123@'))
+            generate.assert_not_called()
+
+    def test_batch_looks_up_names_the_filter_missed(self):
+        '''
+        Test that a batch never hashes or bulk inserts a name the filter has not seen
+        '''
+        username_filter.might_exist('warm-up')
+        db.session.execute(User.__table__.insert(), {'username': 'test', 'password_hash': 'x'})
+        db.session.commit()
+        users = [{'username': 'test', 'password': 'Password123@'}, {'username': 'other', 'password': 'Password123@'}]
+        with mock.patch.object(hashing_pool, 'generate_many', wraps=hashing_pool.generate_many) as generate_many:
+            response = self.app.test_client().post('/register/batch', content_type='application/json',
+                                                   data=json.dumps(users))
+        # only the free name was hashed
+        generate_many.assert_called_once_with(['Password123@'])
+        self.assertEqual(response.get_json()['created'], 1)
+        self.assertEqual(response.get_json()['results'][0]['message'], 'duplicate_username')
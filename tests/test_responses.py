@@ -0,0 +1,60 @@
+import unittest
+import json
+from jwtAuthenticator import create_app
+from jwtAuthenticator.responses import json_provider, json_response, constant_response, orjson
+
+class ResponsesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        Create an app with testing config and push a request context
+        '''
+        self.app = create_app('testing')
+        self.request_context = self.app.test_request_context()
+        self.request_context.push()
+
+    def tearDown(self):
+        self.request_context.pop()
+
+    def test_constant_response(self):
+        '''
+        Test that a fixed answer is a new response around the prebuilt body
+        '''
+        first = constant_response('forbidden')
+        second = constant_response('forbidden')
+        self.assertIsNot(first, second)
+        self.assertEqual(first.status_code, 403)
+        self.assertEqual(first.mimetype, 'application/json')
+        self.assertEqual(json.loads(first.get_data()), {'ok': False, 'message': 'forbidden'})
+        # headers set on one response do not leak into the next one
+        first.headers['Retry-After'] = '1'
+        self.assertNotIn('Retry-After', second.headers)
+
+    def test_json_response(self):
+        '''
+        Test that a response built by the provider matches jsonify
+        '''
+        response = json_response({'ok': True, 'user': {'username': 'test'}}, 201)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.get_json(), {'ok': True, 'user': {'username': 'test'}})
+
+    def test_provider_choice(self):
+        '''
+        Test that auto falls back to the json module without orjson
+        '''
+        self.assertEqual(json_provider.name, 'json' if orjson is None else 'orjson')
+        self.app.config['JSON_PROVIDER'] = 'json'
+        json_provider.init_app(self.app)
+        self.assertEqual(json_provider.name, 'json')
+        self.app.config['JSON_PROVIDER'] = 'yaml'
+        with self.assertRaises(RuntimeError):
+            json_provider.init_app(self.app)
+
+    def test_token_errors(self):
+        '''
+        Test that the token errors keep the flask_jwt_extended bodies
+        '''
+        client = self.app.test_client()
+        response = client.get('/validate_token')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('msg', response.get_json())
@@ -0,0 +1,85 @@
+import time
+from sqlalchemy import event
+from tests import LoggedInTestCase
+from jwtAuthenticator.models import db, RevokedToken, sweep_expired
+from jwtAuthenticator.revocation import Denylist, denylist
+
+class DenylistTestCase(LoggedInTestCase):
+
+    def test_logout_revokes_the_token(self):
+        '''
+        Test that a copy of the access token stops working after logout
+        '''
+        access_token = self.get_cookie('access_token_cookie')
+        # validate once so the token is in the token cache too
+        self.assertEqual(self.client.get('/validate_token').status_code, 200)
+        self.client.post('/logout')
+        # replay the copied token
+        self.client.set_cookie('localhost', 'access_token_cookie', access_token)
+        self.assertEqual(self.client.get('/validate_token').status_code, 401)
+
+    def test_other_workers_pick_up_revocations(self):
+        '''
+        Test that a second worker sees a revocation after its next sync
+        '''
+        other_worker = Denylist(self.app)
+        self.assertFalse(other_worker.is_revoked('some-jti'))
+        denylist.revoke('some-jti', time.time() + 60)
+        # the other worker syncs again once its interval has passed
+        other_worker._next_sync = 0
+        self.assertTrue(other_worker.is_revoked('some-jti'))
+        # a worker starting now finds it through its bloom filter
+        self.assertTrue(Denylist(self.app).is_revoked('some-jti'))
+
+    def test_logout_burns_the_refresh_family(self):
+        '''
+        Test that a logout with only the access cookie, which is all a
+        browser sends outside /refresh, stops the refresh token too
+        '''
+        access = self.get_cookie('access_token_cookie')
+        refresh = self.get_cookie('refresh_token_cookie')
+        csrf = self.get_cookie('csrf_refresh_token')
+        browser = self.app.test_client()
+        browser.set_cookie('localhost', 'access_token_cookie', access)
+        self.assertEqual(browser.post('/logout').status_code, 200)
+
+        # the refresh token, sent on its own path, no longer refreshes
+        browser = self.app.test_client()
+        browser.set_cookie('localhost', 'refresh_token_cookie', refresh)
+        response = browser.post('/refresh', headers={'X-CSRF-TOKEN': csrf})
+        self.assertEqual(response.status_code, 401)
+
+    def test_fresh_login_stays_in_the_family(self):
+        '''
+        Test that the access token of a fresh login still burns the session's family on logout
+        '''
+        refresh = self.get_cookie('refresh_token_cookie')
+        csrf = self.get_cookie('csrf_refresh_token')
+        self.client.post('/fresh_login', content_type='application/json', data=self.credentials)
+        browser = self.app.test_client()
+        browser.set_cookie('localhost', 'access_token_cookie', self.get_cookie('access_token_cookie'))
+        browser.post('/logout')
+        browser.set_cookie('localhost', 'refresh_token_cookie', refresh)
+        self.assertEqual(browser.post('/refresh', headers={'X-CSRF-TOKEN': csrf}).status_code, 401)
+
+    def test_expired_entries_are_swept(self):
+        '''
+        Test that revocations of expired tokens are deleted in batches
+        '''
+        now = int(time.time())
+        for i in range(5):
+            db.session.add(RevokedToken(jti='old-%d' % i, expires_at=now - 1, revoked_at=now))
+        db.session.add(RevokedToken(jti='live', expires_at=now + 60, revoked_at=now))
+        db.session.commit()
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            self.assertEqual(sweep_expired(RevokedToken.expires_at, now, batch_size=2), 5)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual([row.jti for row in RevokedToken.query.all()], ['live'])
+        # the deletes name their keys, MySQL refuses LIMIT in an IN subquery
+        deletes = [statement for statement in statements if statement.startswith('DELETE')]
+        self.assertEqual(len(deletes), 3)
+        self.assertFalse(any('SELECT' in statement for statement in deletes))
@@ -0,0 +1,35 @@
+import unittest
+from jsonschema.exceptions import SchemaError
+from jwtAuthenticator.schemas.registry import SchemaRegistry
+from jwtAuthenticator.schemas.schema_user import validate_user
+
+class SchemaRegistryTestCase(unittest.TestCase):
+
+    def test_invalid_schema_fails_on_register(self):
+        '''
+        Test that a broken schema is rejected once, when it is registered
+        '''
+        registry = SchemaRegistry()
+        with self.assertRaises(SchemaError):
+            registry.register('broken', {'type': 'not-a-type'})
+
+    def test_precompiled_pattern(self):
+        '''
+        Test that the pattern keyword uses the compiled regex
+        '''
+        registry = SchemaRegistry()
+        registry.register('name', {'type': 'string', 'pattern': '^[a-z]+$'})
+        self.assertTrue(registry.is_valid('name', 'abc'))
+        self.assertFalse(registry.is_valid('name', 'ABC'))
+        # a pattern does not apply to non strings
+        self.assertFalse(registry.is_valid('name', 3))
+
+    def test_validate_user(self):
+        '''
+        Test the user validation keeps its result format
+        '''
+        valid = validate_user({'username': 'test', 'password': 'Password123@'})
+        self.assertTrue(valid['ok'])
+        invalid = validate_user({'username': 'test', 'password': 'password'})
+        self.assertFalse(invalid['ok'])
+        self.assertEqual(invalid['error'], 'validation')
@@ -0,0 +1,136 @@
+import json
+from werkzeug.test import EnvironBuilder
+from tests import LoggedInTestCase
+from jwtAuthenticator.token_cache import token_cache
+from jwtAuthenticator.revocation import denylist
+
+class TokenCacheTestCase(LoggedInTestCase):
+
+    def test_repeat_validation_hits_cache(self):
+        '''
+        Test that the second validation of a token is answered from the cache
+        '''
+        first = self.client.get('/validate_token')
+        second = self.client.get('/validate_token')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.get_json(), second.get_json())
+        self.assertEqual(token_cache.stats()['hits'], 1)
+
+    def test_cached_token_still_needs_csrf(self):
+        '''
+        Test that a cached token is refused on a POST without the csrf header
+        '''
+        self.client.get('/validate_token')
+        response = self.client.post('/validate_token')
+        self.assertEqual(response.status_code, 401)
+
+    def test_cached_token_freshness(self):
+        '''
+        Test that a refreshed (not fresh) token is refused from the cache too
+        '''
+        csrf = self.get_cookie('csrf_refresh_token')
+        self.client.post('/refresh', headers={'X-CSRF-TOKEN': csrf})
+        # the first call caches the token, the second is answered from the cache
+        self.assertEqual(self.client.get('/validate_token').status_code, 200)
+        self.assertEqual(self.client.get('/validate_fresh_token').status_code, 401)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+
+    def test_logout_clears_entry(self):
+        '''
+        Test that logging out removes the token from the cache
+        '''
+        self.client.get('/validate_token')
+        self.assertEqual(token_cache.stats()['size'], 1)
+        self.client.post('/logout')
+        self.assertEqual(token_cache.stats()['size'], 0)
+
+    def test_batch_validation(self):
+        '''
+        Test validating a batch of tokens, the first sighting is cached too
+        '''
+        access = self.get_cookie('access_token_cookie')
+        refresh = self.get_cookie('refresh_token_cookie')
+        response = self.client.post('/validate_token/batch',
+            content_type='application/json',
+            data=json.dumps([access, refresh, 'garbage', 42]))
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()['results']
+        self.assertEqual([result['is_valid'] for result in results], [True, False, False, False])
+        self.assertEqual(results[0]['user'], {'username': 'test'})
+        self.assertTrue(results[0]['fresh'])
+        self.assertIn('expires_at', results[0])
+        self.assertEqual(results[1]['message'], 'Only access tokens are allowed')
+
+        # the second time the token is answered from the cache
+        response = self.client.post('/validate_token/batch',
+            content_type='application/json', data=json.dumps([access]))
+        self.assertTrue(response.get_json()['results'][0]['is_valid'])
+        self.assertEqual(token_cache.stats()['hits'], 1)
+
+        denylist.revoke_token(access)
+        response = self.client.post('/validate_token/batch',
+            content_type='application/json', data=json.dumps([access]))
+        self.assertEqual(response.get_json()['results'][0]['message'], 'Token has been revoked')
+
+    def test_batch_validation_limits(self):
+        '''
+        Test that a batch must be a json array within VALIDATE_BATCH_MAX
+        '''
+        self.app.config['VALIDATE_BATCH_MAX'] = 2
+        response = self.client.post('/validate_token/batch',
+            content_type='application/json', data=json.dumps(['a', 'b', 'c']))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/validate_token/batch',
+            content_type='application/json', data=json.dumps({'tokens': []}))
+        self.assertEqual(response.status_code, 400)
+
+    def test_auth_request(self):
+        '''
+        Test the header only answers for nginx auth_request
+        '''
+        response = self.client.get('/auth_request')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response.get_data(), b'')
+        self.assertEqual(response.headers['X-Auth-User'], '{"username":"test"}')
+        self.assertEqual(response.headers['X-Auth-Fresh'], 'true')
+        self.assertIn('X-Auth-Expires', response.headers)
+        self.assertEqual(response.cache_control.max_age, self.app.config['AUTH_REQUEST_MAX_AGE'])
+
+        # a cookie token needs the csrf header on a POST, a bearer token does not
+        self.assertEqual(self.client.post('/auth_request').status_code, 401)
+        access = self.get_cookie('access_token_cookie')
+        client = self.app.test_client()
+        response = client.post('/auth_request', headers={'Authorization': 'Bearer ' + access})
+        self.assertEqual(response.status_code, 204)
+
+        response = client.get('/auth_request')
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(response.cache_control.no_store)
+
+    def test_auth_request_options_needs_a_token(self):
+        '''
+        Test that an OPTIONS request is checked like any other method
+        '''
+        response = self.app.test_client().open('/auth_request', method='OPTIONS')
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn('Allow', response.headers)
+        response = self.client.open('/auth_request', method='OPTIONS')
+        self.assertEqual(response.status_code, 204)
+
+    def test_auth_request_has_no_content_type(self):
+        '''
+        Test that the empty answers go out without a content type
+        '''
+        sent = {}
+
+        def start_response(status, headers):
+            sent[status[:3]] = dict(headers)
+
+        # the test client adds a default content type back, ask the app itself
+        for cookie in ('', 'access_token_cookie=' + self.get_cookie('access_token_cookie')):
+            environ = EnvironBuilder(path='/auth_request', headers={'Cookie': cookie}).get_environ()
+            b''.join(self.app(environ, start_response))
+        self.assertEqual(set(sent), {'204', '401'})
+        for headers in sent.values():
+            self.assertNotIn('Content-Type', headers)
@@ -0,0 +1,48 @@
+from tests import LoggedInTestCase
+from jwtAuthenticator.models import db, User, rehash_password
+from jwtAuthenticator.user_cache import user_cache
+
+class UserCacheTestCase(LoggedInTestCase):
+
+    def user(self):
+        return User.query.filter_by(username='test').first()
+
+    def test_user_loaded_once(self):
+        '''
+        Test that repeat validations read the user from the cache
+        '''
+        for _ in range(3):
+            self.assertEqual(self.client.get('/validate_token').status_code, 200)
+        self.assertEqual(user_cache.stats(), {'hits': 2, 'misses': 1, 'size': 1})
+
+    def test_deleted_user_is_refused(self):
+        '''
+        Test that the tokens of a deleted user stop working at once
+        '''
+        self.assertEqual(self.client.get('/validate_token').status_code, 200)
+        db.session.delete(self.user())
+        db.session.commit()
+        response = self.client.get('/validate_token')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.get_json(), {'msg': 'User not found'})
+
+    def test_renamed_user_is_forgotten(self):
+        '''
+        Test that renaming a user drops the entry of the old name
+        '''
+        self.assertEqual(self.client.get('/validate_token').status_code, 200)
+        user = self.user()
+        user.username = 'renamed'
+        db.session.commit()
+        self.assertEqual(self.client.get('/validate_token').status_code, 401)
+
+    def test_bulk_updates(self):
+        '''
+        Test that a query update of usernames clears the cache, and a new hash does not
+        '''
+        self.client.get('/validate_token')
+        rehash_password('test', self.user().password_hash, 'new hash')
+        self.assertEqual(user_cache.stats()['size'], 1)
+        User.query.filter_by(username='test').update({'username': 'renamed'}, synchronize_session=False)
+        db.session.commit()
+        self.assertEqual(user_cache.stats()['size'], 0)
@@ -1,6 +1,27 @@
-from jwtAuthenticator import create_app
+import gc
 
+from jwtAuthenticator import create_app, after_fork, after_fork_on_first_request
+
+# build the app once, in the uwsgi master, before the workers are forked
 app = create_app()
 
+
+def _after_fork():
+    after_fork(app)
+
+
+try:
+    from uwsgidecorators import postfork
+    postfork(_after_fork)
+except ImportError:
+    # gunicorn --preload and anything else that forks the workers: they
+    # reset on their first request (an os.register_at_fork hook would also
+    # run in every process the hashing pool forks)
+    after_fork_on_first_request(app)
+
+# keep the objects created so far out of the collector, so a collection in a
+# worker does not touch (and copy) the pages it shares with the master
+gc.freeze()
+
 if __name__ == "__main__":
     app.run()